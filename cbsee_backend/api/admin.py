@@ -5,3 +5,5 @@ admin.site.register(models.Teacher)
 admin.site.register(models.Student)
 admin.site.register(models.ObjectRecognized)
 admin.site.register(models.Object)
+admin.site.register(models.StudentDailyRollup)
+admin.site.register(models.ClassHourlyRollup)
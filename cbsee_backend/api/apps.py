@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Importing these modules registers their signal receivers.
+        from . import catalog, conditional, dashboard, db, events, identity, rollups  # noqa: F401
+        from . import recognition_buffer
+        recognition_buffer.install()
@@ -0,0 +1,114 @@
+import gzip
+import json
+import os
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+
+
+class RecognitionArchive:
+    """
+    Append-only store of archived ObjectRecognized rows.
+
+    Each archived batch is a gzip-compressed NDJSON file; ``index.jsonl``
+    lists every file with its ID and timestamp range so readers can skip
+    files outside a requested period. Records carry the object name and
+    category so they stay meaningful if the Object row changes later.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.RECOGNITION_ARCHIVE_DIR)
+        self.index_path = self.root / 'index.jsonl'
+        self.pending_path = self.root / 'pending.json'
+
+    def write_batch(self, records):
+        """Writes one batch durably. Returns its index entry (not yet indexed)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        first, last = records[0], records[-1]
+        month = first['timestamp'][:7] if first['timestamp'] else 'undated'
+        path = self.root / month / f"recognitions-{first['id']}-{last['id']}.ndjson.gz"
+        path.parent.mkdir(exist_ok=True)
+
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+
+        timestamps = [r['timestamp'] for r in records if r['timestamp']]
+        entry = {
+            'file': str(path.relative_to(self.root)),
+            'first_id': first['id'],
+            'last_id': last['id'],
+            'start': min(timestamps) if timestamps else None,
+            'end': max(timestamps) if timestamps else None,
+            'count': len(records),
+        }
+        return entry
+
+    def add_to_index(self, entry):
+        if any(e['file'] == entry['file'] for e in self.entries()):
+            return
+        with open(self.index_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self):
+        if not self.index_path.exists():
+            return []
+        with open(self.index_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def read_file(self, entry):
+        with gzip.open(self.root / entry['file'], 'rt') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def iter_records(self, student_ids=None, start=None, end=None):
+        """
+        Yields archived records in ID order, optionally limited to a set of
+        students and to timestamps in [start, end) (aware datetimes).
+        """
+        start_iso = format_timestamp(start)
+        end_iso = format_timestamp(end)
+        for entry in sorted(self.entries(), key=lambda e: e['first_id']):
+            if start_iso and entry['end'] and entry['end'] < start_iso:
+                continue
+            if end_iso and entry['start'] and entry['start'] >= end_iso:
+                continue
+            for record in self.read_file(entry):
+                if student_ids is not None and record['student_id'] not in student_ids:
+                    continue
+                if start_iso and (not record['timestamp'] or record['timestamp'] < start_iso):
+                    continue
+                if end_iso and (not record['timestamp'] or record['timestamp'] >= end_iso):
+                    continue
+                yield record
+
+    # A batch is marked pending between being written and being deleted from
+    # the database, so an interrupted run can finish the delete on restart.
+
+    def mark_pending(self, entry):
+        with open(self.pending_path, 'w') as f:
+            json.dump(entry, f)
+
+    def pending(self):
+        if not self.pending_path.exists():
+            return None
+        with open(self.pending_path) as f:
+            return json.load(f)
+
+    def clear_pending(self):
+        self.pending_path.unlink(missing_ok=True)
+
+
+def format_timestamp(value):
+    """UTC, fixed-width ISO 8601, so stored timestamps compare as strings."""
+    if value is None:
+        return None
+    return value.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
@@ -0,0 +1,99 @@
+import logging
+import threading
+from collections import namedtuple
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Object
+
+logger = logging.getLogger(__name__)
+
+CatalogEntry = namedtuple('CatalogEntry', ['ObjectID', 'ObjectName', 'ObjectDescription', 'ObjectCategory'])
+
+
+def _default_fields(name):
+    return {'ObjectDescription': f'This is a {name}.', 'ObjectCategory': 'General'}
+
+
+def _class_names():
+    """
+    Class names of the loaded classifier, if any. Doesn't load it:
+    get_classifier() invalidates the catalog after loading, so it is
+    reconciled again then.
+    """
+    from .ml_inference import loaded_classifier
+    classifier = loaded_classifier()
+    return classifier.class_names if classifier is not None else []
+
+
+class ObjectCatalog:
+    """
+    Process-wide map of class name -> Object row.
+
+    The catalog is reconciled against the classifier's class list the first
+    time it is used: every class gets an Object row, missing ones are created
+    with a single bulk_create. After that, lookups are plain dict reads. It is
+    rebuilt when an Object is saved or deleted, or when a classifier is
+    loaded.
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        entries = self._entries
+        if entries is None:
+            entries = self.load()
+        entry = entries.get(name)
+        if entry is None:
+            # Not one of the model's classes; store it like before and remember it.
+            obj, _ = Object.objects.get_or_create(ObjectName=name, defaults=_default_fields(name))
+            entry = CatalogEntry(obj.ObjectID, obj.ObjectName, obj.ObjectDescription, obj.ObjectCategory)
+            with self._lock:
+                if self._entries is entries:
+                    entries[name] = entry
+                    self._by_id[entry.ObjectID] = entry
+        return entry
+
+    def by_id(self, object_id):
+        if self._entries is None:
+            self.load()
+        entry = self._by_id.get(object_id)
+        if entry is None:
+            obj = Object.objects.filter(ObjectID=object_id).first()
+            if obj is not None:
+                entry = CatalogEntry(obj.ObjectID, obj.ObjectName, obj.ObjectDescription, obj.ObjectCategory)
+        return entry
+
+    def load(self):
+        class_names = _class_names()
+        with self._lock:
+            entries = {}
+            # Lowest ID wins if a name was stored more than once.
+            for obj in Object.objects.order_by('-ObjectID'):
+                entries[obj.ObjectName] = CatalogEntry(obj.ObjectID, obj.ObjectName, obj.ObjectDescription, obj.ObjectCategory)
+            missing = [name for name in dict.fromkeys(class_names) if name not in entries]
+            if missing:
+                created = Object.objects.bulk_create([Object(ObjectName=name, **_default_fields(name)) for name in missing])
+                for obj in created:
+                    entries[obj.ObjectName] = CatalogEntry(obj.ObjectID, obj.ObjectName, obj.ObjectDescription, obj.ObjectCategory)
+                logger.info(f"✅ Created {len(created)} missing Object rows: {missing}")
+            self._entries = entries
+            self._by_id = {entry.ObjectID: entry for entry in entries.values()}
+        return entries
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+
+
+object_catalog = ObjectCatalog()
+
+
+@receiver([post_save, post_delete], sender=Object)
+def _object_changed(sender, **kwargs):
+    object_catalog.invalidate()
+
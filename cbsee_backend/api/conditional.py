@@ -0,0 +1,99 @@
+import hashlib
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+from .models import Object, ObjectRecognized, Student
+
+OBJECTS_MARKER = 'conditional:objects'
+
+
+def _student_marker_key(student_id):
+    return f'conditional:student:{student_id}'
+
+
+def _marker(key):
+    """
+    A random token replaced whenever the rows behind `key` change. Like the
+    dashboard cache, it needs a shared cache backend when several worker
+    processes serve requests.
+    """
+    marker = cache.get(key)
+    if marker is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        marker = cache.get(key)
+    return marker
+
+
+def _bump(key):
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def discovery_version(student_id, since=None):
+    """
+    ETag for everything derived from a student's discoveries.
+
+    One aggregate over the (Student, Timestamp) index gives the newest ID
+    and the row count; ``since`` additionally counts rows after that moment,
+    for responses with a rolling window. Markers for the student's profile
+    and the Object table cover renames and recategorizations, which change
+    the responses without touching any discovery.
+
+    There is deliberately no Last-Modified: deleting (archiving) old rows,
+    a rolling window moving on, or an edited name all change a response
+    without a newer timestamp, so If-Modified-Since would answer 304 wrongly.
+    """
+    aggregates = {'last_id': Max('ID'), 'count': Count('ID')}
+    if since is not None:
+        aggregates['recent'] = Count('ID', filter=Q(Timestamp__gte=since))
+    version = ObjectRecognized.objects.filter(Student_id=student_id).aggregate(**aggregates)
+    raw = (f"{student_id}:{version['last_id']}:{version['count']}:{version.get('recent')}:"
+           f"{_marker(_student_marker_key(student_id))}:{_marker(OBJECTS_MARKER)}")
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest()[:20])
+
+
+def conditional_on(version_func):
+    """
+    Answers If-None-Match with 304 Not Modified.
+
+    ``version_func(request, *args, **kwargs)`` returns the ETag, or None to
+    skip validation (e.g. for an unauthenticated request). The view only
+    runs when the client's copy is stale.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = None
+            if request.method in ('GET', 'HEAD'):
+                etag = version_func(request, *args, **kwargs)
+            if etag is None:
+                return view(request, *args, **kwargs)
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers['ETag'] = etag
+            # Responses depend on who is asking; let only the client cache them.
+            response.headers['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ('Authorization',))
+            return response
+        return wrapper
+    return decorator
+
+
+@receiver([post_save, post_delete], sender=Student)
+def _student_changed(sender, instance, **kwargs):
+    _bump(_student_marker_key(instance.StudentID))
+
+
+@receiver([post_save, post_delete], sender=Object)
+def _object_changed(sender, **kwargs):
+    _bump(OBJECTS_MARKER)
@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Student, Teacher
+from .signals import recognitions_recorded
+
+
+def _key(teacher_id):
+    return f'dashboard:{teacher_id}'
+
+
+def build_dashboard(teacher_id):
+    """
+    Queries the data behind a teacher's dashboard.
+
+    Relative strings ("Today", "3 days ago") are not stored; render_dashboard
+    derives them from the raw timestamps, so a cached entry stays correct as
+    time passes.
+    """
+    teacher = Teacher.objects.get(TeacherID=teacher_id)
+    today = timezone.now().date()
+    students = Student.objects.filter(Teacher_id=teacher_id).annotate(
+        objects_today=Count('recognized_objects', filter=Q(recognized_objects__Timestamp__date=today)),
+        last_seen=Max('recognized_objects__Timestamp'),
+    )
+    return {
+        'name': teacher.Name,
+        'date': today,
+        'students': [
+            {'StudentID': s.StudentID, 'Name': s.Name, 'GradeLevel': s.GradeLevel,
+             'objects_today': s.objects_today, 'last_seen': s.last_seen}
+            for s in students
+        ],
+    }
+
+
+def render_dashboard(data, now=None):
+    now = now or timezone.now()
+    student_list = []
+    for student in data['students']:
+        # Any new discovery drops the cached entry, so an entry built on an
+        # earlier day means nobody has found anything since midnight.
+        objects_today = student['objects_today'] if data['date'] == now.date() else 0
+        last_active_str = "Never"
+        if student['last_seen']:
+            diff = now - student['last_seen']
+            if diff.days == 0: last_active_str = "Today"
+            elif diff.days == 1: last_active_str = "Yesterday"
+            else: last_active_str = f"{diff.days} days ago"
+        student_list.append({'StudentID': student['StudentID'], 'Name': student['Name'], 'GradeLevel': student['GradeLevel'],
+                             'objectsFound': objects_today, 'lastActive': last_active_str})
+    return {'students': student_list, 'name': data['name']}
+
+
+def get_dashboard(teacher_id):
+    data = cache.get(_key(teacher_id))
+    if data is None:
+        data = build_dashboard(teacher_id)
+        cache.set(_key(teacher_id), data, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+    return render_dashboard(data)
+
+
+def invalidate_dashboards(*teacher_ids):
+    cache.delete_many([_key(teacher_id) for teacher_id in teacher_ids if teacher_id])
+
+
+@receiver(recognitions_recorded)
+def _recognitions_recorded(sender, recognitions, **kwargs):
+    student_ids = {rec.Student_id for rec in recognitions}
+
+    def invalidate():
+        invalidate_dashboards(*Student.objects.filter(StudentID__in=student_ids).values_list('Teacher_id', flat=True).distinct())
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Student)
+def _student_changed(sender, instance, **kwargs):
+    invalidate_dashboards(instance.Teacher_id)
+
+
+@receiver([post_save, post_delete], sender=Teacher)
+def _teacher_changed(sender, instance, **kwargs):
+    invalidate_dashboards(instance.TeacherID)
@@ -0,0 +1,252 @@
+"""
+Nearest-neighbour search over the classifier's image embeddings.
+
+An embedding is the model's pooled feature vector (960 values for
+MobileNetV3-Large), L2-normalized and stored as float16, so cosine
+similarity is a dot product. Two indexes use it:
+
+- ReferenceIndex: embeddings of labelled reference images per class, built
+  by `manage.py build_reference_index`. The classifier answers Unknown when
+  an image isn't close enough to the references of the class it predicts,
+  which separates unfamiliar objects better than the softmax confidence.
+- DiscoveryIndex: each student's discoveries, for "similar discoveries".
+  Vectors live in DiscoveryEmbedding rows and are cached per student, so a
+  search only scans that student's discoveries.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .models import DiscoveryEmbedding
+
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 at a time while scoring.
+SEARCH_CHUNK = 8192
+
+
+def normalize(vectors):
+    """L2-normalized float16 copy of one vector or a (n, dim) array."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float16)
+
+
+def to_bytes(vector):
+    return normalize(vector).tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype=np.float16)
+
+
+class EmbeddingIndex:
+    """
+    Growable float16 matrix of normalized vectors with an int64 key per row.
+    search() scores every row with one matrix-vector product per chunk.
+    """
+
+    def __init__(self, dim, capacity=256):
+        self.dim = dim
+        self._vectors = np.empty((capacity, dim), dtype=np.float16)
+        self._keys = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def keys(self):
+        return self._keys[:self.size]
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.size]
+
+    @property
+    def nbytes(self):
+        return self.size * (self.dim * 2 + 8)
+
+    def add(self, keys, vectors):
+        vectors = normalize(np.asarray(vectors).reshape(-1, self.dim))
+        needed = self.size + len(vectors)
+        if needed > len(self._keys):
+            capacity = max(needed, 2 * len(self._keys))
+            self._vectors = np.concatenate([self._vectors[:self.size], np.empty((capacity - self.size, self.dim), np.float16)])
+            self._keys = np.concatenate([self._keys[:self.size], np.empty(capacity - self.size, np.int64)])
+        self._vectors[self.size:needed] = vectors
+        self._keys[self.size:needed] = keys
+        self.size = needed
+
+    def scores(self, query, start=0, end=None):
+        """Cosine similarity of `query` to rows start:end."""
+        query = normalize(query).astype(np.float32)
+        end = self.size if end is None else end
+        result = np.empty(end - start, dtype=np.float32)
+        for i in range(start, end, SEARCH_CHUNK):
+            j = min(i + SEARCH_CHUNK, end)
+            result[i - start:j - start] = self._vectors[i:j].astype(np.float32) @ query
+        return result
+
+    def search(self, query, k=5):
+        """(keys, similarities) of the k most similar rows, best first."""
+        if not self.size:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        scores = self.scores(query)
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return self.keys[top], scores[top]
+
+
+class ReferenceIndex:
+    """
+    Reference embeddings grouped by class, with a similarity threshold per
+    class. An image predicted as class c is accepted when the mean
+    similarity to its `k` closest references of c reaches c's threshold.
+    """
+
+    def __init__(self, vectors, labels, thresholds, class_names, model_version, k=3):
+        order = np.argsort(labels, kind='stable')
+        labels = np.asarray(labels)[order]
+        self.index = EmbeddingIndex(vectors.shape[1], capacity=len(labels))
+        self.index.add(labels, np.asarray(vectors)[order])
+        self.offsets = np.searchsorted(labels, np.arange(len(class_names) + 1))
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        self.class_names = list(class_names)
+        self.model_version = model_version
+        self.k = k
+
+    def class_score(self, embedding, label):
+        """Mean similarity to the k closest references of `label` (None if it has none)."""
+        start, end = self.offsets[label], self.offsets[label + 1]
+        if start == end:
+            return None
+        scores = self.index.scores(embedding, start, end)
+        k = min(self.k, len(scores))
+        return float(np.partition(scores, len(scores) - k)[-k:].mean())
+
+    def accepts(self, embedding, label):
+        """(accepted, score) for an image the classifier labelled `label`."""
+        score = self.class_score(embedding, label)
+        if score is None:
+            return False, None
+        return bool(score >= self.thresholds[label]), score
+
+    def save(self, path):
+        np.savez(path, vectors=self.index.vectors, labels=self.index.keys, thresholds=self.thresholds,
+                 class_names=np.array(self.class_names), model_version=np.array(self.model_version or ''),
+                 k=np.array(self.k))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['vectors'], data['labels'], data['thresholds'], [str(n) for n in data['class_names']],
+                       str(data['model_version']) or None, int(data['k']))
+
+
+def leave_one_out_scores(vectors, labels, num_classes, k=3):
+    """
+    For every reference, ReferenceIndex.class_score against the other
+    references of its class. Used to set each class's threshold.
+    """
+    vectors = normalize(vectors).astype(np.float32)
+    labels = np.asarray(labels)
+    scores = np.full(len(labels), np.nan, dtype=np.float32)
+    for label in range(num_classes):
+        rows = np.flatnonzero(labels == label)
+        if len(rows) < 2:
+            continue
+        similarity = vectors[rows] @ vectors[rows].T
+        np.fill_diagonal(similarity, -np.inf)
+        kk = min(k, len(rows) - 1)
+        scores[rows] = np.sort(similarity, axis=1)[:, -kk:].mean(axis=1)
+    return scores
+
+
+def class_thresholds(scores, labels, num_classes, target_recall=0.95):
+    """Per class, the score that keeps `target_recall` of its references."""
+    thresholds = np.full(num_classes, np.inf, dtype=np.float32)
+    for label in range(num_classes):
+        values = scores[(labels == label) & ~np.isnan(scores)]
+        if len(values):
+            thresholds[label] = np.quantile(values, 1 - target_recall)
+    return thresholds
+
+
+class DiscoveryIndex:
+    """
+    Per-student EmbeddingIndex of discovery embeddings, loaded from the
+    database on first search and topped up with newer rows on each search.
+    At most `max_students` indexes are kept, least recently used evicted.
+    """
+
+    def __init__(self, max_students=256):
+        self.max_students = max_students
+        self._students = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _student_index(self, student_id):
+        with self._lock:
+            entry = self._students.get(student_id)
+            if entry is not None:
+                self._students.move_to_end(student_id)
+        if entry is None:
+            entry = [None, threading.Lock()]
+        index, lock = entry
+        with lock:
+            last = int(index.keys[-1]) if index is not None and len(index) else 0
+            rows = (DiscoveryEmbedding.objects
+                    .filter(Recognition__Student_id=student_id, Recognition_id__gt=last)
+                    .order_by('Recognition_id').values_list('Recognition_id', 'Vector'))
+            keys, vectors = [], []
+            for key, vector in rows:
+                keys.append(key)
+                vectors.append(from_bytes(vector))
+            if vectors:
+                if index is None:
+                    index = EmbeddingIndex(len(vectors[0]), capacity=max(256, len(vectors)))
+                index.add(keys, np.stack(vectors))
+                entry[0] = index
+        with self._lock:
+            self._students[student_id] = entry
+            self._students.move_to_end(student_id)
+            while len(self._students) > self.max_students:
+                self._students.popitem(last=False)
+        return index, lock
+
+    def similar(self, student_id, embedding, k=5):
+        """[(recognition id, similarity)] of the student's k most similar discoveries."""
+        index, lock = self._student_index(student_id)
+        if index is None:
+            return []
+        with lock:
+            keys, scores = index.search(embedding, k)
+        return [(int(key), float(score)) for key, score in zip(keys, scores)]
+
+    def invalidate(self, student_id):
+        with self._lock:
+            self._students.pop(student_id, None)
+
+
+discovery_index = DiscoveryIndex(getattr(settings, 'SIMILARITY_CACHE_STUDENTS', 256))
+
+
+def load_reference_index(model_version):
+    """The saved ReferenceIndex if it exists and was built for this model, else None."""
+    path = getattr(settings, 'REFERENCE_INDEX_FILE', None)
+    if not path:
+        return None
+    try:
+        index = ReferenceIndex.load(path)
+    except FileNotFoundError:
+        return None
+    if index.model_version != model_version:
+        logger.warning(f"⚠️ Reference index {path} was built for another model; using the softmax threshold. "
+                       "Rebuild it with `manage.py build_reference_index`.")
+        return None
+    logger.info(f"✅ Reference index loaded: {len(index.index)} embeddings for Unknown detection.")
+    return index
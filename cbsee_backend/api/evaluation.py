@@ -0,0 +1,216 @@
+"""
+Accuracy and speed of a classifier on a labelled image folder.
+
+The folder uses the image_dataset_creator layout, <category>/<object>/*.jpg,
+and object folders are matched to classes.txt by name ("cup_mug" matches
+"cup mug"). Images are preprocessed exactly as ImageClassifier does and run
+in batches, in a fixed order, so two runs on the same data differ only by
+the model and settings recorded alongside the results.
+"""
+import hashlib
+import platform
+import statistics
+import time
+from pathlib import Path
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+CALIBRATION_BINS = 10
+THRESHOLD_SWEEP = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+def class_key(name):
+    return ' '.join(name.lower().replace('_', ' ').split())
+
+
+def list_labelled_images(dataset_dir, class_names):
+    """
+    Returns ([(path, class index)], [object folders with no matching class]),
+    sorted by path so every run sees the same order.
+    """
+    dataset_dir = Path(dataset_dir)
+    index = {class_key(name): i for i, name in enumerate(class_names)}
+    samples, unmatched = [], []
+    for folder in sorted(p for p in dataset_dir.glob('*/*') if p.is_dir() and not p.parent.name.startswith('.')):
+        label = index.get(class_key(folder.name))
+        if label is None:
+            unmatched.append(folder.relative_to(dataset_dir).as_posix())
+            continue
+        samples.extend((path, label) for path in sorted(folder.iterdir())
+                       if path.suffix.lower() in IMAGE_EXTENSIONS)
+    return samples, unmatched
+
+
+class LabelledImages:
+    """Map-style dataset of preprocessed images; unreadable files get label -1."""
+
+    def __init__(self, samples, preprocess, crop=224):
+        self.samples = samples
+        self.preprocess = preprocess
+        self.crop = crop
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, i):
+        import torch
+        from PIL import Image
+
+        path, label = self.samples[i]
+        try:
+            with Image.open(path) as image:
+                return self.preprocess(image.convert('RGB')), label
+        except Exception:
+            return torch.zeros(3, self.crop, self.crop), -1
+
+
+def load_model(path):
+    """
+    A callable mapping an input batch to logits, for a state dict (.pth),
+    a TorchScript file (.pt) or a lite-interpreter file (.ptl).
+    """
+    import torch
+
+    from api.ml_inference import build_model
+
+    path = Path(path)
+    if path.suffix == '.ptl':
+        from torch.jit.mobile import _load_for_lite_interpreter
+        return _load_for_lite_interpreter(str(path))
+    if path.suffix == '.pth':
+        return build_model(torch.load(path, map_location=torch.device('cpu'), weights_only=True))
+    return torch.jit.load(str(path), map_location='cpu')
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def dataset_fingerprint(dataset_dir, samples):
+    """Changes when any image is added, removed, relabelled or rewritten."""
+    digest = hashlib.sha256()
+    for path, label in samples:
+        stat = path.stat()
+        digest.update(f'{path.relative_to(dataset_dir).as_posix()}:{label}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()[:16]
+
+
+def evaluate(model, dataset, batch_size=32, workers=2):
+    """
+    Runs every image through the model. Returns (probabilities, labels,
+    timings) with timings: wall seconds, model seconds and per-batch
+    model seconds.
+    """
+    import torch
+    import torch.nn.functional as F
+    from torch.utils.data import DataLoader
+
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=workers)
+    probabilities, labels, batch_seconds = [], [], []
+    started = time.perf_counter()
+    with torch.no_grad():
+        for batch, batch_labels in loader:
+            start = time.perf_counter()
+            logits = model(batch)
+            batch_seconds.append(time.perf_counter() - start)
+            probabilities.append(F.softmax(logits, dim=1))
+            labels.append(batch_labels)
+    wall = time.perf_counter() - started
+    return torch.cat(probabilities), torch.cat(labels), {
+        'wall_seconds': wall, 'model_seconds': sum(batch_seconds), 'batch_seconds': batch_seconds}
+
+
+def summarize(probabilities, labels, timings, class_names, threshold, batch_size):
+    """
+    Accuracy, confusion, calibration and throughput as a JSON-serializable
+    dict. Needs at least one readable image (label >= 0).
+    """
+    import torch
+
+    readable = labels >= 0
+    probabilities, labels = probabilities[readable], labels[readable]
+    total = len(labels)
+    confidence, predicted = probabilities.max(1)
+    correct = predicted == labels
+    top3 = probabilities.topk(min(3, probabilities.shape[1]), dim=1).indices
+    top3_correct = (top3 == labels.unsqueeze(1)).any(1)
+
+    num_classes = len(class_names)
+    confusion = torch.zeros(num_classes, num_classes, dtype=torch.long)
+    confusion.index_put_((labels, predicted), torch.ones_like(labels), accumulate=True)
+    per_class = []
+    for i, name in enumerate(class_names):
+        support = int(confusion[i].sum())
+        predicted_as = int(confusion[:, i].sum())
+        if support or predicted_as:
+            per_class.append({'class': name, 'support': support,
+                              'recall': confusion[i, i].item() / support if support else None,
+                              'precision': confusion[i, i].item() / predicted_as if predicted_as else None})
+    off_diagonal = confusion.clone().fill_diagonal_(0)
+    top_confusions = [
+        {'true': class_names[int(k) // num_classes], 'predicted': class_names[int(k) % num_classes],
+         'count': int(off_diagonal.view(-1)[k])}
+        for k in off_diagonal.view(-1).argsort(descending=True)[:10] if off_diagonal.view(-1)[k] > 0
+    ]
+
+    bins = []
+    expected_calibration_error = 0.0
+    for b in range(CALIBRATION_BINS):
+        low, high = b / CALIBRATION_BINS, (b + 1) / CALIBRATION_BINS
+        in_bin = (confidence >= low) & ((confidence < high) if b < CALIBRATION_BINS - 1 else (confidence <= high))
+        count = int(in_bin.sum())
+        if count:
+            mean_confidence = confidence[in_bin].mean().item()
+            accuracy = correct[in_bin].float().mean().item()
+            expected_calibration_error += count / total * abs(accuracy - mean_confidence)
+            bins.append({'range': [low, high], 'count': count,
+                         'confidence': mean_confidence, 'accuracy': accuracy})
+
+    def at_threshold(t):
+        accepted = confidence >= t
+        n = int(accepted.sum())
+        rejected = total - n
+        return {'threshold': t, 'coverage': n / total,
+                'accepted_accuracy': correct[accepted].float().mean().item() if n else None,
+                # Correct predictions the cutoff turns into "Unknown"
+                'rejected_correct': correct[~accepted].float().mean().item() if rejected else None,
+                'served_accuracy': (correct & accepted).float().mean().item()}
+
+    batch_ms = [s * 1000 for s in timings['batch_seconds']]
+    return {
+        'images': total,
+        'unreadable': int((~readable).sum()),
+        'top1': correct.float().mean().item(),
+        'top3': top3_correct.float().mean().item(),
+        'per_class': per_class,
+        'top_confusions': top_confusions,
+        'confusion': confusion.tolist(),
+        'calibration': {
+            'ece': expected_calibration_error,
+            'bins': bins,
+            'threshold': at_threshold(threshold),
+            'sweep': [at_threshold(t) for t in THRESHOLD_SWEEP],
+        },
+        'throughput': {
+            'images_per_second': total / timings['wall_seconds'],
+            'model_images_per_second': total / timings['model_seconds'],
+            'batch_ms_p50': statistics.median(batch_ms),
+            'batch_ms_max': max(batch_ms),
+            'batch_size': batch_size,
+        },
+    }
+
+
+def percent(value):
+    """A rate for reports, or "n/a" when it is undefined (e.g. nothing was accepted)."""
+    return "n/a" if value is None else f"{value:.1%}"
+
+
+def environment():
+    import torch
+
+    return {'torch': torch.__version__, 'threads': torch.get_num_threads(),
+            'machine': platform.machine(), 'processor': platform.processor() or platform.machine()}
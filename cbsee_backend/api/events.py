@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .catalog import object_catalog
+from .models import Student
+from .signals import recognitions_recorded
+
+logger = logging.getLogger(__name__)
+
+
+def teacher_channel(teacher_id):
+    return f'teacher:{teacher_id}'
+
+
+class Subscription:
+    """A bounded queue of events for one listener, read from its event loop."""
+
+    def __init__(self, broker, channel, max_queue):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_queue)
+
+    def deliver(self, event):
+        # Runs on the subscriber's loop. A slow client loses its oldest
+        # events instead of holding up the publisher.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Next event, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Publish/subscribe between threads of this process.
+
+    publish() may be called from any thread (request threads, the write-behind
+    flusher); events are handed to each subscriber's event loop. Another
+    broker can be swapped in with settings.EVENT_BROKER as long as it offers
+    the same publish/subscribe/has_subscribers methods.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.max_queue)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down.
+                self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'EVENT_BROKER', 'api.events.InProcessBroker'))()
+    return _broker
+
+
+@receiver(recognitions_recorded)
+def _publish_recognitions(sender, recognitions, **kwargs):
+    recognitions = list(recognitions)
+
+    def publish():
+        broker = get_broker()
+        if not broker.has_subscribers():
+            return
+        student_ids = {rec.Student_id for rec in recognitions}
+        teachers = dict(Student.objects.filter(StudentID__in=student_ids).values_list('StudentID', 'Teacher_id'))
+        for rec in recognitions:
+            teacher_id = teachers.get(rec.Student_id)
+            if not teacher_id:
+                continue
+            obj = object_catalog.by_id(rec.Object_id)
+            broker.publish(teacher_channel(teacher_id), {
+                'id': rec.ID,
+                'studentId': rec.Student_id,
+                'object': obj.ObjectName if obj else None,
+                'category': obj.ObjectCategory if obj else None,
+                'timestamp': rec.Timestamp.isoformat() if rec.Timestamp else None,
+            })
+
+    def safe_publish():
+        try:
+            publish()
+        except Exception as e:
+            logger.error(f"❌ Error publishing discoveries: {e}")
+    transaction.on_commit(safe_publish)
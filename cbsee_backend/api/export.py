@@ -0,0 +1,50 @@
+import csv
+import json
+
+from .archive import RecognitionArchive, format_timestamp
+from .models import ObjectRecognized, Student
+
+EXPORT_FIELDS = ['id', 'student_id', 'student_name', 'object', 'category', 'timestamp']
+
+
+def iter_class_history(teacher_id, start=None, end=None, chunk_size=2000):
+    """
+    Yields one row per discovery made by the teacher's current students,
+    archived discoveries first, then rows still in the database, oldest first.
+    Database rows are read as tuples in chunks so memory stays flat however
+    long the history is.
+    """
+    names = dict(Student.objects.filter(Teacher_id=teacher_id).values_list('StudentID', 'Name'))
+    for record in RecognitionArchive().iter_records(student_ids=names, start=start, end=end):
+        yield (record['id'], record['student_id'], names[record['student_id']],
+               record['object_name'], record['category'], record['timestamp'])
+
+    rows = ObjectRecognized.objects.filter(Student__Teacher_id=teacher_id)
+    if start:
+        rows = rows.filter(Timestamp__gte=start)
+    if end:
+        rows = rows.filter(Timestamp__lt=end)
+    rows = rows.order_by('ID').values_list(
+        'ID', 'Student_id', 'Student__Name', 'Object__ObjectName', 'Object__ObjectCategory', 'Timestamp'
+    )
+    for pk, student_id, name, object_name, category, timestamp in rows.iterator(chunk_size=chunk_size):
+        yield pk, student_id, name, object_name, category or 'General', format_timestamp(timestamp)
+
+
+class _Echo:
+    """File-like object whose write() hands back the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
@@ -0,0 +1,275 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+from google.auth import crypt, jwt
+
+logger = logging.getLogger(__name__)
+
+ID_TOKEN_CERT_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ID_TOKEN_ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+
+class InvalidTokenError(ValueError):
+    """Raised when an ID token is malformed, expired or wrongly signed."""
+
+
+def fetch_google_certs(url=ID_TOKEN_CERT_URL, timeout=10):
+    """Downloads the Firebase signing certificates. Returns (certs, max_age)."""
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    return response.json(), int(match.group(1)) if match else 3600
+
+
+class PublicKeyStore:
+    """
+    Keeps the current signing certificates (kid -> PEM) in memory.
+
+    Only the very first load happens on the caller's thread. After that a
+    daemon thread refreshes the certificates shortly before their Cache-Control
+    max-age runs out, so verifying a token never waits on Google.
+    """
+
+    def __init__(self, fetch=fetch_google_certs, retry_interval=60):
+        self._fetch = fetch
+        self.retry_interval = retry_interval
+        self._certs = None
+        self._fetched_at = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self):
+        if self._certs is None:
+            with self._lock:
+                if self._certs is None:
+                    delay = self._load()
+                    self._thread = threading.Thread(target=self._run, args=(delay,), name='firebase-keys', daemon=True)
+                    self._thread.start()
+        return self._certs
+
+    def refresh_if_stale(self):
+        """Reloads right away for an unknown kid, at most once per retry_interval."""
+        with self._lock:
+            if time.monotonic() - self._fetched_at >= self.retry_interval:
+                self._load()
+        return self._certs
+
+    def _load(self):
+        certs, max_age = self._fetch()
+        self._certs = certs
+        self._fetched_at = time.monotonic()
+        # Refresh before the published expiry so a stale key is never used.
+        return max(self.retry_interval, max_age * 0.8)
+
+    def _run(self, delay):
+        while True:
+            time.sleep(delay)
+            try:
+                with self._lock:
+                    delay = self._load()
+            except Exception as e:
+                logger.error(f"❌ Could not refresh Firebase signing keys: {e}")
+                delay = self.retry_interval
+
+
+class VerifiedTokenCache:
+    """Thread-safe LRU of verified claims keyed by a SHA-256 of the token."""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode() if isinstance(token, str) else token).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['exp'] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(entry)
+
+    def put(self, key, claims):
+        with self._lock:
+            self._entries[key] = dict(claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TokenVerifier:
+    """Verifies Firebase ID tokens the same way firebase_admin.auth does."""
+
+    def __init__(self, project_id, key_store, cache, clock_skew_seconds=0):
+        self.project_id = project_id
+        self.key_store = key_store
+        self.cache = cache
+        self.clock_skew_seconds = clock_skew_seconds
+
+    def verify(self, token):
+        if not token or not isinstance(token, (str, bytes)):
+            raise InvalidTokenError("ID token must be a non-empty string.")
+        key = self.cache.key(token)
+        claims = self.cache.get(key)
+        if claims is not None:
+            return claims
+
+        try:
+            header = jwt.decode_header(token)
+        except ValueError as e:
+            raise InvalidTokenError(str(e))
+        kid = header.get('kid')
+        if header.get('alg') != 'RS256' or not kid:
+            raise InvalidTokenError("ID token must be signed with RS256 and carry a kid.")
+        certs = self.key_store.get()
+        if kid not in certs:
+            certs = self.key_store.refresh_if_stale()
+            if kid not in certs:
+                raise InvalidTokenError(f"ID token signed with unknown key {kid}.")
+
+        try:
+            claims = jwt.decode(token, certs={kid: certs[kid]}, audience=self.project_id,
+                                clock_skew_in_seconds=self.clock_skew_seconds)
+        except ValueError as e:
+            raise InvalidTokenError(str(e))
+        if claims.get('iss') != ID_TOKEN_ISSUER_PREFIX + self.project_id:
+            raise InvalidTokenError(f"ID token has incorrect issuer {claims.get('iss')}.")
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidTokenError("ID token has an invalid sub claim.")
+
+        claims['uid'] = subject
+        self.cache.put(key, claims)
+        return dict(claims)
+
+
+class LocalTokenIssuer:
+    """
+    Signs Firebase-shaped ID tokens with a throwaway RSA key.
+
+    Pass ``issuer.fetch`` to a PublicKeyStore to verify its tokens with no
+    network access. With ``key_file`` the key is kept in that PEM file
+    (created on first use), so separate processes can share it.
+    """
+
+    def __init__(self, project_id, key_id='local-key', key_file=None):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        private_pem = _read_key_file(key_file) if key_file else None
+        if private_pem:
+            private_key = serialization.load_pem_private_key(private_pem, password=None)
+        else:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            private_pem = private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            )
+            if key_file and not _create_key_file(key_file, private_pem):
+                # Another process created the key first; use that one.
+                private_pem = _read_key_file(key_file)
+                private_key = serialization.load_pem_private_key(private_pem, password=None)
+        self.project_id = project_id
+        self.key_id = key_id
+        self.public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+        self._signer = crypt.RSASigner.from_string(private_pem, key_id=key_id)
+
+    def fetch(self):
+        return {self.key_id: self.public_pem}, 3600
+
+    def issue(self, uid, email=None, lifetime=3600, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': ID_TOKEN_ISSUER_PREFIX + self.project_id,
+            'aud': self.project_id,
+            'auth_time': now,
+            'user_id': uid,
+            'sub': uid,
+            'iat': now,
+            'exp': now + lifetime,
+        }
+        if email:
+            payload['email'] = email
+        payload.update(claims)
+        return jwt.encode(self._signer, payload).decode()
+
+
+def _read_key_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _create_key_file(path, private_pem):
+    """Writes the key unless the file already exists. Returns whether it did."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'wb') as f:
+        f.write(private_pem)
+    return True
+
+
+_local_issuer = None
+_local_issuer_lock = threading.Lock()
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_local_issuer():
+    """The token issuer for CBSEE_AUTH_PROVIDER=local, keyed by LOCAL_AUTH_KEY_FILE."""
+    global _local_issuer
+    if _local_issuer is None:
+        with _local_issuer_lock:
+            if _local_issuer is None:
+                _local_issuer = LocalTokenIssuer(settings.FIREBASE_CONFIG['projectId'],
+                                                 key_file=settings.LOCAL_AUTH_KEY_FILE)
+    return _local_issuer
+
+
+def _local_key_fetch():
+    return get_local_issuer().fetch()
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                key_store = PublicKeyStore()
+                if getattr(settings, 'AUTH_PROVIDER', 'firebase') == 'local':
+                    logger.warning("⚠️ AUTH_PROVIDER is 'local': accepting locally signed test tokens, not Firebase tokens")
+                    key_store = PublicKeyStore(_local_key_fetch)
+                _verifier = TokenVerifier(
+                    project_id=settings.FIREBASE_CONFIG['projectId'],
+                    key_store=key_store,
+                    cache=VerifiedTokenCache(getattr(settings, 'FIREBASE_TOKEN_CACHE_SIZE', 10000)),
+                )
+    return _verifier
+
+
+def verify_id_token(token):
+    """Drop-in for firebase_admin.auth.verify_id_token, with caching."""
+    return get_verifier().verify(token)
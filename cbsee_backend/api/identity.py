@@ -0,0 +1,58 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Student, Teacher
+
+# user_type is 'teacher' or 'student'; teacher_id is the teacher's own ID for
+# teachers and the assigned teacher (or None) for students.
+Identity = namedtuple('Identity', ['user_type', 'pk', 'teacher_id'])
+
+
+class IdentityResolver:
+    """
+    Turns a Firebase uid into an Identity, caching the answer.
+
+    Only existing profiles are cached: a uid without a profile is looked up
+    again next time, so a user who signs up is never reported as missing by a
+    worker that did not see the signup.
+    """
+
+    timeout = 300
+
+    @staticmethod
+    def _key(uid):
+        return f'identity:{uid}'
+
+    def resolve(self, uid):
+        if not uid:
+            return None
+        cached = cache.get(self._key(uid))
+        if cached is not None:
+            return Identity(*cached)
+        identity = self._lookup(uid)
+        if identity is not None:
+            cache.set(self._key(uid), tuple(identity), self.timeout)
+        return identity
+
+    def invalidate(self, *uids):
+        cache.delete_many([self._key(uid) for uid in uids if uid])
+
+    def _lookup(self, uid):
+        if Teacher.objects.filter(TeacherID=uid).exists():
+            return Identity('teacher', uid, uid)
+        student = Student.objects.filter(StudentID=uid).values_list('Teacher_id', flat=True)
+        for teacher_id in student:
+            return Identity('student', uid, teacher_id)
+        return None
+
+
+identity_resolver = IdentityResolver()
+
+
+@receiver([post_save, post_delete], sender=Teacher)
+@receiver([post_save, post_delete], sender=Student)
+def _profile_changed(sender, instance, **kwargs):
+    identity_resolver.invalidate(instance.pk)
@@ -0,0 +1,158 @@
+"""
+Traffic scenarios for `manage.py loadtest`.
+
+A scenario is a weighted mix of the app's main calls. Each worker thread
+picks a call by weight, sends it through a target (a running server over
+HTTP, or Django's test client in-process) and records the latency per
+endpoint.
+"""
+import http.client
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+SCENARIOS = {
+    # A class using the app: mostly scanning and checking their collection.
+    'classroom': {'classify': 4, 'discoveries': 4, 'stats': 1, 'dashboard': 1},
+    # Teachers reviewing progress.
+    'reporting': {'dashboard': 4, 'stats': 4, 'discoveries': 2},
+    'mixed': {'classify': 2, 'discoveries': 4, 'dashboard': 2, 'stats': 2},
+}
+
+
+def sample_image():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (224, 224), (120, 160, 90)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def multipart(fields, files):
+    """Encodes form fields and (filename, content_type, bytes) files."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content_type, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class HttpTarget:
+    """Sends requests to a running server, one keep-alive connection per thread."""
+
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self._local = threading.local()
+
+    def request(self, method, path, headers, body=None):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.netloc, timeout=30)
+        try:
+            connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+class ClientTarget:
+    """Calls the app in-process with Django's test client."""
+
+    def __init__(self, prefix='/api/v1'):
+        self.prefix = prefix
+        self._local = threading.local()
+
+    def request(self, method, path, headers, body=None):
+        from django.test import Client
+
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client()
+        headers = dict(headers)
+        content_type = headers.pop('Content-Type', 'application/octet-stream')
+        return client.generic(method, self.prefix + path, body or b'', content_type, headers=headers).status_code
+
+
+class Scenario:
+    """Builds the requests for each call from the seeded users and their tokens."""
+
+    def __init__(self, classes, issue_token):
+        # classes: {teacher_id: [student_id, ...]}
+        self.classes = {teacher: students for teacher, students in classes.items() if students}
+        self.tokens = {uid: issue_token(uid) for teacher, students in self.classes.items() for uid in [teacher, *students]}
+        self.image = sample_image()
+
+    def _auth(self, uid):
+        return {'Authorization': f'Bearer {self.tokens[uid]}'}
+
+    def build(self, call):
+        """Returns (method, path, headers, body) for one call."""
+        teacher = random.choice(list(self.classes))
+        student = random.choice(self.classes[teacher])
+        if call == 'classify':
+            body, content_type = multipart({'body': json.dumps({'token': self.tokens[student]})},
+                                           {'image': ('scan.jpg', 'image/jpeg', self.image)})
+            return 'POST', '/classify/', {'Content-Type': content_type}, body
+        if call == 'discoveries':
+            return 'GET', '/discoveries/', self._auth(student), None
+        if call == 'dashboard':
+            return 'GET', '/dashboard/', self._auth(teacher), None
+        if call == 'stats':
+            return 'GET', f'/student_stats/{student}/', self._auth(teacher), None
+        raise ValueError(f"Unknown call: {call}")
+
+
+def run(target, scenario, weights, concurrency, duration, on_thread_exit=None):
+    """
+    Sends the weighted mix from ``concurrency`` threads for ``duration``
+    seconds. Returns ({call: latencies}, {call: error count}, elapsed).
+    """
+    calls = list(weights)
+    call_weights = [weights[call] for call in calls]
+    latencies = {call: [] for call in calls}
+    errors = {call: 0 for call in calls}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        try:
+            while time.monotonic() < deadline:
+                call = random.choices(calls, call_weights)[0]
+                method, path, headers, body = scenario.build(call)
+                start = time.perf_counter()
+                try:
+                    ok = target.request(method, path, headers, body) < 400
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies[call].append(elapsed)
+                    else:
+                        errors[call] += 1
+        finally:
+            if on_thread_exit:
+                on_thread_exit()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.monotonic() - started
@@ -0,0 +1,80 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.archive import RecognitionArchive, format_timestamp
+from api.models import ObjectRecognized
+from api.rollups import archiving
+
+# student_stats counts the last 7 days from raw rows, so keep at least that.
+MIN_RETENTION_DAYS = 8
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves discoveries older than the retention period into compressed "
+        "NDJSON archive files and deletes them in small batches. Totals are "
+        "unaffected: the rollup tables already count every discovery."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.RECOGNITION_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help="Seconds to wait between batches so other writers get the lock.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days < MIN_RETENTION_DAYS:
+            raise CommandError(f"Retention must be at least {MIN_RETENTION_DAYS} days.")
+        archive = RecognitionArchive()
+        cutoff = timezone.now() - timedelta(days=days)
+        old_rows = ObjectRecognized.objects.filter(Timestamp__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f"{old_rows.count()} discoveries older than {cutoff:%Y-%m-%d} would be archived.")
+            return
+
+        self._finish_pending(archive)
+        archived = 0
+        while True:
+            rows = list(old_rows.order_by('ID').values_list(
+                'ID', 'Student_id', 'Object_id', 'Object__ObjectName', 'Object__ObjectCategory', 'Timestamp'
+            )[:options['batch_size']])
+            if not rows:
+                break
+            entry = archive.write_batch([
+                {'id': pk, 'student_id': student_id, 'object_id': object_id, 'object_name': name,
+                 'category': category or 'General', 'timestamp': format_timestamp(ts)}
+                for pk, student_id, object_id, name, category, ts in rows
+            ])
+            archive.mark_pending(entry)
+            archive.add_to_index(entry)
+            self._delete([row[0] for row in rows])
+            archive.clear_pending()
+            archived += len(rows)
+            self.stdout.write(f"  archived {entry['file']} ({len(rows)} rows)")
+            time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} discoveries older than {cutoff:%Y-%m-%d}."))
+
+    def _finish_pending(self, archive):
+        """Completes a batch that was written but not deleted by an interrupted run."""
+        entry = archive.pending()
+        if entry is None:
+            return
+        archive.add_to_index(entry)
+        self._delete([record['id'] for record in archive.read_file(entry)])
+        archive.clear_pending()
+        self.stdout.write(f"  finished interrupted batch {entry['file']}")
+
+    def _delete(self, ids):
+        # One short transaction per chunk keeps the SQLite write lock brief.
+        for i in range(0, len(ids), 500):
+            with transaction.atomic(), archiving():
+                ObjectRecognized.objects.filter(ID__in=ids[i:i + 500]).delete()
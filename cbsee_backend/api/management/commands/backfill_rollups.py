@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the discovery rollup tables from the raw ObjectRecognized rows."
+
+    def handle(self, *args, **options):
+        daily, hourly = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {daily} student/day and {hourly} class/hour rollup rows."))
@@ -0,0 +1,151 @@
+import random
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, connections
+from django.test import Client
+
+from api import firebase_auth
+from api.firebase_auth import LocalTokenIssuer, PublicKeyStore, TokenVerifier, VerifiedTokenCache
+from api.models import Object, ObjectRecognized, Student, Teacher
+from api.recognition_buffer import write_recognitions
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Count, throughput and latency percentiles (ms) for a list of seconds."""
+    ordered = sorted(latencies)
+
+    def pct(p):
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'ops': len(ordered) / elapsed if elapsed else 0.0,
+        'p50': pct(50),
+        'p95': pct(95),
+        'p99': pct(99),
+        'errors': errors,
+    }
+
+
+def format_summary_table(rows):
+    lines = [f"{'operation':<16}{'count':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"]
+    for name, s in rows:
+        lines.append(f"{name:<16}{s['count']:>8}{s['ops']:>10.1f}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}{s['errors']:>8}")
+    return '\n'.join(lines)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent discovery writes (the /classify/ insert) and teacher "
+        "dashboard reads against a scratch database created with the current "
+        "CBSEE_DB_PROFILE, and reports throughput and latency percentiles."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds to run.")
+        parser.add_argument('--students', type=int, default=40)
+        parser.add_argument('--history', type=int, default=50, help="Existing discoveries per student.")
+
+    def handle(self, *args, **options):
+        tmp_dir = None
+        if connection.vendor == 'sqlite':
+            # A file (not in-memory) database so every thread shares it.
+            tmp_dir = tempfile.mkdtemp(prefix='cbsee-bench-')
+            connection.settings_dict['TEST']['NAME'] = str(Path(tmp_dir) / 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _run(self, options):
+        issuer = LocalTokenIssuer(settings.FIREBASE_CONFIG['projectId'])
+        firebase_auth._verifier = TokenVerifier(issuer.project_id, PublicKeyStore(issuer.fetch), VerifiedTokenCache())
+
+        teacher = Teacher.objects.create(TeacherID='bench-teacher', Name='Bench', Email='bench-teacher@example.com',
+                                         School='', ContactInfo='')
+        students = Student.objects.bulk_create([
+            Student(StudentID=f'bench-student-{i}', Name=f'Student {i}', GradeLevel='Grade 1',
+                    Email=f'bench-student-{i}@example.com', Teacher=teacher)
+            for i in range(options['students'])
+        ])
+        objects = Object.objects.bulk_create([
+            Object(ObjectName=f'object-{i}', ObjectDescription='', ObjectCategory='General') for i in range(20)
+        ])
+        ObjectRecognized.objects.bulk_create([
+            ObjectRecognized(Student=student, Object=random.choice(objects))
+            for student in students for _ in range(options['history'])
+        ], batch_size=500)
+        connections.close_all()
+
+        token = issuer.issue(teacher.TeacherID)
+        deadline = time.monotonic() + options['duration']
+        results = {'write': ([], [0]), 'dashboard read': ([], [0])}
+        lock = threading.Lock()
+
+        def record(name, latency=None):
+            with lock:
+                if latency is None:
+                    results[name][1][0] += 1
+                else:
+                    results[name][0].append(latency)
+
+        def writer():
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        write_recognitions([ObjectRecognized(Student_id=random.choice(students).StudentID,
+                                                             Object_id=random.choice(objects).ObjectID)])
+                        record('write', time.perf_counter() - start)
+                    except DatabaseError:
+                        record('write')
+            finally:
+                connection.close()
+
+        def reader():
+            client = Client()
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    response = client.get('/api/v1/dashboard/', HTTP_AUTHORIZATION=f'Bearer {token}')
+                    if response.status_code == 200:
+                        record('dashboard read', time.perf_counter() - start)
+                    else:
+                        record('dashboard read')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(options['writers'])]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        with connection.cursor() as cursor:
+            journal = ''
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA journal_mode')
+                journal = f" (journal_mode={cursor.fetchone()[0]})"
+        self.stdout.write(f"Profile: {settings.DB_PROFILE}{journal}, {options['writers']} writers, "
+                          f"{options['readers']} readers, {elapsed:.1f}s")
+        self.stdout.write(format_summary_table(
+            [(name, summarize(latencies, elapsed, errors[0])) for name, (latencies, errors) in results.items()]
+        ))
@@ -0,0 +1,66 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+from api.management.commands.bench_db import format_summary_table, summarize
+from api.models import Object, ObjectRecognized, Student
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import DiscoverySerializer, discovery_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the discovery list response body (query, serialization and JSON "
+        "rendering) with DiscoverySerializer + JSONRenderer against "
+        "discovery_rows() + FastJSONRenderer on a scratch database, and checks "
+        "that both produce the same bytes."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, options):
+        student = Student.objects.create(StudentID='bench-student', Name='Student', GradeLevel='Grade 1',
+                                         Email='bench-student@example.com')
+        objects = Object.objects.bulk_create([
+            Object(ObjectName=f'object-{i}', ObjectDescription='', ObjectCategory='Général') for i in range(20)
+        ])
+        ObjectRecognized.objects.bulk_create([
+            ObjectRecognized(Student=student, Object=random.choice(objects)) for _ in range(options['rows'])
+        ], batch_size=500)
+        queryset = ObjectRecognized.objects.filter(Student=student).order_by('-Timestamp')
+
+        def serializer_body():
+            return JSONRenderer().render(DiscoverySerializer(queryset.select_related('Object'), many=True).data)
+
+        def fast_body():
+            return FastJSONRenderer().render(discovery_rows(queryset))
+
+        if serializer_body() != fast_body():
+            raise CommandError("discovery_rows() + FastJSONRenderer output differs from DiscoverySerializer.")
+
+        rows = []
+        for name, body in (('serializer', serializer_body), ('fast path', fast_body)):
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                body()
+                latencies.append(time.perf_counter() - start)
+            rows.append((name, summarize(latencies, time.perf_counter() - started)))
+
+        self.stdout.write(f"{options['rows']} rows, {options['repeat']} runs each, "
+                          f"encoder: {'orjson' if orjson else 'json (orjson not installed)'}; outputs identical")
+        self.stdout.write(format_summary_table(rows))
@@ -0,0 +1,131 @@
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import evaluation
+from api.evaluation import percent
+from api.embeddings import ReferenceIndex, class_thresholds, leave_one_out_scores, normalize
+from api.ml_inference import get_classifier
+
+# Every HOLDOUT_EVERY-th image of a class is held out to measure the rule.
+HOLDOUT_EVERY = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Embeds a labelled folder (<category>/<object>/*.jpg) with the loaded "
+        "classifier and saves the reference index /classify/ uses to answer "
+        "Unknown. Each class's threshold keeps --target-recall of its own "
+        "references. Before saving, the rule is checked on held-out images "
+        "(and on --unknown-dir, images of objects outside the classes) against "
+        "the softmax confidence cutoff."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset_dir')
+        parser.add_argument('--unknown-dir', default=None,
+                            help="Folder of images of objects the model doesn't know, to measure rejection.")
+        parser.add_argument('--per-class', type=int, default=200, help="Most references kept per class.")
+        parser.add_argument('--k', type=int, default=3, help="Closest references averaged per decision.")
+        parser.add_argument('--target-recall', type=float, default=0.95)
+        parser.add_argument('--threshold', type=float, default=0.5, help="Softmax cutoff to compare against.")
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--workers', type=int, default=2, help="DataLoader worker processes.")
+        parser.add_argument('--output', default=settings.REFERENCE_INDEX_FILE)
+
+    def handle(self, *args, **options):
+        for option in ('dataset_dir', 'unknown_dir'):
+            if options[option] and not os.path.isdir(options[option]):
+                raise CommandError(f"Not found: {options[option]}")
+        classifier = get_classifier()
+        if classifier is None or classifier.model is None:
+            raise CommandError("The classifier isn't loaded; check models/mobile_model.pth and classes.txt.")
+        class_names = classifier.class_names
+
+        samples, unmatched = evaluation.list_labelled_images(options['dataset_dir'], class_names)
+        for folder in unmatched:
+            self.stderr.write(f"⚠️  {folder} matches no class in classes.txt, skipped")
+        if not samples:
+            raise CommandError("No labelled images found.")
+
+        self.stdout.write(f"Embedding {len(samples)} images...")
+        probabilities, vectors, labels = self._embed(classifier, samples, options)
+        positions = np.zeros(len(labels), dtype=np.int64)
+        for label in np.unique(labels):
+            rows = np.flatnonzero(labels == label)
+            positions[rows] = np.arange(len(rows))
+        held_out = positions % HOLDOUT_EVERY == HOLDOUT_EVERY - 1
+
+        unknown = None
+        if options['unknown_dir']:
+            paths = sorted(p for p in Path(options['unknown_dir']).rglob('*')
+                           if p.suffix.lower() in evaluation.IMAGE_EXTENSIONS)
+            self.stdout.write(f"Embedding {len(paths)} unknown images...")
+            unknown = self._embed(classifier, [(p, 0) for p in paths], options)
+
+        trial = self._build(vectors[~held_out], labels[~held_out], class_names, options, classifier.model_version)
+        self._report(trial, options['threshold'], (probabilities[held_out], vectors[held_out], labels[held_out]), unknown)
+
+        index = self._build(vectors, labels, class_names, options, classifier.model_version)
+        os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+        index.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {len(index.index)} references ({index.index.nbytes / 1e6:.1f} MB) to {options['output']}"))
+
+    def _embed(self, classifier, samples, options):
+        """(softmax probabilities, normalized embeddings, labels) of the readable images."""
+        import torch
+        import torch.nn.functional as F
+        from torch.utils.data import DataLoader
+
+        dataset = evaluation.LabelledImages(samples, classifier.preprocess)
+        loader = DataLoader(dataset, batch_size=options['batch_size'], shuffle=False, num_workers=options['workers'])
+        probabilities, vectors, labels = [], [], []
+        with torch.no_grad():
+            for batch, batch_labels in loader:
+                logits, features = classifier.embed(batch)
+                probabilities.append(F.softmax(logits, dim=1).numpy())
+                vectors.append(normalize(features.numpy()))
+                labels.append(batch_labels.numpy())
+        probabilities, vectors, labels = np.concatenate(probabilities), np.concatenate(vectors), np.concatenate(labels)
+        readable = labels >= 0
+        return probabilities[readable], vectors[readable], labels[readable]
+
+    def _build(self, vectors, labels, class_names, options, model_version):
+        keep = np.zeros(len(labels), dtype=bool)
+        for label in np.unique(labels):
+            keep[np.flatnonzero(labels == label)[:options['per_class']]] = True
+        vectors, labels = vectors[keep], labels[keep]
+        scores = leave_one_out_scores(vectors, labels, len(class_names), options['k'])
+        thresholds = class_thresholds(scores, labels, len(class_names), options['target_recall'])
+        return ReferenceIndex(vectors, labels, thresholds, class_names, model_version, options['k'])
+
+    def _report(self, index, threshold, known, unknown):
+        def decide(probabilities, vectors):
+            predicted = probabilities.argmax(1)
+            by_softmax = probabilities.max(1) >= threshold
+            by_distance = np.array([index.accepts(v, p)[0] for v, p in zip(vectors, predicted)], dtype=bool)
+            return predicted, by_softmax, by_distance
+
+        lines = ["", "  rule                 known: served correctly   unknown: rejected"]
+        rows = {'softmax': [None, None], 'distance': [None, None]}
+        probabilities, vectors, labels = known
+        if len(labels):
+            predicted, by_softmax, by_distance = decide(probabilities, vectors)
+            correct = predicted == labels
+            rows['softmax'][0] = (by_softmax & correct).mean()
+            rows['distance'][0] = (by_distance & correct).mean()
+        if unknown is not None and len(unknown[2]):
+            _, by_softmax, by_distance = decide(unknown[0], unknown[1])
+            rows['softmax'][1] = (~by_softmax).mean()
+            rows['distance'][1] = (~by_distance).mean()
+        for name, label in (('softmax', f"softmax >= {threshold:.2f}"), ('distance', "reference distance")):
+            served, rejected = rows[name]
+            lines.append(f"  {label:<20} {percent(served):>23}   {percent(rejected):>17}")
+        lines.append(f"  ({len(labels)} held-out known images"
+                     + (f", {len(unknown[2])} unknown images)" if unknown is not None else "; no --unknown-dir)"))
+        self.stdout.write("\n".join(lines) + "\n")
@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import evaluation
+from api.evaluation import percent
+from api.ml_inference import build_preprocess
+
+MODELS_DIR = Path(settings.BASE_DIR) / 'models'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures a classifier on a labelled folder (<category>/<object>/*.jpg): "
+        "top-1/top-3 accuracy, per-class confusion, calibration of the Unknown "
+        "confidence cutoff and throughput. Results are saved as JSON with the "
+        "model, data and settings fingerprints, and --compare shows the change "
+        "against an earlier run."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset_dir')
+        parser.add_argument('--model', default=str(MODELS_DIR / 'mobile_model.pth'),
+                            help="State dict (.pth), TorchScript (.pt) or lite (.ptl) model.")
+        parser.add_argument('--classes', default=str(MODELS_DIR / 'classes.txt'))
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--workers', type=int, default=2, help="DataLoader worker processes.")
+        parser.add_argument('--threads', type=int, default=None, help="torch CPU threads (default: torch's choice).")
+        parser.add_argument('--resize', type=int, default=256)
+        parser.add_argument('--crop', type=int, default=224)
+        parser.add_argument('--threshold', type=float, default=0.5,
+                            help="Confidence below which predict() answers Unknown.")
+        parser.add_argument('--output', default=None,
+                            help="Results JSON (default: evaluations/<model>-<time>.json).")
+        parser.add_argument('--compare', default=None, help="Earlier results JSON to compare against.")
+
+    def handle(self, *args, **options):
+        import torch
+
+        for option in ('dataset_dir', 'model', 'classes'):
+            if not os.path.exists(options[option]):
+                raise CommandError(f"Not found: {options[option]}")
+        if options['threads']:
+            torch.set_num_threads(options['threads'])
+
+        with open(options['classes']) as f:
+            class_names = [line.strip() for line in f if line.strip()]
+        samples, unmatched = evaluation.list_labelled_images(options['dataset_dir'], class_names)
+        for folder in unmatched:
+            self.stderr.write(f"⚠️  {folder} matches no class in {options['classes']}, skipped")
+        if not samples:
+            raise CommandError("No labelled images found.")
+
+        model = evaluation.load_model(options['model'])
+        dataset = evaluation.LabelledImages(samples, build_preprocess(options['resize'], options['crop']),
+                                            options['crop'])
+        self.stdout.write(f"Evaluating {options['model']} on {len(samples)} images "
+                          f"({len({label for _, label in samples})} classes)...")
+        probabilities, labels, timings = evaluation.evaluate(model, dataset, options['batch_size'], options['workers'])
+        if probabilities.shape[1] != len(class_names):
+            raise CommandError(f"Model has {probabilities.shape[1]} outputs but {options['classes']} "
+                               f"lists {len(class_names)} classes.")
+        if not (labels >= 0).any():
+            raise CommandError(f"None of the {len(samples)} images could be read.")
+
+        results = evaluation.summarize(probabilities, labels, timings, class_names,
+                                       options['threshold'], options['batch_size'])
+        results['run'] = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'model': options['model'],
+            'model_sha256': evaluation.file_fingerprint(options['model']),
+            'dataset': options['dataset_dir'],
+            'dataset_fingerprint': evaluation.dataset_fingerprint(Path(options['dataset_dir']), samples),
+            'preprocess': {'resize': options['resize'], 'crop': options['crop']},
+            'batch_size': options['batch_size'],
+            'workers': options['workers'],
+            'environment': evaluation.environment(),
+        }
+
+        output = options['output'] or str(
+            Path(settings.BASE_DIR) / 'evaluations' / f"{Path(options['model']).stem}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self._report(results)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self._compare(json.load(f), results)
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {output}"))
+
+    def _report(self, results):
+        throughput = results['throughput']
+        calibration = results['calibration']
+        cutoff = calibration['threshold']
+        lines = [
+            f"  images            {results['images']}" + (f" ({results['unreadable']} unreadable, excluded)"
+                                                           if results['unreadable'] else ""),
+            f"  top-1             {results['top1']:.2%}",
+            f"  top-3             {results['top3']:.2%}",
+            f"  throughput        {throughput['images_per_second']:.1f} images/s end to end, "
+            f"{throughput['model_images_per_second']:.1f} images/s model only "
+            f"(batch {throughput['batch_size']}, p50 {throughput['batch_ms_p50']:.1f} ms/batch)",
+            f"  calibration       ECE {calibration['ece']:.3f}",
+            f"  cutoff {cutoff['threshold']:.2f}       answers {cutoff['coverage']:.1%} of images, "
+            f"{percent(cutoff['accepted_accuracy'])} of them correctly; "
+            f"{percent(cutoff['rejected_correct'])} of the Unknowns were actually right",
+            "",
+            "  threshold  coverage  accepted acc  served acc",
+        ]
+        for row in calibration['sweep']:
+            lines.append(f"  {row['threshold']:9.2f}  {row['coverage']:8.1%}  {percent(row['accepted_accuracy']):>12}"
+                         f"  {row['served_accuracy']:10.1%}")
+        lines += ["", "  class                          support  recall  precision"]
+        for row in results['per_class']:
+            lines.append(f"  {row['class'][:30]:<30} {row['support']:8}  {percent(row['recall']):>6}  {percent(row['precision']):>9}")
+        if results['top_confusions']:
+            lines += ["", "  most confused (true -> predicted)"]
+            lines += [f"  {row['count']:5}  {row['true']} -> {row['predicted']}" for row in results['top_confusions']]
+        self.stdout.write("\n".join(lines))
+
+    def _compare(self, before, after):
+        if before['run']['dataset_fingerprint'] != after['run']['dataset_fingerprint']:
+            self.stderr.write("⚠️  The dataset changed since the earlier run; accuracy is not directly comparable.")
+        if before['run']['preprocess'] != after['run']['preprocess']:
+            self.stdout.write(f"  preprocessing {before['run']['preprocess']} -> {after['run']['preprocess']}")
+        if before['run']['environment'] != after['run']['environment']:
+            self.stdout.write(f"  environment {before['run']['environment']} -> {after['run']['environment']}")
+        rows = [
+            ('top-1', before['top1'], after['top1'], False),
+            ('top-3', before['top3'], after['top3'], False),
+            ('ECE', before['calibration']['ece'], after['calibration']['ece'], False),
+            ('served accuracy', before['calibration']['threshold']['served_accuracy'],
+             after['calibration']['threshold']['served_accuracy'], False),
+            ('images/s', before['throughput']['images_per_second'], after['throughput']['images_per_second'], True),
+            ('model images/s', before['throughput']['model_images_per_second'],
+             after['throughput']['model_images_per_second'], True),
+        ]
+        self.stdout.write(f"\n  compared with {before['run']['model']} ({before['run']['time']})")
+        for name, old, new, is_rate in rows:
+            if is_rate:
+                self.stdout.write(f"  {name:<16} {old:10.1f} -> {new:10.1f}  ({new / old:.2f}x)")
+            else:
+                self.stdout.write(f"  {name:<16} {old:10.4f} -> {new:10.4f}  ({new - old:+.4f})")
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.firebase_auth import get_local_issuer
+from api.loadtest import SCENARIOS, ClientTarget, HttpTarget, Scenario, run
+from api.management.commands.bench_db import format_summary_table, summarize
+from api.models import Student
+
+
+def parse_mix(value):
+    """'classify=2,stats=1' -> {'classify': 2, 'stats': 1}"""
+    try:
+        return {name.strip(): float(weight) for name, weight in (part.split('=') for part in value.split(','))}
+    except ValueError:
+        raise CommandError(f"Invalid --mix {value!r}; expected e.g. classify=2,stats=1")
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a mix of classify, discoveries, dashboard and stats calls as "
+        "the users created by `manage.py seed_loadtest`, and reports throughput "
+        "and latency percentiles per endpoint. The server under test must run "
+        "with CBSEE_AUTH_PROVIDER=local and the same LOCAL_AUTH_KEY_FILE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base API URL of a running server, e.g. http://127.0.0.1:8000/api/v1. "
+                                          "Without it requests go through Django's test client in-process.")
+        parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='mixed')
+        parser.add_argument('--mix', type=parse_mix, help="Custom weights, overriding --scenario.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds to run.")
+        parser.add_argument('--prefix', default='load', help="The --prefix given to seed_loadtest.")
+
+    def handle(self, *args, **options):
+        if not options['url'] and settings.AUTH_PROVIDER != 'local':
+            raise CommandError("In-process runs need CBSEE_AUTH_PROVIDER=local.")
+        weights = options['mix'] or SCENARIOS[options['scenario']]
+        unknown = set(weights) - {'classify', 'discoveries', 'dashboard', 'stats'}
+        if unknown:
+            raise CommandError(f"Unknown calls in --mix: {', '.join(sorted(unknown))}")
+
+        classes = {}
+        for student_id, teacher_id in Student.objects.filter(
+                StudentID__startswith=f"{options['prefix']}-", Teacher__isnull=False).values_list('StudentID', 'Teacher_id'):
+            classes.setdefault(teacher_id, []).append(student_id)
+        if not classes:
+            raise CommandError(f"No seeded users with prefix {options['prefix']!r}; run seed_loadtest first.")
+
+        issuer = get_local_issuer()
+        lifetime = int(options['duration']) + 600
+        scenario = Scenario(classes, lambda uid: issuer.issue(uid, lifetime=lifetime))
+        target = HttpTarget(options['url']) if options['url'] else ClientTarget()
+
+        latencies, errors, elapsed = run(target, scenario, weights, options['concurrency'], options['duration'],
+                                         on_thread_exit=connections.close_all)
+        self.stdout.write(f"Scenario: {options['mix'] and 'custom' or options['scenario']} {weights}, "
+                          f"{options['concurrency']} workers, {elapsed:.1f}s against {options['url'] or 'in-process client'}")
+        self.stdout.write(format_summary_table(
+            [(call, summarize(latencies[call], elapsed, errors[call])) for call in weights]
+        ))
@@ -0,0 +1,140 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Seconds allowed for django.setup() plus loading the URLconf, which is what
+# every management command that isn't about the model pays. Enforced by
+# api.tests.StartupBudgetTests.
+STARTUP_BUDGET_SECONDS = 1.5
+
+# Modules that must not be imported until they are first used.
+HEAVY_MODULES = ['torch', 'torchvision', 'firebase_admin']
+
+# Runs in a fresh interpreter under -X importtime. Marks each phase on stderr
+# so the import lines can be attributed to it, and prints the phase timings
+# and RSS as JSON on stdout.
+PROBE = r'''
+import json, os, sys, time
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+def setup():
+    import django
+    django.setup()
+
+def urlconf():
+    from django.conf import settings
+    __import__(settings.ROOT_URLCONF)
+
+def classifier():
+    from api.ml_inference import get_classifier
+    get_classifier()
+
+phases = [('django.setup', setup), ('urlconf', urlconf)]
+if '--with-model' in sys.argv:
+    phases.append(('classifier', classifier))
+
+results = [{'phase': 'interpreter', 'seconds': 0.0, 'rss_mb': rss_mb(), 'heavy': []}]
+for name, func in phases:
+    sys.stderr.write(f'phase: {name}\n')
+    start = time.perf_counter()
+    func()
+    results.append({
+        'phase': name,
+        'seconds': time.perf_counter() - start,
+        'rss_mb': rss_mb(),
+        'heavy': sorted(m for m in HEAVY if m in sys.modules),
+    })
+print(json.dumps(results))
+'''
+
+
+def profile_startup(with_model=False):
+    """
+    Starts a fresh interpreter and measures each startup phase. Returns
+    (phases, imports): phases is a list of dicts with seconds, rss_mb and the
+    HEAVY_MODULES loaded so far; imports maps each phase to its import tree.
+    """
+    script = f'HEAVY = {HEAVY_MODULES!r}\n' + PROBE
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings'))
+    argv = [sys.executable, '-X', 'importtime', '-c', script] + (['--with-model'] if with_model else [])
+    result = subprocess.run(argv, capture_output=True, text=True, cwd=settings.BASE_DIR, env=env)
+    if result.returncode:
+        raise CommandError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def parse_importtime(output):
+    """
+    Turns -X importtime output into {phase: [node, ...]}, where a node is
+    {'name', 'self_ms', 'total_ms', 'children'}. importtime lists a module
+    after everything it imported, indented by depth.
+    """
+    trees = {}
+    phase = 'interpreter'
+    pending = []
+    for line in output.splitlines():
+        if line.startswith('phase: '):
+            trees[phase] = [node for _, node in pending]
+            phase, pending = line[len('phase: '):], []
+            continue
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, total_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        node = {'name': name.strip(), 'self_ms': int(self_us) / 1000, 'total_ms': int(total_us) / 1000, 'children': []}
+        while pending and pending[-1][0] > depth:
+            node['children'].insert(0, pending.pop()[1])
+        pending.append((depth, node))
+    trees[phase] = [node for _, node in pending]
+    return trees
+
+
+class Command(BaseCommand):
+    help = (
+        "Profiles process startup in a fresh interpreter: time and RSS after "
+        "django.setup(), after loading the URLconf and (with --with-model) "
+        "after loading the classifier, plus the heaviest imports of each phase."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--with-model', action='store_true', help="Also time loading torch and the model.")
+        parser.add_argument('--min-ms', type=float, default=20.0, help="Hide imports faster than this.")
+        parser.add_argument('--depth', type=int, default=3, help="Levels of the import tree to show.")
+
+    def handle(self, *args, **options):
+        phases, imports = profile_startup(options['with_model'])
+        previous_rss = phases[0]['rss_mb']
+        self.stdout.write(f"{'phase':<16}{'seconds':>9}{'RSS MB':>9}{'+MB':>8}  heavy modules loaded")
+        for phase in phases:
+            self.stdout.write(f"{phase['phase']:<16}{phase['seconds']:>9.3f}{phase['rss_mb']:>9.1f}"
+                              f"{phase['rss_mb'] - previous_rss:>8.1f}  {', '.join(phase['heavy']) or '-'}")
+            previous_rss = phase['rss_mb']
+
+        for phase in phases[1:]:
+            self.stdout.write(f"\nImports during {phase['phase']} (cumulative ms):")
+            for node in sorted(imports.get(phase['phase'], []), key=lambda n: -n['total_ms']):
+                self._write_tree(node, 1, options)
+
+        startup = sum(p['seconds'] for p in phases if p['phase'] in ('django.setup', 'urlconf'))
+        style = self.style.SUCCESS if startup <= STARTUP_BUDGET_SECONDS else self.style.ERROR
+        self.stdout.write(style(f"\nStartup without the model: {startup:.3f}s (budget {STARTUP_BUDGET_SECONDS}s)"))
+
+    def _write_tree(self, node, depth, options):
+        if node['total_ms'] < options['min_ms'] or depth > options['depth']:
+            return
+        self.stdout.write(f"{'  ' * depth}{node['name']:<{48 - 2 * depth}}{node['total_ms']:>9.1f}")
+        for child in sorted(node['children'], key=lambda n: -n['total_ms']):
+            self._write_tree(child, depth + 1, options)
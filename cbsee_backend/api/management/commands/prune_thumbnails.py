@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.models import ObjectRecognized
+from api.thumbnails import thumbnail_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes thumbnails that no discovery refers to any more, e.g. after "
+        "archive_recognitions. Run it after each archive run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-hours', type=float, default=24,
+                            help="Keep files younger than this; their discovery may not be written yet.")
+
+    def handle(self, *args, **options):
+        referenced = set(ObjectRecognized.objects.exclude(ImageHash='').values_list('ImageHash', flat=True).distinct())
+        removed, freed = thumbnail_store.prune(referenced, options['min_age_hours'] * 3600)
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} unused thumbnails ({freed / 1e6:.1f} MB) from {settings.THUMBNAIL_DIR}."))
@@ -0,0 +1,89 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.dashboard import invalidate_dashboards
+from api.firebase_auth import get_local_issuer
+from api.models import Object, ObjectRecognized, Student, Teacher
+from api.rollups import rebuild_rollups
+
+SAMPLE_OBJECTS = [
+    ('apple', 'Fruit'), ('banana', 'Fruit'), ('carrot', 'Vegetable'), ('broccoli', 'Vegetable'),
+    ('cat', 'Animal'), ('dog', 'Animal'), ('bird', 'Animal'), ('chair', 'Furniture'),
+    ('table', 'Furniture'), ('book', 'School'), ('pencil', 'School'), ('cup', 'Kitchen'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates load-test teachers, students and discovery history. Users get "
+        "IDs '<prefix>-teacher-N' / '<prefix>-student-N-M', which `manage.py "
+        "loadtest` signs tokens for. Re-running with the same prefix replaces "
+        "their discovery history. Run with CBSEE_AUTH_PROVIDER=local."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='load')
+        parser.add_argument('--teachers', type=int, default=10)
+        parser.add_argument('--students', type=int, default=30, help="Students per teacher.")
+        parser.add_argument('--history', type=int, default=200, help="Discoveries per student.")
+        parser.add_argument('--days', type=int, default=90, help="Spread history over this many days.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        # Creates the shared signing key now rather than racing the server for it.
+        get_local_issuer()
+
+        objects = list(Object.objects.all()[:50])
+        if not objects:
+            objects = Object.objects.bulk_create([
+                Object(ObjectName=name, ObjectDescription=f'A {name}.', ObjectCategory=category)
+                for name, category in SAMPLE_OBJECTS
+            ])
+
+        with transaction.atomic():
+            teachers = Teacher.objects.bulk_create([
+                Teacher(TeacherID=f'{prefix}-teacher-{t}', Name=f'Teacher {t}', Email=f'{prefix}-teacher-{t}@example.com',
+                        School='Load Test School', ContactInfo='')
+                for t in range(options['teachers'])
+            ], ignore_conflicts=True)
+            students = Student.objects.bulk_create([
+                Student(StudentID=f'{prefix}-student-{t}-{s}', Name=f'Student {t}-{s}', GradeLevel='Grade 3',
+                        Email=f'{prefix}-student-{t}-{s}@example.com', Teacher_id=teacher.TeacherID)
+                for t, teacher in enumerate(teachers) for s in range(options['students'])
+            ], ignore_conflicts=True)
+
+        if not students:
+            self.stdout.write("No students to seed history for.")
+            return
+
+        # Students already seeded are kept (ignore_conflicts), their history is not.
+        ObjectRecognized.objects.filter(Student__StudentID__in=[student.StudentID for student in students]).delete()
+
+        # Timestamp is auto_now_add, which overrides any value given to
+        # bulk_create, so each day's rows are inserted and then given their
+        # own times within that day's 9:00-15:00 (none later than now) in one
+        # bulk_update.
+        now = timezone.now()
+        per_day = max(1, len(students) * options['history'] // max(1, options['days']))
+        created = 0
+        for day in range(options['days']):
+            day_start = (now - timedelta(days=day)).replace(hour=9, minute=0, second=0, microsecond=0)
+            rows = ObjectRecognized.objects.bulk_create([
+                ObjectRecognized(Student_id=random.choice(students).StudentID, Object_id=random.choice(objects).ObjectID)
+                for _ in range(per_day)
+            ], batch_size=500)
+            for row in rows:
+                row.Timestamp = min(day_start + timedelta(seconds=random.randrange(6 * 3600)), now)
+            ObjectRecognized.objects.bulk_update(rows, ['Timestamp'], batch_size=500)
+            created += len(rows)
+
+        daily_rows, hourly_rows = rebuild_rollups()
+        invalidate_dashboards(*(teacher.TeacherID for teacher in teachers))
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(teachers)} teachers, {len(students)} students and {created} discoveries "
+            f"({daily_rows} daily / {hourly_rows} hourly rollup rows)."
+        ))
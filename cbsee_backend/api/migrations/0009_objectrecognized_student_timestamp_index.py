@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_student_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='objectrecognized',
+            index=models.Index(fields=['Student', 'Timestamp'], name='api_objrec_student_ts'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_objectrecognized_student_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Hour', models.DateTimeField()),
+                ('ObjectName', models.CharField(max_length=100)),
+                ('Category', models.CharField(max_length=255)),
+                ('Count', models.PositiveIntegerField(default=0)),
+                ('Teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='api.teacher')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Day', models.DateField()),
+                ('Category', models.CharField(max_length=255)),
+                ('Count', models.PositiveIntegerField(default=0)),
+                ('Student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='api.student')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='classhourlyrollup',
+            constraint=models.UniqueConstraint(fields=('Teacher', 'Hour', 'ObjectName'), name='api_class_hourly_rollup_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='studentdailyrollup',
+            constraint=models.UniqueConstraint(fields=('Student', 'Day', 'Category'), name='api_student_daily_rollup_key'),
+        ),
+    ]
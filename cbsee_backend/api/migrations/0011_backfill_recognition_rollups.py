@@ -0,0 +1,47 @@
+from collections import Counter
+
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import TruncDate, TruncHour
+
+
+def backfill(apps, schema_editor):
+    ObjectRecognized = apps.get_model('api', 'ObjectRecognized')
+    StudentDailyRollup = apps.get_model('api', 'StudentDailyRollup')
+    ClassHourlyRollup = apps.get_model('api', 'ClassHourlyRollup')
+
+    daily = Counter()
+    rows = (ObjectRecognized.objects.filter(Timestamp__isnull=False)
+            .annotate(day=TruncDate('Timestamp'))
+            .values_list('Student_id', 'day', 'Object__ObjectCategory')
+            .annotate(n=Count('ID')).order_by())
+    for student_id, day, category, n in rows:
+        daily[(student_id, day, category or 'General')] += n
+    StudentDailyRollup.objects.bulk_create([
+        StudentDailyRollup(Student_id=student_id, Day=day, Category=category, Count=n)
+        for (student_id, day, category), n in daily.items()
+    ], batch_size=500)
+
+    hourly = {}
+    rows = (ObjectRecognized.objects.filter(Timestamp__isnull=False, Student__Teacher__isnull=False)
+            .annotate(hour=TruncHour('Timestamp'))
+            .values_list('Student__Teacher_id', 'hour', 'Object__ObjectName', 'Object__ObjectCategory')
+            .annotate(n=Count('ID')).order_by())
+    for teacher_id, hour, name, category, n in rows:
+        key = (teacher_id, hour, name or 'Unknown')
+        hourly[key] = (category or 'General', hourly.get(key, (None, 0))[1] + n)
+    ClassHourlyRollup.objects.bulk_create([
+        ClassHourlyRollup(Teacher_id=teacher_id, Hour=hour, ObjectName=name, Category=category, Count=n)
+        for (teacher_id, hour, name), (category, n) in hourly.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_recognition_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
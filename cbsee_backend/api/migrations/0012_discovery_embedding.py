@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_backfill_recognition_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscoveryEmbedding',
+            fields=[
+                ('Recognition', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='api.objectrecognized')),
+                ('Vector', models.BinaryField()),
+            ],
+        ),
+    ]
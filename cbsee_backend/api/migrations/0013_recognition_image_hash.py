@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_discovery_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='objectrecognized',
+            name='ImageHash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the uploaded photo; names its thumbnail.', max_length=64),
+        ),
+    ]
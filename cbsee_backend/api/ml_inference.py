@@ -1,16 +1,58 @@
 
 # classifier/ml_inference.py
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
+# torch and torchvision are imported on first use (get_classifier), not at
+# import time, so management commands and workers that never classify an
+# image don't pay for them.
 from PIL import Image
 import io
 from pathlib import Path
 import logging
-import torch.nn.functional as F
+import hashlib
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Width of the first classifier layer's input identifies the MobileNetV3 variant.
+ARCHITECTURES = {
+    960: 'mobilenet_v3_large',
+    576: 'mobilenet_v3_small',
+}
+
+
+def build_preprocess(resize=256, crop=224):
+    """The image transform the classifier was trained with (ImageNet normalization)."""
+    from torchvision import transforms
+
+    return transforms.Compose([
+        transforms.Resize(resize),
+        transforms.CenterCrop(crop),
+        transforms.ToTensor(),
+        transforms.Normalize(
+            mean=[0.485, 0.456, 0.406],
+            std=[0.229, 0.224, 0.225]
+        ),
+    ])
+
+
+def build_model(state_dict):
+    """
+    Recreates the MobileNetV3 (large or small, read from the weights) a
+    state dict was trained as, loads it and sets eval mode.
+    """
+    import torch.nn as nn
+    from torchvision import models
+
+    in_features = state_dict['classifier.0.weight'].shape[1]
+    num_classes = state_dict['classifier.3.weight'].shape[0]
+    if in_features not in ARCHITECTURES:
+        raise ValueError(f"Unknown MobileNetV3 variant: classifier input width {in_features}")
+    model = getattr(models, ARCHITECTURES[in_features])(weights=None)
+    model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model
+
+
 class ImageClassifier:
     """A singleton class to load and run the PyTorch model."""
     
@@ -22,12 +64,16 @@ class ImageClassifier:
             cls._instance.model = None
             cls._instance.class_names = []
             cls._instance.preprocess = None
+            cls._instance.model_version = None
+            cls._instance.reference_index = None
             cls._instance._load_model()
         return cls._instance
 
     def _load_model(self):
         """Internal method to load the model and class names."""
         try:
+            import torch
+
             base_dir = Path(__file__).resolve().parent.parent
             model_path = base_dir / 'models' / 'mobile_model.pth'
             classes_path = base_dir / 'models' / 'classes.txt'
@@ -48,29 +94,28 @@ class ImageClassifier:
             num_classes = len(self.class_names)
             logger.info(f"✅ Found {num_classes} classes: {self.class_names}")
 
-            # Recreate the model structure
-            self.model = models.mobilenet_v3_large(pretrained=False)
-            num_ftrs = self.model.classifier[-1].in_features
-            self.model.classifier[-1] = nn.Linear(num_ftrs, num_classes)
-            
-            # Load the trained weights and set to eval mode
-            self.model.load_state_dict(
+            # Recreate the model structure, load the trained weights and set to eval mode
+            self.model = build_model(
                 torch.load(model_path, map_location=torch.device('cpu'), weights_only=True)
             )
-            self.model.eval()
+            if self.model.classifier[-1].out_features != num_classes:
+                raise ValueError(f"Model has {self.model.classifier[-1].out_features} outputs "
+                                 f"but classes.txt lists {num_classes} classes")
             logger.info("✅ PyTorch Model loaded and in eval mode.")
 
+            # Identifies the weights + class list, so caches built from them
+            # (e.g. the Object catalog) can tell when the model was replaced.
+            stat = model_path.stat()
+            fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}:{','.join(self.class_names)}"
+            self.model_version = hashlib.sha1(fingerprint.encode()).hexdigest()[:12]
+
             # Define preprocessing transformations
-            self.preprocess = transforms.Compose([
-                transforms.Resize(256),
-                transforms.CenterCrop(224),
-                transforms.ToTensor(),
-                transforms.Normalize(
-                    mean=[0.485, 0.456, 0.406], 
-                    std=[0.229, 0.224, 0.225]
-                ),
-            ])
+            self.preprocess = build_preprocess()
             logger.info("✅ Image preprocessing pipeline initialized.")
+
+            # Reference embeddings for distance-based Unknown detection, if built for this model
+            from .embeddings import load_reference_index
+            self.reference_index = load_reference_index(self.model_version)
             
         except FileNotFoundError as e:
             logger.error(f"❌ File error during model loading: {e}")
@@ -122,6 +167,21 @@ class ImageClassifier:
     #         logger.error(f"❌ Error during prediction: {e}")
     #         return None
 
+    def embed(self, batch):
+        """Logits and pooled feature vectors (the classifier's input) for a preprocessed batch."""
+        import torch
+
+        features = torch.flatten(self.model.avgpool(self.model.features(batch)), 1)
+        return self.model.classifier(features), features
+
+    def shrink(self, image):
+        """
+        The first preprocessing step (short side resized to 256) on its own.
+        Preprocessing its result gives the same input, so callers that want
+        the smaller image too can run it once.
+        """
+        return self.preprocess.transforms[0](image)
+
     def predict(self, image_file, confidence_threshold=0.5):
         """
         Takes an uploaded image file, preprocesses it, and returns the prediction
@@ -136,52 +196,117 @@ class ImageClassifier:
                    or ("Unknown", confidence_score) if the confidence is below the threshold.
                    Returns (None, None) if prediction fails.
         """
-        try:
-            if not self.model or not self.preprocess:
-                logger.error("Model not initialized")
-                return None, None
+        return self.predict_with_embedding(image_file, confidence_threshold)[:2]
+
+    def predict_with_embedding(self, image_file, confidence_threshold=0.5):
+        """
+        Like predict(), and also returns the image's embedding: its pooled
+        feature vector, L2-normalized, as a float16 numpy array.
 
-            # Open and preprocess the image
-            image_bytes = image_file.read()
+        When a reference index is loaded, "Unknown" means the image is too
+        far from the reference images of the predicted class, instead of the
+        softmax confidence being below confidence_threshold.
 
-            if not image_bytes:
-                logger.error("Empty image file received")
-                return None, None
+        Returns:
+            tuple: (class name or "Unknown", confidence, embedding), or (None, None, None) if prediction fails.
+        """
+        image, _ = read_image(image_file)
+        if image is None:
+            return None, None, None
+        return self.predict_image(image, confidence_threshold)
 
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    def predict_image(self, image, confidence_threshold=0.5):
+        """predict_with_embedding() for an already decoded RGB PIL image."""
+        try:
+            import torch
+            import torch.nn.functional as F
+            from .embeddings import normalize
+
+            if not self.model or not self.preprocess:
+                logger.error("Model not initialized")
+                return None, None, None
 
             input_tensor = self.preprocess(image)
             input_batch = input_tensor.unsqueeze(0)
 
             # Run inference
             with torch.no_grad():
-                output = self.model(input_batch)
+                output, features = self.embed(input_batch)
 
                 # Get probabilities and the highest confidence score
                 probabilities = F.softmax(output, dim=1)
                 confidence, predicted_idx = torch.max(probabilities, 1)
                 confidence_score = confidence.item()
+            embedding = normalize(features[0].numpy())
 
-            # Check if confidence is below the threshold
-            if confidence_score < confidence_threshold:
+            # Check if the image is close enough to the class (or confident enough)
+            if self.reference_index is not None:
+                accepted, distance_score = self.reference_index.accepts(embedding, predicted_idx.item())
+                reason = f"similarity to {self.class_names[predicted_idx.item()]} references ({distance_score})"
+            else:
+                accepted = confidence_score >= confidence_threshold
+                reason = f"confidence ({confidence_score:.2f}) is below the threshold ({confidence_threshold})"
+            if not accepted:
                 predicted_class = "Unknown"
-                logger.info(f"🤔 Prediction confidence ({confidence_score:.2f}) is below the threshold ({confidence_threshold}). Returning 'Unknown'.")
+                logger.info(f"🤔 Prediction {reason} too low. Returning 'Unknown'.")
             else:
                 predicted_class = self.class_names[predicted_idx.item()]
                 logger.info(f"✅ Prediction: {predicted_class} with confidence {confidence_score:.2f}")
 
-            return predicted_class, confidence_score
+            return predicted_class, confidence_score, embedding
 
-        except Image.UnidentifiedImageError:
-            logger.error("Invalid image file format")
-            return None, None
         except Exception as e:
             logger.error(f"❌ Error during prediction: {e}")
-            return None, None
-# Instantiate the classifier once when the module is loaded
-# This ensures the model is loaded into memory only once when the server starts.
-try:
-    classifier_instance = ImageClassifier()
-except Exception as e:
-    logger.error(f"Failed to initialize classifier: {e}")
-    classifier_instance = None
\ No newline at end of file
+            return None, None, None
+
+
+def read_image(image_file):
+    """
+    The uploaded image decoded to RGB, and the SHA-256 hex digest of its
+    bytes (the key of its thumbnail). (None, None) if it can't be decoded.
+    """
+    image_bytes = image_file.read()
+    if not image_bytes:
+        logger.error("Empty image file received")
+        return None, None
+    try:
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    except Image.UnidentifiedImageError:
+        logger.error("Invalid image file format")
+        return None, None
+    except Exception as e:
+        logger.error(f"❌ Error reading image: {e}")
+        return None, None
+    return image, hashlib.sha256(image_bytes).hexdigest()
+
+
+_classifier = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """
+    Returns the shared ImageClassifier, loading torch and the model on the
+    first call. Returns None if the model could not be loaded.
+    Servers call this at startup (see backend/wsgi.py) so the first request
+    doesn't pay for the load.
+    """
+    global _classifier, _classifier_loaded
+    if not _classifier_loaded:
+        with _classifier_lock:
+            if not _classifier_loaded:
+                try:
+                    _classifier = ImageClassifier()
+                    # Reconcile the Object catalog with this model's classes on next use
+                    from .catalog import object_catalog
+                    object_catalog.invalidate()
+                except Exception as e:
+                    logger.error(f"Failed to initialize classifier: {e}")
+                _classifier_loaded = True
+    return _classifier
+
+
+def loaded_classifier():
+    """The classifier if it has already been loaded, without loading it."""
+    return _classifier
@@ -61,6 +61,55 @@ class ObjectRecognized(models.Model):
     Student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='recognized_objects')
     Object = models.ForeignKey(Object, on_delete=models.SET_NULL, null=True, related_name='recognized_instances')
     Timestamp = models.DateTimeField(auto_now_add=True, help_text="The date and time this object was recognized.", null=True)
+    ImageHash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the uploaded photo; names its thumbnail.")
+
+    class Meta:
+        indexes = [
+            # Per-student history and the ETag lookup.
+            models.Index(fields=['Student', 'Timestamp'], name='api_objrec_student_ts'),
+        ]
 
     def __str__(self):
         return f"{self.Object.ObjectName} -- {self.Student.Name}"
+
+
+class StudentDailyRollup(models.Model):
+    """Discoveries per student, day and category, kept up to date as they are recorded."""
+    Student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='daily_rollups')
+    Day = models.DateField()
+    Category = models.CharField(max_length=255)
+    Count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['Student', 'Day', 'Category'], name='api_student_daily_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.Student_id} {self.Day} {self.Category}: {self.Count}"
+
+
+class ClassHourlyRollup(models.Model):
+    """Discoveries per teacher's class, hour and object, kept up to date as they are recorded."""
+    Teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name='hourly_rollups')
+    Hour = models.DateTimeField()
+    ObjectName = models.CharField(max_length=100)
+    Category = models.CharField(max_length=255)
+    Count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['Teacher', 'Hour', 'ObjectName'], name='api_class_hourly_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.Teacher_id} {self.Hour} {self.ObjectName}: {self.Count}"
+
+
+class DiscoveryEmbedding(models.Model):
+    """The classifier's feature vector for a discovery's image (float16 bytes, see api/embeddings.py)."""
+    Recognition = models.OneToOneField(ObjectRecognized, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    Vector = models.BinaryField()
+
+    def __str__(self):
+        return f"Embedding of discovery {self.Recognition_id}"
@@ -0,0 +1,174 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .models import DiscoveryEmbedding, Object, ObjectRecognized, Student
+from .signals import recognitions_recorded
+
+logger = logging.getLogger(__name__)
+
+
+def new_recognition(student_id, object_id, embedding=None, image_hash=''):
+    """An unsaved ObjectRecognized; `embedding` (bytes) is stored with it by write_recognitions."""
+    recognition = ObjectRecognized(Student_id=student_id, Object_id=object_id, ImageHash=image_hash)
+    recognition.pending_embedding = embedding
+    recognition.failed_writes = 0
+    return recognition
+
+
+def _dead_letter(recognitions, reason):
+    """Logs discoveries that are given up on, so they can be recovered from the log."""
+    for rec in recognitions:
+        logger.error(f"❌ Dropped discovery of object {rec.Object_id} by student {rec.Student_id} "
+                     f"(image {rec.ImageHash[:12] or '-'}): {reason}")
+
+
+def write_recognitions(recognitions):
+    """Insert a batch of ObjectRecognized rows (and their embeddings) in one transaction."""
+    if not recognitions:
+        return []
+    with transaction.atomic():
+        created = ObjectRecognized.objects.bulk_create(recognitions)
+        DiscoveryEmbedding.objects.bulk_create([
+            DiscoveryEmbedding(Recognition_id=rec.pk, Vector=rec.pending_embedding)
+            for rec in created if getattr(rec, 'pending_embedding', None) is not None
+        ])
+        recognitions_recorded.send(sender=ObjectRecognized, recognitions=created)
+    return created
+
+
+class RecognitionBuffer:
+    """
+    Collects discoveries in memory and writes them with a single bulk_create.
+
+    A flush is triggered once ``max_size`` events are pending, or at the latest
+    ``interval`` seconds after the previous one, so stats and dashboards see a
+    new discovery within ``interval`` seconds. Whatever is still pending is
+    flushed when the process exits. Timestamps are taken when the batch is
+    written, not when the event was queued.
+
+    A batch that fails to write is put back for the next flush. Discoveries
+    that have failed ``max_attempts`` writes, and the oldest ones once more
+    than ``max_pending`` are waiting, are logged and dropped, so a row the
+    database keeps rejecting can't hold the buffer (and memory) forever.
+    """
+
+    def __init__(self, max_size=50, interval=2.0, max_attempts=5, max_pending=5000):
+        self.max_size = max_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, student_id, object_id, embedding=None, image_hash=''):
+        with self._lock:
+            self._pending.append(new_recognition(student_id, object_id, embedding, image_hash))
+            full = len(self._pending) >= self.max_size
+            if self._thread is None:
+                # Started lazily so management commands never spawn a flusher.
+                self._thread = threading.Thread(target=self._run, name='recognition-buffer', daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write all pending events now. Returns the number of rows inserted."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            close_old_connections()
+            try:
+                try:
+                    return len(write_recognitions(batch))
+                except IntegrityError:
+                    # A student or object was deleted while one of their
+                    # discoveries was pending; drop those rows and keep the rest.
+                    batch = self._drop_orphans(batch)
+                    return len(write_recognitions(batch))
+            except Exception as e:
+                # Put the batch back so a transient error (e.g. a locked
+                # database) does not lose discoveries.
+                for rec in batch:
+                    rec.failed_writes += 1
+                _dead_letter([rec for rec in batch if rec.failed_writes >= self.max_attempts],
+                             f"{self.max_attempts} failed writes, last: {e}")
+                with self._lock:
+                    self._pending[:0] = [rec for rec in batch if rec.failed_writes < self.max_attempts]
+                    overflow = len(self._pending) - self.max_pending
+                    if overflow > 0:
+                        dropped, self._pending = self._pending[:overflow], self._pending[overflow:]
+                if overflow > 0:
+                    _dead_letter(dropped, f"more than {self.max_pending} discoveries waiting")
+                raise
+
+    @staticmethod
+    def _drop_orphans(batch):
+        student_ids = {rec.Student_id for rec in batch}
+        object_ids = {rec.Object_id for rec in batch if rec.Object_id is not None}
+        students = set(Student.objects.filter(StudentID__in=student_ids).values_list('StudentID', flat=True))
+        objects = set(Object.objects.filter(ObjectID__in=object_ids).values_list('ObjectID', flat=True))
+        keep = [rec for rec in batch if rec.Student_id in students and (rec.Object_id is None or rec.Object_id in objects)]
+        if len(keep) < len(batch):
+            logger.warning(f"⚠️ Skipped {len(batch) - len(keep)} pending discoveries whose student or object was deleted")
+        return keep
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"❌ Could not flush {self.pending()} pending discoveries on shutdown: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Error flushing discoveries: {e}")
+
+
+# Set by install() when RECOGNITION_WRITE_BEHIND is enabled.
+buffer_instance = None
+
+
+def install():
+    global buffer_instance
+    if buffer_instance is not None or not getattr(settings, 'RECOGNITION_WRITE_BEHIND', False):
+        return
+    buffer_instance = RecognitionBuffer(
+        max_size=getattr(settings, 'RECOGNITION_FLUSH_SIZE', 50),
+        interval=getattr(settings, 'RECOGNITION_FLUSH_INTERVAL', 2.0),
+        max_attempts=getattr(settings, 'RECOGNITION_FLUSH_ATTEMPTS', 5),
+        max_pending=getattr(settings, 'RECOGNITION_MAX_PENDING', 5000),
+    )
+    atexit.register(buffer_instance.close)
+    logger.info("✅ Write-behind buffering of discoveries enabled.")
+
+
+def record_recognition(student_id, object_id, embedding=None, image_hash=''):
+    """Store a discovery, through the write-behind buffer when it is enabled."""
+    if buffer_instance is not None:
+        buffer_instance.add(student_id, object_id, embedding, image_hash)
+    else:
+        write_recognitions([new_recognition(student_id, object_id, embedding, image_hash)])
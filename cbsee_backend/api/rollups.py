@@ -0,0 +1,216 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .archive import RecognitionArchive
+from .catalog import object_catalog
+from .models import ClassHourlyRollup, Object, ObjectRecognized, Student, StudentDailyRollup
+from .signals import recognitions_recorded
+
+
+def _day(timestamp):
+    return timezone.localtime(timestamp).date()
+
+
+def _hour(timestamp):
+    return timezone.localtime(timestamp).replace(minute=0, second=0, microsecond=0)
+
+
+def _increment(model, counts):
+    """Adds each count to its rollup row, creating the row if needed."""
+    for key, count in counts.items():
+        fields = dict(key)
+        if model.objects.filter(**fields).update(Count=F('Count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(Count=count, **fields)
+        except IntegrityError:
+            # Created concurrently by another writer.
+            model.objects.filter(**fields).update(Count=F('Count') + count)
+
+
+def _decrement(model, counts):
+    """Subtracts each count from its rollup row, removing rows that reach zero."""
+    for key, count in counts.items():
+        fields = dict(key)
+        model.objects.filter(Count__gte=count, **fields).update(Count=F('Count') - count)
+        model.objects.filter(Count=0, **fields).delete()
+
+
+def _rollup_counts(recognitions):
+    daily = Counter()
+    hourly = Counter()
+    student_ids = {rec.Student_id for rec in recognitions}
+    teachers = dict(Student.objects.filter(StudentID__in=student_ids).values_list('StudentID', 'Teacher_id'))
+    for rec in recognitions:
+        if rec.Timestamp is None:
+            continue
+        obj = object_catalog.by_id(rec.Object_id) if rec.Object_id else None
+        category = (obj.ObjectCategory if obj else None) or 'General'
+        daily[(('Student_id', rec.Student_id), ('Day', _day(rec.Timestamp)), ('Category', category))] += 1
+        teacher_id = teachers.get(rec.Student_id)
+        if teacher_id:
+            name = obj.ObjectName if obj else 'Unknown'
+            hourly[(('Teacher_id', teacher_id), ('Hour', _hour(rec.Timestamp)), ('ObjectName', name), ('Category', category))] += 1
+    return daily, hourly
+
+
+def apply_recognitions(recognitions):
+    daily, hourly = _rollup_counts(recognitions)
+    _increment(StudentDailyRollup, daily)
+    _increment(ClassHourlyRollup, hourly)
+
+
+def remove_recognitions(recognitions):
+    daily, hourly = _rollup_counts(recognitions)
+    _decrement(StudentDailyRollup, daily)
+    _decrement(ClassHourlyRollup, hourly)
+
+
+_archiving = threading.local()
+
+
+@contextmanager
+def archiving():
+    """
+    Rows deleted inside this block are being moved to the archive, so the
+    rollups keep counting them. Any other deletion is subtracted.
+    """
+    _archiving.active = True
+    try:
+        yield
+    finally:
+        _archiving.active = False
+
+
+@receiver(recognitions_recorded)
+def _recognitions_recorded(sender, recognitions, **kwargs):
+    # Runs inside the insert transaction, so rollups and raw rows never disagree.
+    apply_recognitions(recognitions)
+
+
+@receiver(post_delete, sender=ObjectRecognized)
+def _recognition_deleted(sender, instance, **kwargs):
+    if not getattr(_archiving, 'active', False):
+        remove_recognitions([instance])
+
+
+@receiver(pre_save, sender=Object)
+def _remember_object_fields(sender, instance, **kwargs):
+    instance._rollup_fields = (Object.objects.filter(pk=instance.pk).values_list('ObjectName', 'ObjectCategory').first()
+                               if instance.pk else None)
+
+
+@receiver([post_save, post_delete], sender=Object)
+def _object_changed(sender, instance, **kwargs):
+    # Rollups are keyed by the name and category at the time of discovery. A
+    # renamed or recategorized Object (or a deleted one, whose discoveries
+    # become "General") changes them for every past discovery, so recount.
+    # Archived records keep the values they were archived with.
+    if kwargs.get('signal') is post_save:
+        if kwargs.get('created') or instance._rollup_fields == (instance.ObjectName, instance.ObjectCategory):
+            return
+        if not ObjectRecognized.objects.filter(Object=instance).exists():
+            return
+    transaction.on_commit(rebuild_rollups)
+
+
+def rebuild_rollups():
+    """
+    Recomputes both rollup tables from ObjectRecognized and the recognition
+    archive. Class rollups are attributed to each student's current teacher.
+    Returns the row counts.
+    """
+    daily = Counter()
+    rows = (ObjectRecognized.objects.filter(Timestamp__isnull=False)
+            .annotate(day=TruncDate('Timestamp'))
+            .values_list('Student_id', 'day', 'Object__ObjectCategory')
+            .annotate(n=Count('ID')).order_by())
+    for student_id, day, category, n in rows:
+        daily[(student_id, day, category or 'General')] += n
+
+    hourly = Counter()
+    rows = (ObjectRecognized.objects.filter(Timestamp__isnull=False, Student__Teacher__isnull=False)
+            .annotate(hour=TruncHour('Timestamp'))
+            .values_list('Student__Teacher_id', 'hour', 'Object__ObjectName', 'Object__ObjectCategory')
+            .annotate(n=Count('ID')).order_by())
+    for teacher_id, hour, name, category, n in rows:
+        hourly[(teacher_id, hour, name or 'Unknown', category or 'General')] += n
+
+    teachers = dict(Student.objects.filter(Teacher__isnull=False).values_list('StudentID', 'Teacher_id'))
+    students = set(Student.objects.values_list('StudentID', flat=True))
+    for record in RecognitionArchive().iter_records():
+        if not record['timestamp'] or record['student_id'] not in students:
+            continue
+        # parse_datetime, unlike datetime.fromisoformat before Python 3.11, accepts the trailing Z
+        timestamp = parse_datetime(record['timestamp'])
+        daily[(record['student_id'], _day(timestamp), record['category'] or 'General')] += 1
+        teacher_id = teachers.get(record['student_id'])
+        if teacher_id:
+            hourly[(teacher_id, _hour(timestamp), record['object_name'] or 'Unknown', record['category'] or 'General')] += 1
+
+    with transaction.atomic():
+        StudentDailyRollup.objects.all().delete()
+        ClassHourlyRollup.objects.all().delete()
+        StudentDailyRollup.objects.bulk_create([
+            StudentDailyRollup(Student_id=student_id, Day=day, Category=category, Count=n)
+            for (student_id, day, category), n in daily.items()
+        ], batch_size=500)
+        # The same object name can appear under two categories if it was
+        # renamed; the unique key is on the name, so merge those.
+        merged = {}
+        for (teacher_id, hour, name, category), n in hourly.items():
+            key = (teacher_id, hour, name)
+            merged[key] = (category, merged.get(key, (category, 0))[1] + n)
+        ClassHourlyRollup.objects.bulk_create([
+            ClassHourlyRollup(Teacher_id=teacher_id, Hour=hour, ObjectName=name, Category=category, Count=n)
+            for (teacher_id, hour, name), (category, n) in merged.items()
+        ], batch_size=500)
+    return len(daily), len(merged)
+
+
+def class_analytics(teacher_id, start, end, top=10):
+    """
+    Per-day trend, top objects and category mix for a teacher's class between
+    two dates (inclusive). Reads only ClassHourlyRollup rows, so the cost
+    follows the length of the range, not the number of discoveries.
+    """
+    tz = timezone.get_current_timezone()
+    start_at = timezone.make_aware(datetime.combine(start, time.min), tz)
+    end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+    rows = ClassHourlyRollup.objects.filter(Teacher_id=teacher_id, Hour__gte=start_at, Hour__lt=end_at)
+
+    per_day = dict(rows.annotate(day=TruncDate('Hour')).values_list('day').annotate(n=Sum('Count')).order_by())
+    daily = []
+    day = start
+    while day <= end:
+        daily.append({'date': day.isoformat(), 'count': per_day.get(day, 0)})
+        day += timedelta(days=1)
+
+    total = sum(per_day.values())
+    top_objects = [
+        {'name': name, 'category': category, 'count': n}
+        for name, category, n in rows.values_list('ObjectName', 'Category').annotate(n=Sum('Count')).order_by('-n', 'ObjectName')[:top]
+    ]
+    category_mix = {
+        category: n / total
+        for category, n in rows.values_list('Category').annotate(n=Sum('Count')).order_by('Category')
+    } if total else {}
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total_discoveries': total,
+        'daily': daily,
+        'top_objects': top_objects,
+        'category_mix': category_mix,
+    }
@@ -0,0 +1,90 @@
+import csv
+import io
+
+from django.db import transaction
+
+from .dashboard import invalidate_dashboards
+from .identity import identity_resolver
+from .models import Student
+
+# Keeps the Email__in lookup under SQLite's bound-parameter limit.
+MAX_ROSTER_SIZE = 500
+
+
+def parse_roster_csv(uploaded_file):
+    """
+    Reads emails from an uploaded CSV. Uses the "email" column when the file
+    has a header row, otherwise the first column.
+    """
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', errors='replace')
+    rows = [row for row in csv.reader(text) if row]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if 'email' in header:
+        column = header.index('email')
+        rows = rows[1:]
+    else:
+        column = 0
+    return [row[column] if column < len(row) else '' for row in rows]
+
+
+def enroll_students(teacher_id, emails):
+    """
+    Assigns every unassigned student in ``emails`` to the teacher.
+
+    Students are resolved with one Email__in query and assigned with one
+    UPDATE inside a transaction. Students already assigned to another teacher
+    are reported, not moved. Returns one result per input row, in order.
+    ``emails`` must be strings (the view rejects anything else).
+    """
+    emails = [email.strip() for email in emails]
+    wanted = [email for email in dict.fromkeys(emails) if email]
+
+    with transaction.atomic():
+        found = {
+            email: (student_id, current_teacher)
+            for email, student_id, current_teacher in Student.objects.select_for_update()
+            .filter(Email__in=wanted).values_list('Email', 'StudentID', 'Teacher_id')
+        }
+        to_assign = [student_id for student_id, current_teacher in found.values() if current_teacher is None]
+        assigned = set()
+        if to_assign:
+            updated = Student.objects.filter(StudentID__in=to_assign, Teacher__isnull=True).update(Teacher_id=teacher_id)
+            if updated == len(to_assign):
+                assigned = set(to_assign)
+            else:
+                # A concurrent enrollment (SQLite has no row locks) took some
+                # of them first; report where each student actually is now.
+                current = dict(Student.objects.filter(StudentID__in=to_assign).values_list('StudentID', 'Teacher_id'))
+                assigned = {student_id for student_id, current_teacher in current.items() if current_teacher == teacher_id}
+                # Students deleted in the meantime drop out and are reported as unknown.
+                found = {email: (student_id, current.get(student_id, current_teacher))
+                         for email, (student_id, current_teacher) in found.items()
+                         if current_teacher is not None or student_id in current}
+
+    # update() skips model signals, so drop the cached views of these rows here.
+    if to_assign:
+        identity_resolver.invalidate(*to_assign)
+        invalidate_dashboards(teacher_id)
+
+    results = []
+    seen = set()
+    for row, email in enumerate(emails, 1):
+        if not email:
+            result = 'empty'
+        elif email in seen:
+            result = 'duplicate'
+        elif email not in found:
+            result = 'unknown'
+        else:
+            student_id, current_teacher = found[email]
+            if student_id in assigned:
+                result = 'added'
+            elif current_teacher == teacher_id:
+                result = 'already_enrolled'
+            else:
+                result = 'assigned_to_other_teacher'
+        seen.add(email)
+        results.append({'row': row, 'email': email, 'status': result})
+    return results
@@ -1,5 +1,7 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Object, ObjectRecognized
+from .thumbnails import thumbnail_url
 
 class ImageUploadSerializer(serializers.Serializer):
     image = serializers.ImageField(required=True)
@@ -10,8 +12,8 @@ class DiscoverySerializer(serializers.ModelSerializer):
     category = serializers.CharField(source='Object.ObjectCategory')
     discoveredDate = serializers.DateTimeField(source='Timestamp')
     
-    # We don't have images in DB yet, but we can send an empty field 
-    # or handle it in Frontend (which we did in DiscoveryItem.fromJson)
+    # Thumbnail of the photo, or "" for discoveries recorded without one
+    # (the frontend shows a placeholder, see DiscoveryItem.fromJson)
     imageUrl = serializers.SerializerMethodField()
 
     class Meta:
@@ -19,4 +21,24 @@ class DiscoverySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'category', 'discoveredDate', 'imageUrl')
 
     def get_imageUrl(self, obj):
-        return ""
\ No newline at end of file
+        return thumbnail_url(obj.ImageHash)
+
+def _discovered_date(value):
+    # Mirrors DateTimeField.to_representation with the default ISO 8601 format.
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def discovery_rows(queryset):
+    """
+    Same data as DiscoverySerializer(queryset, many=True).data, built from
+    values_list() tuples instead of a serializer and model instance per row.
+    """
+    return [
+        {'id': pk, 'name': name, 'category': category, 'discoveredDate': _discovered_date(timestamp), 'imageUrl': thumbnail_url(image_hash)}
+        for pk, name, category, timestamp, image_hash in queryset.values_list('ID', 'Object__ObjectName', 'Object__ObjectCategory', 'Timestamp', 'ImageHash')
+    ]
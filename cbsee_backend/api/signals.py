@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent with ``recognitions=[ObjectRecognized, ...]`` once a batch of discoveries
+# has been inserted. It fires inside the insert transaction, so receivers that
+# touch anything outside the database (caches, live feeds) should defer that
+# work with ``transaction.on_commit``.
+recognitions_recorded = Signal()
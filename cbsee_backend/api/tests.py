@@ -1,3 +1,722 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.db.models import QuerySet, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import evaluation
+from .catalog import object_catalog
+from .dashboard import build_dashboard, render_dashboard
+from .embeddings import (
+    DiscoveryIndex, EmbeddingIndex, ReferenceIndex, class_thresholds, leave_one_out_scores, normalize,
+)
+from .events import InProcessBroker, teacher_channel
+from .firebase_auth import (
+    InvalidTokenError, LocalTokenIssuer, PublicKeyStore, TokenVerifier, VerifiedTokenCache,
+)
+from .identity import Identity, identity_resolver
+from .management.commands.profile_startup import STARTUP_BUDGET_SECONDS, profile_startup
+from .ml_inference import get_classifier
+from .models import ClassHourlyRollup, Object, ObjectRecognized, Student, StudentDailyRollup, Teacher
+from .recognition_buffer import RecognitionBuffer, record_recognition
+from .rollups import rebuild_rollups
+from .roster import enroll_students
+from .renderers import FastJSONRenderer
+from .serializers import DiscoverySerializer, discovery_rows
+from .thumbnails import byte_range, thumbnail_store
+
+
+def _png_bytes():
+    from io import BytesIO
+
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), 'blue').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+PNG_BYTES = _png_bytes()
+
+
+class ApiTestCase(TestCase):
+    """Signs requests with a local issuer in place of Firebase."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.issuer = LocalTokenIssuer('test-project')
+
+    def setUp(self):
+        cache.clear()
+        verifier = TokenVerifier('test-project', PublicKeyStore(self.issuer.fetch), VerifiedTokenCache())
+        patcher = mock.patch('api.firebase_auth._verifier', verifier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def auth(self, uid):
+        return {'HTTP_AUTHORIZATION': 'Bearer ' + self.issuer.issue(uid)}
+
+
+class TokenVerifierTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.issuer = LocalTokenIssuer('test-project')
+
+    def setUp(self):
+        self.fetch = mock.Mock(side_effect=self.issuer.fetch)
+        self.verifier = TokenVerifier('test-project', PublicKeyStore(self.fetch), VerifiedTokenCache(max_size=2))
+
+    def test_verifies_locally_issued_token(self):
+        claims = self.verifier.verify(self.issuer.issue('student-1', email='s@example.com'))
+        self.assertEqual(claims['uid'], 'student-1')
+        self.assertEqual(claims['email'], 's@example.com')
+
+    def test_repeated_token_skips_signature_check(self):
+        token = self.issuer.issue('student-1')
+        self.verifier.verify(token)
+        with mock.patch('api.firebase_auth.jwt.decode') as decode:
+            self.assertEqual(self.verifier.verify(token)['uid'], 'student-1')
+        decode.assert_not_called()
+        self.fetch.assert_called_once()
+
+    def test_cache_is_bounded(self):
+        for uid in ('a', 'b', 'c'):
+            self.verifier.verify(self.issuer.issue(uid))
+        self.assertEqual(len(self.verifier.cache._entries), 2)
+
+    def test_rejects_expired_token(self):
+        with self.assertRaises(InvalidTokenError):
+            self.verifier.verify(self.issuer.issue('student-1', lifetime=-10))
+
+    def test_rejects_other_project_and_other_key(self):
+        with self.assertRaises(InvalidTokenError):
+            self.verifier.verify(LocalTokenIssuer('other-project').issue('student-1'))
+        with self.assertRaises(InvalidTokenError):
+            self.verifier.verify(LocalTokenIssuer('test-project', key_id='rotated').issue('student-1'))
+
+
+class StartupBudgetTests(SimpleTestCase):
+    def test_startup_without_model_is_light(self):
+        phases = {phase['phase']: phase for phase in profile_startup()[0]}
+        # Heavy dependencies are loaded on first use, not by settings or views.
+        self.assertEqual(phases['urlconf']['heavy'], [])
+        startup = phases['django.setup']['seconds'] + phases['urlconf']['seconds']
+        # Wall-clock time depends on the machine's load, so a busy test run gets
+        # twice the budget; CBSEE_CHECK_STARTUP_BUDGET=1 (CI) holds it to the budget itself.
+        margin = 1 if os.environ.get('CBSEE_CHECK_STARTUP_BUDGET') else 2
+        self.assertLess(startup, STARTUP_BUDGET_SECONDS * margin)
+
+
+class DiscoveryRowsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com')
+        # Characters JSONRenderer escapes or encodes specially
+        cup = Object.objects.create(ObjectName='cup "\u00e9</script>\u2028', ObjectDescription='d', ObjectCategory='')
+        pen = Object.objects.create(ObjectName='pen', ObjectDescription='d', ObjectCategory='kitchen')
+        for obj in (cup, pen, pen):
+            record_recognition('s1', obj.ObjectID)
+        self.queryset = ObjectRecognized.objects.filter(Student_id='s1').order_by('-Timestamp')
+
+    def test_rows_render_like_the_serializer(self):
+        expected = JSONRenderer().render(DiscoverySerializer(self.queryset, many=True).data)
+        self.assertEqual(FastJSONRenderer().render(discovery_rows(self.queryset)), expected)
+
+    def test_discoveries_endpoint_and_304(self):
+        response = self.client.get('/api/v1/discoveries/', **self.auth('s1'))
+        self.assertEqual(response.content, JSONRenderer().render(DiscoverySerializer(self.queryset, many=True).data))
+        again = self.client.get('/api/v1/discoveries/', HTTP_IF_NONE_MATCH=response['ETag'], **self.auth('s1'))
+        self.assertEqual(again.status_code, 304)
+
+
+class ConditionalStatsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.student = Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com')
+        self.object = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        record_recognition('s1', self.object.ObjectID)
+        self.first = self.client.get('/api/v1/student_stats/s1/', **self.auth('s1'))
+
+    def revalidate(self):
+        return self.client.get('/api/v1/student_stats/s1/', HTTP_IF_NONE_MATCH=self.first['ETag'], **self.auth('s1'))
+
+    def test_unchanged_stats_are_304_without_last_modified(self):
+        self.assertEqual(self.revalidate().status_code, 304)
+        self.assertNotIn('Last-Modified', self.first)
+
+    def test_renamed_student_is_fresh(self):
+        self.student.Name = 'Samira'
+        self.student.save()
+        response = self.revalidate()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['student_name'], 'Samira')
+
+    def test_edited_object_is_fresh(self):
+        self.object.ObjectName = 'mug'
+        self.object.save()
+        self.assertEqual(self.revalidate().status_code, 200)
+
+    def test_deleted_discovery_is_fresh(self):
+        ObjectRecognized.objects.filter(Student_id='s1').delete()
+        self.assertEqual(self.revalidate().status_code, 200)
+
+
+class ArchiveRollupTests(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(RECOGNITION_ARCHIVE_DIR=archive_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        teacher = Teacher.objects.create(TeacherID='t1', Name='T', Email='t@example.com', School='S',
+                                         ContactInfo='t@example.com', Subject='Science', GradeLevel='1')
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com', Teacher=teacher)
+        cup = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        for _ in range(3):
+            record_recognition('s1', cup.ObjectID)
+        old = ObjectRecognized.objects.order_by('ID')[:2].values_list('ID', flat=True)
+        ObjectRecognized.objects.filter(ID__in=list(old)).update(Timestamp=timezone.now() - timedelta(days=400))
+
+    def counts(self):
+        return (sorted(StudentDailyRollup.objects.values_list('Day', 'Category', 'Count')),
+                sorted(ClassHourlyRollup.objects.values_list('Hour', 'ObjectName', 'Count')))
+
+    def test_rebuild_after_archiving_counts_archived_rows(self):
+        rebuild_rollups()
+        before = self.counts()
+        call_command('archive_recognitions', '--older-than-days', '365', '--pause', '0', stdout=mock.Mock())
+        self.assertEqual(ObjectRecognized.objects.count(), 1)
+        # Archiving is not a deletion as far as the rollups are concerned
+        self.assertEqual(self.counts(), before)
+        rebuild_rollups()
+        self.assertEqual(self.counts(), before)
+        self.assertEqual(sum(n for _, _, n in before[0]), 3)
+
+
+class ExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(RECOGNITION_ARCHIVE_DIR=archive_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        teacher = Teacher.objects.create(TeacherID='t1', Name='T', Email='t@example.com', School='S',
+                                         ContactInfo='t@example.com', Subject='Science', GradeLevel='1')
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com', Teacher=teacher)
+        Student.objects.create(StudentID='s2', Name='Ann', GradeLevel='1', Email='s2@example.com')
+        cup = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        for student_id in ('s1', 's1', 's1', 's2'):
+            record_recognition(student_id, cup.ObjectID)
+        old = ObjectRecognized.objects.order_by('ID')[:2].values_list('ID', flat=True)
+        ObjectRecognized.objects.filter(ID__in=list(old)).update(Timestamp=timezone.now() - timedelta(days=400))
+        call_command('archive_recognitions', '--older-than-days', '365', '--pause', '0', stdout=mock.Mock())
+
+    def export(self, **params):
+        response = self.client.get('/api/v1/export/', params, **self.auth('t1'))
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_has_archived_then_live_rows_of_the_class_only(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'id,student_id,student_name,object,category,timestamp')
+        self.assertEqual([line.split(',')[1:5] for line in lines[1:]], [['s1', 'Sam', 'cup', 'kitchen']] * 3)
+        self.assertEqual(sorted(int(line.split(',')[0]) for line in lines[1:]),
+                         [int(line.split(',')[0]) for line in lines[1:]])
+
+    def test_ndjson_date_range_skips_the_archive(self):
+        response, body = self.export(type='ndjson', start=timezone.localdate().isoformat())
+        self.assertEqual([row['student_id'] for row in map(json.loads, body.splitlines())], ['s1'])
+
+    def test_bad_parameters_are_400(self):
+        self.assertEqual(self.client.get('/api/v1/export/', {'type': 'xml'}, **self.auth('t1')).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/export/', {'start': 'today'}, **self.auth('t1')).status_code, 400)
+
+
+class ThumbnailTests(ApiTestCase):
+    digest = 'ab' * 32
+
+    def setUp(self):
+        super().setUp()
+        from PIL import Image
+
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        patcher = mock.patch.object(thumbnail_store, 'root', Path(root.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        thumbnail_store.write(self.digest, Image.new('RGB', (400, 300), 'red'))
+        self.url = f'/api/v1/thumbnails/{self.digest}.webp'
+        self.data = thumbnail_store.path(self.digest).read_bytes()
+
+    def test_whole_file_is_immutable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.data)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.data[-5:])
+        self.assertEqual(response['Content-Range'], f'bytes {len(self.data) - 5}-{len(self.data) - 1}/{len(self.data)}')
+
+    def test_open_ended_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.data[10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.data)
+
+    def test_missing_or_malformed_names_are_404(self):
+        self.assertEqual(self.client.get(f'/api/v1/thumbnails/{"cd" * 32}.webp').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/thumbnails/..%2fsecret.webp').status_code, 404)
+
+    def test_byte_range_parsing(self):
+        self.assertIsNone(byte_range(None, 10))
+        self.assertIsNone(byte_range('bytes=0-1,4-5', 10))
+        self.assertEqual(byte_range('bytes=3-100', 10), (3, 9))
+        self.assertEqual(byte_range('bytes=-100', 10), (0, 9))
+        with self.assertRaises(ValueError):
+            byte_range('bytes=5-2', 10)
+
+    def test_discovery_row_links_its_thumbnail(self):
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com')
+        cup = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        record_recognition('s1', cup.ObjectID, image_hash=self.digest)
+        record_recognition('s1', cup.ObjectID)
+        rows = self.client.get('/api/v1/discoveries/', **self.auth('s1')).json()
+        self.assertEqual(sorted(row['imageUrl'] for row in rows), ['', self.url])
+        image_url = next(row['imageUrl'] for row in rows if row['imageUrl'])
+        self.assertEqual(self.client.get(image_url).content, self.data)
+
+
+class RollupConsistencyTests(TestCase):
+    def setUp(self):
+        teacher = Teacher.objects.create(TeacherID='t1', Name='T', Email='t@example.com', School='S',
+                                         ContactInfo='t@example.com', Subject='Science', GradeLevel='1')
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com', Teacher=teacher)
+        self.cup = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        for _ in range(2):
+            record_recognition('s1', self.cup.ObjectID)
+
+    def categories(self):
+        return dict(StudentDailyRollup.objects.values_list('Category').annotate(n=Sum('Count')).order_by())
+
+    def test_deleted_discovery_is_subtracted(self):
+        ObjectRecognized.objects.order_by('ID').first().delete()
+        self.assertEqual(self.categories(), {'kitchen': 1})
+        ObjectRecognized.objects.all().delete()
+        self.assertEqual(self.categories(), {})
+        self.assertFalse(ClassHourlyRollup.objects.exists())
+
+    def test_recategorized_object_is_recounted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cup.ObjectCategory = 'tableware'
+            self.cup.save()
+        self.assertEqual(self.categories(), {'tableware': 2})
+        self.assertEqual(list(ClassHourlyRollup.objects.values_list('Category', flat=True)), ['tableware'])
+
+    def test_unchanged_object_save_does_not_recount(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.cup.save()
+        self.assertEqual(callbacks, [])
+
+
+class DashboardTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = Teacher.objects.create(TeacherID='t1', Name='T', Email='t@example.com', School='S',
+                                              ContactInfo='t@example.com', Subject='Science', GradeLevel='1')
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com', Teacher=self.teacher)
+        Student.objects.create(StudentID='s2', Name='Ann', GradeLevel='1', Email='s2@example.com')
+        self.cup = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        with self.captureOnCommitCallbacks(execute=True):
+            record_recognition('s1', self.cup.ObjectID)
+
+    def dashboard(self):
+        response = self.client.get('/api/v1/dashboard/', **self.auth('t1'))
+        self.assertEqual(response.status_code, 200)
+        return {s['StudentID']: s for s in response.json()['students']}
+
+    def test_cached_entry_renders_across_midnight(self):
+        data = build_dashboard('t1')
+        # Built at 10:00 on the day of the student's last discovery.
+        day = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0)
+        data['date'] = day.date()
+        data['students'][0]['last_seen'] = day
+
+        def render(now):
+            student = render_dashboard(data, now)['students'][0]
+            return student['objectsFound'], student['lastActive']
+
+        self.assertEqual(render(day.replace(hour=23, minute=59)), (1, 'Today'))
+        self.assertEqual(render(day + timedelta(days=1, minutes=30)), (0, 'Yesterday'))
+        self.assertEqual(render(day + timedelta(days=3)), (0, '3 days ago'))
+
+    def test_new_discovery_drops_the_cached_entry(self):
+        self.assertEqual(self.dashboard()['s1']['objectsFound'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            record_recognition('s1', self.cup.ObjectID)
+        self.assertEqual(self.dashboard()['s1']['objectsFound'], 2)
+
+    def test_enrollment_drops_the_cached_entry(self):
+        self.assertEqual(set(self.dashboard()), {'s1'})
+        response = self.client.post('/api/v1/add_student/', {'email': 's2@example.com'}, **self.auth('t1'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(self.dashboard()), {'s1', 's2'})
+        Student.objects.create(StudentID='s3', Name='Bo', GradeLevel='1', Email='s3@example.com')
+        response = self.client.post('/api/v1/add_students/', {'emails': ['s3@example.com']},
+                                    content_type='application/json', **self.auth('t1'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(self.dashboard()), {'s1', 's2', 's3'})
+
+
+class EventBrokerTests(SimpleTestCase):
+    async def test_events_reach_only_the_teachers_channel(self):
+        broker = InProcessBroker()
+        mine = [broker.subscribe(teacher_channel('t1')) for _ in range(2)]
+        other = broker.subscribe(teacher_channel('t2'))
+        # Published from a request thread, delivered on this loop.
+        publisher = threading.Thread(target=broker.publish, args=(teacher_channel('t1'), {'id': 1}))
+        publisher.start()
+        publisher.join()
+        for subscription in mine:
+            self.assertEqual(await subscription.get(timeout=1), {'id': 1})
+        self.assertIsNone(await other.get(timeout=0.05))
+        for subscription in mine + [other]:
+            subscription.close()
+        self.assertFalse(broker.has_subscribers())
+
+    async def test_full_queue_drops_the_oldest_events(self):
+        broker = InProcessBroker(max_queue=2)
+        subscription = broker.subscribe(teacher_channel('t1'))
+        for n in range(1, 4):
+            broker.publish(teacher_channel('t1'), {'id': n})
+        await asyncio.sleep(0)
+        self.assertEqual([(await subscription.get(timeout=1))['id'] for _ in range(2)], [2, 3])
+        self.assertIsNone(await subscription.get(timeout=0.05))
+
+
+class PublishRecognitionsTests(TestCase):
+    def test_published_to_the_teacher_after_commit(self):
+        teacher = Teacher.objects.create(TeacherID='t1', Name='T', Email='t@example.com', School='S',
+                                         ContactInfo='t@example.com', Subject='Science', GradeLevel='1')
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com', Teacher=teacher)
+        Student.objects.create(StudentID='s2', Name='Ann', GradeLevel='1', Email='s2@example.com')
+        cup = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        broker = mock.Mock()
+        with mock.patch('api.events.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks() as callbacks:
+                record_recognition('s1', cup.ObjectID)
+                record_recognition('s2', cup.ObjectID)
+            broker.publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+        broker.publish.assert_called_once()
+        channel, event = broker.publish.call_args.args
+        self.assertEqual(channel, teacher_channel('t1'))
+        self.assertEqual((event['studentId'], event['object'], event['category']), ('s1', 'cup', 'kitchen'))
+
+
+class IdentityCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        Teacher.objects.create(TeacherID='t1', Name='T', Email='t@example.com', School='S',
+                               ContactInfo='t@example.com', Subject='Science', GradeLevel='1')
+
+    def signup(self, uid, user_type):
+        token = self.issuer.issue(uid, email=f'{uid}@example.com')
+        response = self.client.post('/api/v1/auth/signup/', {'type': user_type, 'name': uid},
+                                    HTTP_AUTHORIZATION='Bearer ' + token)
+        self.assertEqual(response.status_code, 201)
+
+    def test_signup_is_seen_after_a_miss_and_a_role_change(self):
+        self.assertIsNone(identity_resolver.resolve('u1'))
+        self.signup('u1', 'student')
+        self.assertEqual(identity_resolver.resolve('u1'), Identity('student', 'u1', None))
+        self.signup('u1', 'teacher')
+        self.assertEqual(identity_resolver.resolve('u1'), Identity('teacher', 'u1', 'u1'))
+
+    def test_enrollment_changes_the_students_class(self):
+        for uid in ('s1', 's2'):
+            Student.objects.create(StudentID=uid, Name=uid, GradeLevel='1', Email=f'{uid}@example.com')
+            self.assertEqual(identity_resolver.resolve(uid).teacher_id, None)
+        response = self.client.post('/api/v1/add_student/', {'email': 's1@example.com'}, **self.auth('t1'))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/v1/add_students/', {'emails': ['s2@example.com']},
+                                    content_type='application/json', **self.auth('t1'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(identity_resolver.resolve('s1').teacher_id, 't1')
+        self.assertEqual(identity_resolver.resolve('s2').teacher_id, 't1')
+
+    def test_model_save_and_delete(self):
+        student = Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com')
+        self.assertEqual(identity_resolver.resolve('s1').teacher_id, None)
+        student.Teacher_id = 't1'
+        student.save()
+        self.assertEqual(identity_resolver.resolve('s1').teacher_id, 't1')
+        student.delete()
+        self.assertIsNone(identity_resolver.resolve('s1'))
+        self.assertEqual(identity_resolver.resolve('t1').user_type, 'teacher')
+        Teacher.objects.get(TeacherID='t1').delete()
+        self.assertIsNone(identity_resolver.resolve('t1'))
+
+
+class ObjectCatalogTests(TestCase):
+    def setUp(self):
+        object_catalog.invalidate()
+        self.addCleanup(object_catalog.invalidate)
+
+    def test_names_outside_the_model_are_remembered(self):
+        Object.objects.create(ObjectName='kite', ObjectDescription='d', ObjectCategory='toys')
+        first = object_catalog.get('kite')
+        Object.objects.create(ObjectName='drum', ObjectDescription='d', ObjectCategory='toys')
+        object_catalog.get('drum')
+        with self.assertNumQueries(0):
+            self.assertEqual(object_catalog.get('kite'), first)
+            object_catalog.get('drum')
+
+    def test_loading_a_classifier_invalidates_the_catalog(self):
+        object_catalog.get('kite')
+        with mock.patch('api.ml_inference._classifier_loaded', False), \
+                mock.patch('api.ml_inference._classifier', None), \
+                mock.patch('api.ml_inference.ImageClassifier'):
+            get_classifier()
+        self.assertIsNone(object_catalog._entries)
+
+
+class EvaluationTests(SimpleTestCase):
+    CLASSES = ['cup', 'plate', 'spoon', 'key']
+
+    def test_summarize_synthetic_predictions(self):
+        import torch
+
+        probabilities = torch.tensor([
+            [0.85, 0.08, 0.05, 0.02],  # cup, right
+            [0.6, 0.3, 0.06, 0.04],   # plate taken for a cup, right in the top 3
+            [0.1, 0.15, 0.7, 0.05],   # spoon, right
+            [0.4, 0.35, 0.25, 0.0],   # key, not even in the top 3
+            [0.25, 0.25, 0.25, 0.25],  # unreadable file
+        ], dtype=torch.float64)
+        labels = torch.tensor([0, 1, 2, 3, -1])
+        timings = {'wall_seconds': 2.0, 'model_seconds': 1.0, 'batch_seconds': [0.5, 0.5]}
+        results = evaluation.summarize(probabilities, labels, timings, self.CLASSES, 0.5, 2)
+
+        self.assertEqual((results['images'], results['unreadable']), (4, 1))
+        self.assertEqual((results['top1'], results['top3']), (0.5, 0.75))
+        # |accuracy - confidence| per image, each a quarter of the images
+        self.assertAlmostEqual(results['calibration']['ece'], (0.15 + 0.6 + 0.3 + 0.4) / 4)
+        cutoff = results['calibration']['threshold']
+        self.assertEqual((cutoff['coverage'], cutoff['rejected_correct'], cutoff['served_accuracy']), (0.75, 0.0, 0.5))
+        self.assertAlmostEqual(cutoff['accepted_accuracy'], 2 / 3)
+        sweep = {row['threshold']: row for row in results['calibration']['sweep']}
+        self.assertEqual((sweep[0.8]['coverage'], sweep[0.8]['accepted_accuracy']), (0.25, 1.0))
+        self.assertIsNone(sweep[0.9]['accepted_accuracy'])
+        per_class = {row['class']: row for row in results['per_class']}
+        self.assertAlmostEqual(per_class['cup']['precision'], 1 / 3)
+        self.assertEqual((per_class['key']['recall'], per_class['key']['precision']), (0.0, None))
+        self.assertEqual({(row['true'], row['predicted']) for row in results['top_confusions']},
+                         {('plate', 'cup'), ('key', 'cup')})
+        self.assertEqual(results['throughput']['images_per_second'], 2.0)
+        self.assertEqual(results['throughput']['batch_ms_p50'], 500.0)
+
+    def test_command_stops_when_no_image_is_readable(self):
+        import torch
+
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'kitchen' / 'cup').mkdir(parents=True)
+            (directory / 'kitchen' / 'cup' / 'broken.jpg').write_bytes(b'not a jpeg')
+            (directory / 'classes.txt').write_text('cup\n')
+            (directory / 'model.pth').write_bytes(b'')
+            with mock.patch.object(evaluation, 'load_model', return_value=lambda batch: torch.zeros(len(batch), 1)), \
+                    self.assertRaisesRegex(CommandError, 'None of the 1 images could be read'):
+                call_command('evaluate_model', str(directory), '--model', str(directory / 'model.pth'),
+                             '--classes', str(directory / 'classes.txt'), '--workers', '0', stdout=mock.Mock())
+
+
+class EmbeddingTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        self.centers = rng.normal(size=(3, 64))
+        self.vectors = np.concatenate([c + 0.1 * rng.normal(size=(20, 64)) for c in self.centers])
+        self.labels = np.repeat(np.arange(3), 20)
+
+    def test_search_returns_nearest_first(self):
+        index = EmbeddingIndex(64, capacity=4)
+        index.add(np.arange(60), self.vectors)
+        keys, scores = index.search(self.centers[2], k=5)
+        self.assertTrue(all(40 <= key < 60 for key in keys))
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_reference_index_accepts_only_near_images(self):
+        scores = leave_one_out_scores(self.vectors, self.labels, 3)
+        index = ReferenceIndex(self.vectors, self.labels, class_thresholds(scores, self.labels, 3), ['a', 'b', 'c'], 'v1')
+        self.assertTrue(index.accepts(self.centers[1], 1)[0])
+        self.assertFalse(index.accepts(self.centers[1], 0)[0])
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(f'{tmp}/index.npz')
+            loaded = ReferenceIndex.load(f'{tmp}/index.npz')
+        self.assertEqual(loaded.model_version, 'v1')
+        self.assertEqual(loaded.accepts(self.centers[1], 1), index.accepts(self.centers[1], 1))
+
+    def test_discovery_index_reads_new_rows_per_student(self):
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com')
+        Student.objects.create(StudentID='s2', Name='Kim', GradeLevel='1', Email='s2@example.com')
+        cup = Object.objects.create(ObjectName='cup', ObjectDescription='d', ObjectCategory='kitchen')
+        discoveries = DiscoveryIndex()
+        record_recognition('s1', cup.ObjectID, normalize(self.centers[0]).tobytes())
+        record_recognition('s2', cup.ObjectID, normalize(self.centers[1]).tobytes())
+        self.assertEqual(len(discoveries.similar('s1', self.centers[1])), 1)
+        record_recognition('s1', cup.ObjectID, normalize(self.centers[1]).tobytes())
+        newest = ObjectRecognized.objects.filter(Student_id='s1').latest('ID').ID
+        self.assertEqual(discoveries.similar('s1', self.centers[1], k=1)[0][0], newest)
+
+    def test_similar_without_a_classifier_is_503(self):
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com')
+        image = SimpleUploadedFile('a.png', PNG_BYTES, content_type='image/png')
+        with mock.patch('api.views.get_classifier', return_value=None):
+            response = self.client.post('/api/v1/similar/', {'image': image}, **self.auth('s1'))
+        self.assertEqual(response.status_code, 503)
+
+    def test_build_reference_index_without_a_classifier(self):
+        with mock.patch('api.management.commands.build_reference_index.get_classifier', return_value=None):
+            with self.assertRaises(CommandError):
+                call_command('build_reference_index', tempfile.gettempdir())
+
+
+class RosterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = Teacher.objects.create(TeacherID='t1', Name='T', Email='t@example.com', School='S',
+                                              ContactInfo='t@example.com', Subject='Science', GradeLevel='1')
+        other = Teacher.objects.create(TeacherID='t2', Name='U', Email='u@example.com', School='S',
+                                       ContactInfo='u@example.com', Subject='Science', GradeLevel='1')
+        Student.objects.create(StudentID='s1', Name='A', GradeLevel='1', Email='a@example.com')
+        Student.objects.create(StudentID='s2', Name='B', GradeLevel='1', Email='b@example.com', Teacher=other)
+
+    def post(self, emails):
+        return self.client.post('/api/v1/add_students/', {'emails': emails}, content_type='application/json',
+                                **self.auth('t1'))
+
+    def test_statuses_per_row(self):
+        response = self.post(['a@example.com', 'b@example.com', 'a@example.com', 'nobody@example.com', ' '])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['status'] for r in response.json()['results']],
+                         ['added', 'assigned_to_other_teacher', 'duplicate', 'unknown', 'empty'])
+        self.assertEqual(Student.objects.get(StudentID='s1').Teacher_id, 't1')
+
+    def test_non_string_emails_are_rejected(self):
+        self.assertEqual(self.post(['a@example.com', 5]).status_code, 400)
+        self.assertEqual(self.post([None]).status_code, 400)
+
+    def test_student_taken_concurrently_is_not_reported_added(self):
+        original_update = QuerySet.update
+
+        def taken_first(queryset, **kwargs):
+            # Another teacher's enrollment commits between our read and our update.
+            original_update(Student.objects.filter(StudentID='s1'), Teacher_id='t2')
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', taken_first):
+            results = enroll_students('t1', ['a@example.com'])
+        self.assertEqual(results[0]['status'], 'assigned_to_other_teacher')
+
+
+class SeedLoadtestTests(ApiTestCase):
+    def seed(self, now):
+        with mock.patch('api.management.commands.seed_loadtest.get_local_issuer'), \
+                mock.patch('django.utils.timezone.now', return_value=now):
+            call_command('seed_loadtest', teachers=1, students=3, history=20, days=3, stdout=mock.Mock())
+
+    def test_history_gets_distinct_past_timestamps_within_each_day(self):
+        # 10:00, so most of day 0's 9:00-15:00 window is still ahead.
+        now = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0)
+        self.seed(now)
+        timestamps = list(ObjectRecognized.objects.values_list('Timestamp', flat=True))
+        self.assertEqual(len(timestamps), 60)
+        self.assertGreater(len(set(timestamps)), 30)
+        self.assertEqual(len({t.date() for t in timestamps}), 3)
+        self.assertLessEqual(max(timestamps), now)
+        self.assertEqual(StudentDailyRollup.objects.aggregate(n=Sum('Count'))['n'], 60)
+
+    def test_reseeding_replaces_the_history(self):
+        self.seed(timezone.now())
+        self.seed(timezone.now())
+        self.assertEqual(ObjectRecognized.objects.count(), 60)
+        self.assertEqual(StudentDailyRollup.objects.aggregate(n=Sum('Count'))['n'], 60)
+
+
+class RecognitionBufferTests(TransactionTestCase):
+    # SQLite checks foreign keys at commit, which a TestCase never reaches.
+
+    def setUp(self):
+        Student.objects.create(StudentID='s1', Name='Sam', GradeLevel='1', Email='s1@example.com')
+        self.cup, self.pen = (Object.objects.create(ObjectName=name, ObjectDescription='d', ObjectCategory='desk')
+                              for name in ('cup', 'pen'))
+        self.buffer = RecognitionBuffer(max_size=100, interval=60, max_attempts=2, max_pending=3)
+        # The long interval leaves flushing to the test; close() stops the thread.
+        self.addCleanup(self.buffer.close)
+
+    def test_rows_of_deleted_objects_and_students_are_skipped(self):
+        Student.objects.create(StudentID='s2', Name='Ann', GradeLevel='1', Email='s2@example.com')
+        self.buffer.add('s1', self.cup.ObjectID)
+        self.buffer.add('s1', self.pen.ObjectID)
+        self.buffer.add('s2', self.cup.ObjectID)
+        self.pen.delete()
+        Student.objects.filter(StudentID='s2').delete()
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertEqual(list(ObjectRecognized.objects.values_list('Object_id', flat=True)), [self.cup.ObjectID])
+
+    def test_failing_rows_are_retried_then_dropped(self):
+        self.buffer.add('s1', self.cup.ObjectID)
+        with mock.patch('api.recognition_buffer.write_recognitions', side_effect=OperationalError('locked')):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+            self.assertEqual(self.buffer.pending(), 1)
+            with self.assertLogs('api.recognition_buffer', 'ERROR') as logs, self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(), 0)
+        self.assertIn('2 failed writes', logs.output[0])
+
+    def test_pending_is_capped_by_dropping_the_oldest(self):
+        for obj in (self.cup, self.pen, self.cup, self.pen):
+            self.buffer.add('s1', obj.ObjectID)
+        with mock.patch('api.recognition_buffer.write_recognitions', side_effect=OperationalError('locked')):
+            with self.assertLogs('api.recognition_buffer', 'ERROR') as logs, self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(), 3)
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(list(ObjectRecognized.objects.order_by('ID').values_list('Object_id', flat=True)),
+                         [self.pen.ObjectID, self.cup.ObjectID, self.pen.ObjectID])
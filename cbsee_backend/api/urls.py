@@ -6,8 +6,14 @@ urlpatterns = [
     path('auth/check_profile/', views.check_profile),
     path('', views.index),
     path('classify/', views.ClassificationView.as_view()),
+    path('thumbnails/<str:digest>.webp', views.thumbnail, name='discovery-thumbnail'),
+    path('similar/', views.similar_discoveries, name='similar-discoveries'),
     path('discoveries/', views.DiscoveriesListView.as_view(), name='discoveries_list'),
     path('dashboard/', views.dashboard, name='teacher-dashboard'),
+    path('events/', views.classroom_events, name='classroom-events'),
     path('add_student/', views.add_student, name='add-student'),
+    path('add_students/', views.add_students, name='add-students'),
     path('student_stats/<str:student_id>/', views.student_stats, name='student-stats'),
+    path('class_analytics/', views.class_analytics, name='class-analytics'),
+    path('export/', views.export_discoveries, name='export-discoveries'),
 ]
\ No newline at end of file
@@ -1,17 +1,35 @@
 import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
 from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Count
+from datetime import date, datetime, time, timedelta
+from django.db.models import Sum
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.decorators import api_view
-from firebase_admin import auth
-from .models import Teacher, Student, ObjectRecognized, Object
+from rest_framework.decorators import api_view, parser_classes
+from . import firebase_auth
+from .models import Teacher, Student, ObjectRecognized, StudentDailyRollup
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
-from .serializers import ImageUploadSerializer, DiscoverySerializer
-from .ml_inference import classifier_instance
+from .serializers import ImageUploadSerializer, DiscoverySerializer, discovery_rows
+from .renderers import FastJSONRenderer
+from rest_framework.renderers import BrowsableAPIRenderer
+from .ml_inference import get_classifier, read_image
+from .recognition_buffer import record_recognition
+from .catalog import object_catalog
+from .identity import identity_resolver
+from .dashboard import get_dashboard, invalidate_dashboards
+from .events import get_broker, teacher_channel
+from .roster import MAX_ROSTER_SIZE, enroll_students, parse_roster_csv
+from .rollups import class_analytics as build_class_analytics
+from .export import csv_lines, iter_class_history, ndjson_lines
 from rest_framework.generics import ListAPIView
+from django.utils.decorators import method_decorator
+from .conditional import conditional_on, discovery_version
+from .thumbnails import DIGEST_PATTERN, byte_range, thumbnail_store
 
 # --- Helper ---
 def verify_firebase_token(request):
@@ -19,11 +37,24 @@ def verify_firebase_token(request):
     if not auth_header or not auth_header.startswith('Bearer '):
         return None
     try:
-        return auth.verify_id_token(auth_header.split('Bearer ').pop())
+        return firebase_auth.verify_id_token(auth_header.split('Bearer ').pop())
     except Exception as e:
         print(f"Token verification failed: {e}")
         return None
 
+def own_discoveries_version(request, *args, **kwargs):
+    decoded = verify_firebase_token(request)
+    if not decoded: return None
+    identity = identity_resolver.resolve(decoded.get('uid'))
+    if not identity or identity.user_type != 'student': return None
+    return discovery_version(identity.pk)
+
+def student_stats_version(request, student_id):
+    if not verify_firebase_token(request): return None
+    identity = identity_resolver.resolve(student_id)
+    if not identity or identity.user_type != 'student': return None
+    return discovery_version(student_id, since=timezone.now() - timedelta(days=7))
+
 @api_view(['GET'])
 def index(request):
     return Response({'message':'API is running'}, status=status.HTTP_200_OK)
@@ -39,26 +70,24 @@ class ClassificationView(APIView):
                 token = data.get('token')
                 if token:
                     try:
-                        decoded = auth.verify_id_token(token)
+                        decoded = firebase_auth.verify_id_token(token)
                         uid = decoded.get('uid')
                     except: pass
             
             serializer = ImageUploadSerializer(data=request.data)
             if serializer.is_valid():
-                image = serializer.validated_data['image']
-                prediction, conf = classifier_instance.predict(image)
+                classifier = get_classifier()
+                image, image_hash = read_image(serializer.validated_data['image'])
+                # Resized once: classifier input and thumbnail source
+                image = classifier.shrink(image) if image else None
+                prediction, conf, embedding = classifier.predict_image(image) if image else (None, None, None)
                 
                 if prediction and prediction != "Unknown":
-                    obj, _ = Object.objects.get_or_create(
-                        ObjectName=prediction,
-                        defaults={'ObjectDescription': f'This is a {prediction}.', 'ObjectCategory': 'General'}
-                    )
-                    if uid:
-                        try:
-                            student = Student.objects.get(StudentID=uid)
-                            ObjectRecognized.objects.create(Student=student, Object=obj)
-                        except Student.DoesNotExist:
-                            pass 
+                    obj = object_catalog.get(prediction)
+                    identity = identity_resolver.resolve(uid)
+                    if identity and identity.user_type == 'student':
+                        record_recognition(identity.pk, obj.ObjectID, embedding.tobytes(), image_hash)
+                        thumbnail_store.submit(image_hash, image)
                     return Response({'prediction': prediction, 'description': obj.ObjectDescription}, status=status.HTTP_200_OK)
                 else:
                     return Response({'prediction': 'Unknown', 'description': 'Try adding more light.'}, status=status.HTTP_200_OK)
@@ -66,24 +95,84 @@ class ClassificationView(APIView):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@method_decorator(conditional_on(own_discoveries_version), name='dispatch')
 class DiscoveriesListView(ListAPIView):
     serializer_class = DiscoverySerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     def get_queryset(self):
         decoded = verify_firebase_token(self.request)
         if not decoded: return ObjectRecognized.objects.none()
-        uid = decoded.get('uid')
-        try:
-            student = Student.objects.get(StudentID=uid)
-            return ObjectRecognized.objects.filter(Student=student).select_related('Object').order_by('-Timestamp')
-        except Student.DoesNotExist: return ObjectRecognized.objects.none()
+        identity = identity_resolver.resolve(decoded.get('uid'))
+        if not identity or identity.user_type != 'student': return ObjectRecognized.objects.none()
+        return ObjectRecognized.objects.filter(Student_id=identity.pk).order_by('-Timestamp')
+    def list(self, request, *args, **kwargs):
+        # discovery_rows() produces DiscoverySerializer's output without per-row field machinery.
+        return Response(discovery_rows(self.filter_queryset(self.get_queryset())))
+
+@require_safe
+def thumbnail(request, digest):
+    """A discovery thumbnail. Names are content hashes, so the bytes never change: cache forever."""
+    if not DIGEST_PATTERN.match(digest): raise Http404
+    etag = f'"{digest}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable', 'Accept-Ranges': 'bytes'}
+    if etag in request.headers.get('If-None-Match', ''):
+        return HttpResponse(status=304, headers=headers)
+    try:
+        with open(thumbnail_store.path(digest), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise Http404
+    # If-Range: only honour Range when the client's copy is this one
+    range_header = request.headers.get('Range') if request.headers.get('If-Range', etag) == etag else None
+    try:
+        requested = byte_range(range_header, len(data))
+    except ValueError:
+        return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{len(data)}'})
+    if requested is None:
+        return HttpResponse(data, content_type='image/webp', headers=headers)
+    start, end = requested
+    return HttpResponse(data[start:end + 1], status=206, content_type='image/webp',
+                        headers={**headers, 'Content-Range': f'bytes {start}-{end}/{len(data)}'})
+
+MAX_SIMILAR = 50
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser, FormParser])
+def similar_discoveries(request):
+    """The student's past discoveries that look most like the uploaded image; ?k= (default 5, at most 50)."""
+    from .embeddings import discovery_index
+
+    decoded = verify_firebase_token(request)
+    if not decoded: return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+    identity = identity_resolver.resolve(decoded.get('uid'))
+    if not identity or identity.user_type != 'student': return Response({'message': 'Student profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        k = min(int(request.query_params.get('k', 5)), MAX_SIMILAR)
+    except ValueError:
+        k = 0
+    if k < 1: return Response({'message': f'k must be between 1 and {MAX_SIMILAR}'}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ImageUploadSerializer(data=request.data)
+    if not serializer.is_valid(): return Response({'error': 'Invalid request.'}, status=status.HTTP_400_BAD_REQUEST)
+    classifier = get_classifier()
+    if classifier is None or classifier.model is None:
+        return Response({'error': 'Image recognition is unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    prediction, conf, embedding = classifier.predict_with_embedding(serializer.validated_data['image'])
+    if embedding is None: return Response({'error': 'Could not process the image.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    matches = discovery_index.similar(identity.pk, embedding, k)
+    rows = {row['id']: row for row in discovery_rows(ObjectRecognized.objects.filter(ID__in=[pk for pk, _ in matches]))}
+    if len(rows) < len(matches):
+        # Some cached discoveries were deleted (e.g. archived); reload on the next search
+        discovery_index.invalidate(identity.pk)
+    results = [dict(rows[pk], similarity=round(min(score, 1.0), 4)) for pk, score in matches if pk in rows]
+    return Response({'prediction': prediction, 'results': results}, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 def check_profile(request):
     decoded_token = verify_firebase_token(request)
     if not decoded_token: return Response({'message': 'Invalid token'}, status=status.HTTP_401_UNAUTHORIZED)
-    uid = decoded_token.get('uid')
-    if Teacher.objects.filter(TeacherID=uid).exists(): return Response({'profileExists': True, 'userType': 'teacher'}, status=status.HTTP_200_OK)
-    if Student.objects.filter(StudentID=uid).exists(): return Response({'profileExists': True, 'userType': 'student'}, status=status.HTTP_200_OK)
+    identity = identity_resolver.resolve(decoded_token.get('uid'))
+    if identity: return Response({'profileExists': True, 'userType': identity.user_type}, status=status.HTTP_200_OK)
     return Response({'profileExists': False}, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
@@ -92,7 +181,7 @@ def signup(request):
     token = data.get('token')
     if not token: decoded = verify_firebase_token(request)
     else:
-        try: decoded = auth.verify_id_token(token)
+        try: decoded = firebase_auth.verify_id_token(token)
         except: decoded = None
     if not decoded: return Response({'message': 'Invalid Token'}, status=status.HTTP_401_UNAUTHORIZED)
     uid = decoded.get('uid')
@@ -100,6 +189,7 @@ def signup(request):
     name = data.get('name', decoded.get('name', 'User'))
     user_type = data.get('type')
     grade = data.get('gradeLevel', 'Grade 1')
+    identity_resolver.invalidate(uid)
     try:
         if user_type == 'student':
             Student.objects.update_or_create(StudentID=uid, defaults={'Name': name, 'GradeLevel': grade, 'Email': email})
@@ -115,38 +205,74 @@ def dashboard(request):
     decoded_token = verify_firebase_token(request)
     if not decoded_token: return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
     try:
-        uid = decoded_token.get('uid')
-        teacher = Teacher.objects.get(TeacherID=uid)
-        students = Student.objects.filter(Teacher=teacher)
-        student_list = []
-        today = timezone.now().date()
-        for student in students:
-            objects_today = ObjectRecognized.objects.filter(Student=student, Timestamp__date=today).count()
-            last_rec = ObjectRecognized.objects.filter(Student=student).order_by('-Timestamp').first()
-            last_active_str = "Never"
-            if last_rec and last_rec.Timestamp:
-                diff = timezone.now() - last_rec.Timestamp
-                if diff.days == 0: last_active_str = "Today"
-                elif diff.days == 1: last_active_str = "Yesterday"
-                else: last_active_str = f"{diff.days} days ago"
-            student_list.append({'StudentID': student.StudentID, 'Name': student.Name, 'GradeLevel': student.GradeLevel, 'objectsFound': objects_today, 'lastActive': last_active_str})
-        return Response({'students': student_list, 'name': teacher.Name}, status=status.HTTP_200_OK)
+        identity = identity_resolver.resolve(decoded_token.get('uid'))
+        if not identity or identity.user_type != 'teacher': raise Teacher.DoesNotExist
+        return Response(get_dashboard(identity.pk), status=status.HTTP_200_OK)
     except Teacher.DoesNotExist: return Response({'message': 'Teacher profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
+async def classroom_events(request):
+    """Server-sent events stream of the requesting teacher's students' discoveries (ASGI only)."""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'message': 'Live events need the ASGI server'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    decoded = await sync_to_async(verify_firebase_token)(request)
+    # EventSource cannot send headers, so browsers pass the token in the query string.
+    if not decoded and request.GET.get('token'):
+        try: decoded = await sync_to_async(firebase_auth.verify_id_token)(request.GET['token'])
+        except Exception: decoded = None
+    if not decoded: return JsonResponse({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+    identity = await sync_to_async(identity_resolver.resolve)(decoded.get('uid'))
+    if not identity or identity.user_type != 'teacher': return JsonResponse({'message': 'Teacher profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    async def stream():
+        subscription = get_broker().subscribe(teacher_channel(identity.pk))
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = await subscription.get(timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+                if event is None: yield ': keep-alive\n\n'
+                else: yield f"event: discovery\nid: {event['id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @api_view(['POST'])
 def add_student(request):
     decoded = verify_firebase_token(request)
     if not decoded: return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
     try:
-        teacher_uid = decoded.get('uid')
-        teacher = Teacher.objects.get(TeacherID=teacher_uid)
+        identity = identity_resolver.resolve(decoded.get('uid'))
+        if not identity or identity.user_type != 'teacher': return Response({'message': 'Teacher profile not found'}, status=status.HTTP_400_BAD_REQUEST)
         student_email = request.data.get('email')
         student = Student.objects.get(Email=student_email)
-        student.Teacher = teacher
+        previous_teacher = student.Teacher_id
+        student.Teacher_id = identity.pk
         student.save()
+        identity_resolver.invalidate(student.StudentID)
+        invalidate_dashboards(previous_teacher, identity.pk)
         return Response({'message': 'Student added'}, status=status.HTTP_201_CREATED)
     except Exception as e: return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def add_students(request):
+    """Enrolls many students at once from an "emails" list or an uploaded CSV "file"."""
+    decoded = verify_firebase_token(request)
+    if not decoded: return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+    identity = identity_resolver.resolve(decoded.get('uid'))
+    if not identity or identity.user_type != 'teacher': return Response({'message': 'Teacher profile not found'}, status=status.HTTP_400_BAD_REQUEST)
+    if 'file' in request.FILES: emails = parse_roster_csv(request.FILES['file'])
+    else: emails = request.data.get('emails')
+    if not isinstance(emails, list) or not emails: return Response({'message': 'Provide an "emails" list or a CSV "file"'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(emails) > MAX_ROSTER_SIZE: return Response({'message': f'At most {MAX_ROSTER_SIZE} students per request'}, status=status.HTTP_400_BAD_REQUEST)
+    if not all(isinstance(email, str) for email in emails): return Response({'message': 'Every email must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+    results = enroll_students(identity.pk, emails)
+    added = sum(1 for r in results if r['status'] == 'added')
+    return Response({'added': added, 'results': results}, status=status.HTTP_201_CREATED if added else status.HTTP_200_OK)
+
+@conditional_on(student_stats_version)
 @api_view(['GET'])
 def student_stats(request, student_id):
     decoded = verify_firebase_token(request)
@@ -156,8 +282,11 @@ def student_stats(request, student_id):
     try:
         student = Student.objects.get(StudentID=student_id)
         
-        # 1. Total Discoveries
-        total_count = ObjectRecognized.objects.filter(Student=student).count()
+        # 1. Category Stats (for the chart) and Total Discoveries, from the daily rollups
+        category_counts = StudentDailyRollup.objects.filter(Student=student)\
+            .values('Category')\
+            .annotate(count=Sum('Count'))
+        total_count = sum(entry['count'] for entry in category_counts)
         
         # 2. Objects this week
         one_week_ago = timezone.now() - timedelta(days=7)
@@ -166,17 +295,13 @@ def student_stats(request, student_id):
             Timestamp__gte=one_week_ago
         ).count()
 
-        # 3. Category Stats (for the chart)
-        category_counts = ObjectRecognized.objects.filter(Student=student)\
-            .values('Object__ObjectCategory')\
-            .annotate(count=Count('ID'))
-            
+        # 3. Category shares
         chart_data = {}
         most_found_cat = "None"
         max_cat_count = 0
         
         for entry in category_counts:
-            cat = entry['Object__ObjectCategory'] or "General"
+            cat = entry['Category']
             count = entry['count']
             if total_count > 0:
                 chart_data[cat] = count / total_count 
@@ -188,8 +313,7 @@ def student_stats(request, student_id):
                 most_found_cat = cat
 
         # 4. Recent History (Top 5)
-        discoveries = ObjectRecognized.objects.filter(Student=student).select_related('Object').order_by('-Timestamp')[:5]
-        serializer = DiscoverySerializer(discoveries, many=True)
+        history = discovery_rows(ObjectRecognized.objects.filter(Student=student).order_by('-Timestamp')[:5])
         
         return Response({
             'student_name': student.Name,
@@ -197,8 +321,50 @@ def student_stats(request, student_id):
             'weekly_discoveries': week_count,
             'most_found_category': most_found_cat,
             'chart_data': chart_data,
-            'history': serializer.data
+            'history': history
         }, status=status.HTTP_200_OK)
         
     except Student.DoesNotExist:
-        return Response({'message': 'Student not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        return Response({'message': 'Student not found'}, status=status.HTTP_404_NOT_FOUND)
+
+@api_view(['GET'])
+def class_analytics(request):
+    """Trends, top objects and category mix for the teacher's class; ?start=&end= as YYYY-MM-DD."""
+    decoded = verify_firebase_token(request)
+    if not decoded: return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+    identity = identity_resolver.resolve(decoded.get('uid'))
+    if not identity or identity.user_type != 'teacher': return Response({'message': 'Teacher profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        end = date.fromisoformat(request.query_params['end']) if 'end' in request.query_params else timezone.localdate()
+        start = date.fromisoformat(request.query_params['start']) if 'start' in request.query_params else end - timedelta(days=29)
+    except ValueError:
+        return Response({'message': 'Dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end or (end - start).days > 366:
+        return Response({'message': 'Date range must be positive and at most a year'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(build_class_analytics(identity.pk, start, end), status=status.HTTP_200_OK)
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson; charset=utf-8'),
+}
+
+@api_view(['GET'])
+def export_discoveries(request):
+    """Streams the class's full discovery history; ?type=csv|ndjson, optional ?start=&end= as YYYY-MM-DD."""
+    decoded = verify_firebase_token(request)
+    if not decoded: return Response({'message': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+    identity = identity_resolver.resolve(decoded.get('uid'))
+    if not identity or identity.user_type != 'teacher': return Response({'message': 'Teacher profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    export_type = request.query_params.get('type', 'csv')
+    if export_type not in EXPORT_FORMATS:
+        return Response({'message': 'type must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(date.fromisoformat(request.query_params['start']), time.min), tz) if 'start' in request.query_params else None
+        end = timezone.make_aware(datetime.combine(date.fromisoformat(request.query_params['end']) + timedelta(days=1), time.min), tz) if 'end' in request.query_params else None
+    except ValueError:
+        return Response({'message': 'Dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    lines, content_type = EXPORT_FORMATS[export_type]
+    response = StreamingHttpResponse(lines(iter_class_history(identity.pk, start, end)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="discoveries-{timezone.localdate():%Y%m%d}.{export_type}"'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,13 +78,73 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
+# CBSEE_DB_PROFILE selects the database:
+#   sqlite   - local file, tuned for concurrent readers/writers (see SQLITE_PRAGMAS)
+#   postgres - configured with the CBSEE_DB_* variables below; needs psycopg
+#              installed. Connections are kept open for CBSEE_DB_CONN_MAX_AGE
+#              seconds instead of being opened per request.
+DB_PROFILE = os.environ.get('CBSEE_DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('CBSEE_DB_NAME', 'cbsee'),
+            'USER': os.environ.get('CBSEE_DB_USER', 'cbsee'),
+            'PASSWORD': os.environ.get('CBSEE_DB_PASSWORD', ''),
+            'HOST': os.environ.get('CBSEE_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('CBSEE_DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('CBSEE_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # Set when connecting through a transaction-pooling PgBouncer.
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('CBSEE_DB_PGBOUNCER', 'false').lower() == 'true',
+        }
+    }
+elif DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('CBSEE_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('CBSEE_DB_CONN_MAX_AGE', 60)),
+            'OPTIONS': {
+                # Seconds a writer waits for the lock before "database is locked".
+                'timeout': 20,
+            },
+        }
+    }
+else:
+    raise ValueError(f"Unknown CBSEE_DB_PROFILE: {DB_PROFILE}")
+
+# Applied to every new SQLite connection by api/db.py. WAL lets dashboard
+# reads run while a discovery is being written.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+# Local memory by default. With several worker processes, point this at a
+# shared backend (e.g. CBSEE_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# CBSEE_CACHE_LOCATION=redis://127.0.0.1:6379) so invalidations reach every worker.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CBSEE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CBSEE_CACHE_LOCATION', 'cbsee'),
     }
 }
 
+# Seconds a teacher's dashboard stays cached. New discoveries and roster
+# changes clear it straight away; the timeout only bounds staleness across
+# processes that do not share a cache.
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('CBSEE_DASHBOARD_CACHE_TIMEOUT', 300))
+
+# Live classroom feed (GET /api/v1/events/, served by the ASGI app). The broker
+# fans discoveries out to connected teachers; a comment line is sent every
+# EVENTS_HEARTBEAT_SECONDS to keep idle connections open.
+EVENT_BROKER = 'api.events.InProcessBroker'
+EVENTS_HEARTBEAT_SECONDS = 15
+
 # REST_FRAMEWORK = {
 #     'DEFAULT_PERMISSION_CLASSES': [
 #         'rest_framework.permissions.IsAuthenticated',
@@ -145,13 +206,60 @@ FIREBASE_CONFIG = {
   'measurementId': "G-J4SDTFKDE4"
 };
 
-import firebase_admin, os
-from firebase_admin import credentials
+import os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-cred = credentials.Certificate(os.path.join(BASE_DIR, "firebase/cbsee-backend.json"))
-# Avoid re-initializing if already initialized
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred)
-
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+# Service account for the Firebase Admin SDK. Nothing in the backend loads
+# the SDK: ID tokens are verified locally (api/firebase_auth.py).
+FIREBASE_CREDENTIALS_FILE = os.path.join(BASE_DIR, "firebase/cbsee-backend.json")
+
+# 'firebase' accepts real Firebase ID tokens. 'local' accepts only tokens
+# signed with the key in LOCAL_AUTH_KEY_FILE, for offline load tests (see
+# `manage.py seed_loadtest` / `loadtest`). Never use 'local' in production.
+AUTH_PROVIDER = os.environ.get('CBSEE_AUTH_PROVIDER', 'firebase')
+LOCAL_AUTH_KEY_FILE = os.environ.get('CBSEE_LOCAL_AUTH_KEY_FILE', os.path.join(BASE_DIR, 'loadtest', 'local-auth-key.pem'))
+
+# ID tokens are verified locally (api/firebase_auth.py); verified claims are
+# cached until the token expires, up to this many tokens per process.
+FIREBASE_TOKEN_CACHE_SIZE = 10000
+
+CORS_ALLOW_ALL_ORIGINS = True
+
+# The classifier (torch + model weights) is loaded on first use. Servers
+# started through backend/wsgi.py or backend/asgi.py load it at boot unless
+# this is off.
+PRELOAD_CLASSIFIER = os.environ.get('CBSEE_PRELOAD_CLASSIFIER', 'true').lower() == 'true'
+
+# Discoveries from /classify/ are written immediately unless write-behind
+# buffering is switched on (see api/recognition_buffer.py). When it is, rows
+# are inserted in batches of RECOGNITION_FLUSH_SIZE or every
+# RECOGNITION_FLUSH_INTERVAL seconds, whichever comes first. A discovery
+# that fails RECOGNITION_FLUSH_ATTEMPTS writes, or that would grow the
+# buffer past RECOGNITION_MAX_PENDING, is logged and dropped.
+RECOGNITION_WRITE_BEHIND = os.environ.get('CBSEE_RECOGNITION_WRITE_BEHIND', 'false').lower() == 'true'
+RECOGNITION_FLUSH_SIZE = int(os.environ.get('CBSEE_RECOGNITION_FLUSH_SIZE', 50))
+RECOGNITION_FLUSH_INTERVAL = float(os.environ.get('CBSEE_RECOGNITION_FLUSH_INTERVAL', 2.0))
+RECOGNITION_FLUSH_ATTEMPTS = int(os.environ.get('CBSEE_RECOGNITION_FLUSH_ATTEMPTS', 5))
+RECOGNITION_MAX_PENDING = int(os.environ.get('CBSEE_RECOGNITION_MAX_PENDING', 5000))
+
+# Discoveries older than RECOGNITION_RETENTION_DAYS are moved out of the
+# database into RECOGNITION_ARCHIVE_DIR by `manage.py archive_recognitions`.
+RECOGNITION_RETENTION_DAYS = int(os.environ.get('CBSEE_RECOGNITION_RETENTION_DAYS', 365))
+RECOGNITION_ARCHIVE_DIR = os.environ.get('CBSEE_RECOGNITION_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
+# Reference embeddings written by `manage.py build_reference_index`. When the
+# file exists and matches the loaded model, /classify/ answers Unknown by
+# distance to the predicted class's references instead of by confidence.
+REFERENCE_INDEX_FILE = os.environ.get('CBSEE_REFERENCE_INDEX_FILE', os.path.join(BASE_DIR, 'models', 'reference_index.npz'))
+
+# /similar/ keeps the embeddings of this many students in memory (about
+# 2KB per discovery), least recently searched evicted first.
+SIMILARITY_CACHE_STUDENTS = int(os.environ.get('CBSEE_SIMILARITY_CACHE_STUDENTS', 256))
+
+# Thumbnails of discovery photos (see api/thumbnails.py), served from
+# THUMBNAIL_URL. Point THUMBNAIL_URL at a CDN or absolute origin if the
+# files are served elsewhere. At most THUMBNAIL_QUEUE_SIZE thumbnails wait
+# to be written; beyond that they are skipped.
+THUMBNAIL_DIR = os.environ.get('CBSEE_THUMBNAIL_DIR', os.path.join(BASE_DIR, 'thumbnails'))
+THUMBNAIL_URL = os.environ.get('CBSEE_THUMBNAIL_URL', '/api/v1/thumbnails/')
+THUMBNAIL_QUEUE_SIZE = int(os.environ.get('CBSEE_THUMBNAIL_QUEUE_SIZE', 64))
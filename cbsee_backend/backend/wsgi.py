@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Load the model while the server boots rather than on the first /classify/
+# request. Management commands don't import this module, so they skip it.
+from django.conf import settings
+
+if settings.PRELOAD_CLASSIFIER:
+    from api.ml_inference import get_classifier
+    get_classifier()
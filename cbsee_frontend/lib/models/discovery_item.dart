@@ -1,3 +1,5 @@
+import 'package:cbsee_frontend/utils/config.dart';
+
 class DiscoveryItem {
   final int id;
   final String name;
@@ -20,6 +22,9 @@ class DiscoveryItem {
       final query = json['name'] ?? 'object';
       // Uses a placeholder avatar service based on the object name
       img = 'https://ui-avatars.com/api/?name=$query&background=random&size=200';
+    } else if (img.startsWith('/')) {
+      // Thumbnails are served by the backend under a server-relative path
+      img = Uri.parse(BaseApiUrl).resolve(img).toString();
     }
 
     return DiscoveryItem(
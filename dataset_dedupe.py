@@ -0,0 +1,139 @@
+"""
+Exact and near-duplicate detection for the image dataset.
+
+Exact copies (same bytes from another mirror) are caught by the SHA-256 the
+downloader already records. Re-encoded or resized copies are caught by a
+64-bit difference hash (dHash): two images whose hashes differ in at most
+`max_distance` bits are treated as the same picture. Hashes live in the
+dataset manifest, banded for indexed lookups, so each new image is checked
+against the whole dataset without rehashing anything.
+
+Images downloaded before hashing existed are indexed by a backfill, oldest
+first, so the earlier copy of a duplicate pair is the one kept:
+
+    python dataset_dedupe.py dataset --dry-run
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+DEFAULT_MAX_DISTANCE = 6
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash of a PIL image: brightness gradients of a 9x8 thumbnail."""
+    from PIL import Image
+
+    # draft() lets the JPEG decoder downscale while decoding, which is much
+    # faster than decoding full size and resizing.
+    image.draft('L', (hash_size * 4, hash_size * 4))
+    pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = value << 1 | (left > right)
+    return value
+
+
+def dhash_file(path):
+    """dHash of the image at `path`, or None if it can't be decoded."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            return dhash(image)
+    except Exception:
+        return None
+
+
+class Deduper:
+    """Looks up new images against the manifest's hash indexes."""
+
+    def __init__(self, manifest, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        Args:
+            manifest (DatasetManifest): Where hashes are stored and searched
+            max_distance (int): Differing dHash bits still counted as the same picture (0-7)
+        """
+        self.manifest = manifest
+        self.max_distance = max_distance
+
+    def find_duplicate(self, sha256, phash=None):
+        """Path of an image already in the dataset that this one duplicates, or None."""
+        original = self.manifest.find_by_sha256(sha256) if sha256 else None
+        if original is None and phash is not None:
+            original = self.manifest.find_similar(phash, self.max_distance)
+        return original
+
+    def backfill(self, base_dir, dry_run=False, workers=None):
+        """
+        Hashes downloaded images that have no perceptual hash yet and
+        indexes them one by one, oldest first. Each is checked against
+        everything indexed before it; duplicates are marked in the manifest
+        and their files deleted.
+
+        Returns:
+            (indexed, duplicates): counts, and a list of (path, original)
+        """
+        rows = self.manifest.unhashed()
+        if not rows:
+            return 0, []
+        base_dir = Path(base_dir)
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            hashes = pool.map(dhash_file, [base_dir / path for _, path, _ in rows], chunksize=32)
+            indexed, duplicates = 0, []
+            seen = {}  # sha256 -> path, for kept images not written to the index
+            kept = []  # (phash, path) kept during a dry run, which writes nothing
+            for (url, path, sha256), phash in zip(rows, hashes):
+                # Every unhashed row is itself 'downloaded', so exact matches
+                # only count among images indexed before this one.
+                original = seen.get(sha256) or (self.manifest.find_by_sha256(sha256, hashed_only=True)
+                                                if sha256 else None)
+                if original is None and phash is not None:
+                    original = self.manifest.find_similar(phash, self.max_distance) or next(
+                        (p for h, p in kept if (h ^ phash).bit_count() <= self.max_distance), None)
+                if original is not None:
+                    duplicates.append((path, original))
+                    if not dry_run:
+                        self.manifest.mark_duplicate(url, original)
+                        (base_dir / path).unlink(missing_ok=True)
+                    continue
+                if phash is None or dry_run:
+                    seen[sha256] = path
+                    if phash is not None:
+                        kept.append((phash, path))
+                else:
+                    self.manifest.set_phash(url, phash)
+                indexed += 1
+        return indexed, duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and remove duplicate images in the dataset")
+    parser.add_argument('dataset_dir', nargs='?', default='dataset')
+    parser.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="Differing dHash bits still counted as the same picture (0-7)")
+    parser.add_argument('--dry-run', action='store_true', help="Report duplicates without deleting anything")
+    args = parser.parse_args()
+
+    from image_dataset_creator import ImageDatasetCreator
+
+    # Opening the creator creates the manifest (importing existing files) if needed.
+    creator = ImageDatasetCreator(args.dataset_dir)
+    try:
+        deduper = Deduper(creator.manifest, args.max_distance)
+        indexed, duplicates = deduper.backfill(args.dataset_dir, dry_run=args.dry_run)
+    finally:
+        creator.close()
+
+    for path, original in duplicates:
+        print(f"  {path} duplicates {original}")
+    verb = "would be removed" if args.dry_run else "removed"
+    print(f"Indexed {indexed} images, {len(duplicates)} duplicates {verb}")
+
+
+if __name__ == "__main__":
+    main()
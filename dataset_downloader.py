@@ -0,0 +1,178 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available, then takes it."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back the next token for at least `seconds` (e.g. after a 429)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class HostRateLimiter:
+    """
+    Per-host politeness: a token bucket and a cap on simultaneous
+    connections for every host, created the first time the host is seen.
+    """
+
+    def __init__(self, rate=1.0, burst=2, max_per_host=2, overrides=None):
+        """
+        Args:
+            rate (float): Requests per second allowed to each host
+            burst (int): Requests a host may receive back to back
+            max_per_host (int): Simultaneous requests per host
+            overrides (dict): host -> rate, for hosts that allow more (or less)
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_per_host = max_per_host
+        self.overrides = overrides or {}
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                rate = self.overrides.get(host, self.rate)
+                self._hosts[host] = (TokenBucket(rate, self.burst), threading.Semaphore(self.max_per_host))
+            return self._hosts[host]
+
+    @contextmanager
+    def slot(self, url):
+        """Waits for the URL's host to accept another request."""
+        bucket, connections = self._host(urlparse(url).netloc)
+        with connections:
+            bucket.acquire()
+            yield
+
+    def pause(self, url, seconds):
+        self._host(urlparse(url).netloc)[0].pause(seconds)
+
+
+class DownloadEngine:
+    """
+    Runs HTTP downloads on a thread pool.
+
+    Each worker thread keeps one requests.Session, so connections to a host
+    are reused (keep-alive) instead of opened per image. Every request waits
+    for its host in the HostRateLimiter; failed requests are retried with
+    exponential backoff, honouring Retry-After.
+    """
+
+    def __init__(self, workers=16, limiter=None, retries=3, backoff=1.0, timeout=15, headers=None):
+        """
+        Args:
+            workers (int): Concurrent downloads
+            limiter (HostRateLimiter): Per-host limits (default: 1 request/s per host)
+            retries (int): Extra attempts for connection errors, 429 and 5xx
+            backoff (float): First retry delay in seconds, doubled each attempt
+            timeout (float): Connect/read timeout in seconds
+            headers (callable): Returns the headers for each request
+        """
+        self.limiter = limiter or HostRateLimiter()
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = headers or dict
+        self.workers = workers
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download')
+
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=self.limiter.max_per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def fetch(self, url, handle_response, finish=None):
+        """
+        GETs `url` (streamed) and returns handle_response(response), or
+        finish(handle_response(response)) if `finish` is given.
+        handle_response is called again from scratch if the transfer fails
+        and is retried. `finish` runs once the host's slot and connection are
+        released, so CPU-bound work there (decoding) doesn't hold back other
+        downloads from the host. Raises the last error once retries are used up.
+        """
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            try:
+                with self.limiter.slot(url):
+                    with self.session().get(url, headers=self.headers(), timeout=self.timeout, stream=True) as response:
+                        if response.status_code not in RETRYABLE_STATUS:
+                            response.raise_for_status()
+                            result = handle_response(response)
+                            break
+                        retry_after = _retry_after(response)
+                        error = requests.HTTPError(f"{response.status_code} for {url}", response=response)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+            if attempt == self.retries:
+                raise error
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            if retry_after is not None:
+                self.limiter.pause(url, retry_after)
+                delay = max(delay, retry_after)
+            time.sleep(delay)
+        return finish(result) if finish else result
+
+    def submit(self, url, handle_response, finish=None):
+        """Schedules fetch(url, handle_response, finish); returns a Future."""
+        return self._executor.submit(self.fetch, url, handle_response, finish)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return min(float(value), 300.0) if value else None
+    except ValueError:
+        return None
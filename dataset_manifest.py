@@ -0,0 +1,217 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Results that are final: never download these URLs again.
+FINAL_STATUSES = ('downloaded', 'rejected', 'duplicate')
+
+# Perceptual hashes are 64 bits, indexed as 8 bands of 8 bits. Two hashes
+# within Hamming distance 7 must agree exactly on at least one band, so
+# near-duplicate candidates come from indexed band lookups.
+PHASH_BANDS = 8
+PHASH_BAND_BITS = 64 // PHASH_BANDS
+
+
+def phash_bands(phash):
+    mask = (1 << PHASH_BAND_BITS) - 1
+    return [(phash >> (PHASH_BAND_BITS * i)) & mask for i in range(PHASH_BANDS)]
+
+
+def _to_sqlite(phash):
+    # SQLite integers are signed 64-bit.
+    return phash - (1 << 64) if phash is not None and phash >= 1 << 63 else phash
+
+
+def _from_sqlite(value):
+    return value + (1 << 64) if value is not None and value < 0 else value
+
+
+class DatasetManifest:
+    """
+    SQLite record of every image URL the dataset creator has tried.
+
+    One row per URL with its outcome (downloaded / failed / rejected /
+    duplicate), where it was saved, its content hash, perceptual hash, size,
+    dimensions and the search source it came from. Re-runs consult it
+    instead of re-globbing directories and re-downloading URLs that already
+    succeeded or are known to be bad.
+    """
+
+    def __init__(self, path, max_attempts=2):
+        """
+        Args:
+            path (str | Path): SQLite file
+            max_attempts (int): Transient failures allowed before a URL is skipped for good
+        """
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.created = not self.path.exists()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                object TEXT NOT NULL,
+                status TEXT NOT NULL,
+                path TEXT,
+                sha256 TEXT,
+                size INTEGER,
+                width INTEGER,
+                height INTEGER,
+                source TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )''')
+        if 'phash' not in [row[1] for row in self._db.execute('PRAGMA table_info(images)')]:
+            self._db.execute('ALTER TABLE images ADD COLUMN phash INTEGER')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS phash_bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                url TEXT NOT NULL REFERENCES images (url)
+            )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS images_object ON images (category, object, status)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS phash_bands_lookup ON phash_bands (band, value)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS phash_bands_url ON phash_bands (url)')
+        self._db.commit()
+
+    def should_skip(self, url):
+        """True if the URL was downloaded, rejected, or has failed too often."""
+        with self._lock:
+            row = self._db.execute('SELECT status, attempts FROM images WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return False
+        status, attempts = row
+        return status in FINAL_STATUSES or attempts >= self.max_attempts
+
+    def record(self, url, category, obj, status, source=None, path=None, sha256=None,
+               size=None, width=None, height=None, error=None, phash=None):
+        """Stores the outcome of one download attempt."""
+        with self._lock:
+            self._db.execute('DELETE FROM phash_bands WHERE url = ?', (url,))
+            self._db.execute('''
+                INSERT INTO images (url, category, object, status, path, sha256, size, width, height,
+                                    source, error, phash, attempts, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    category = excluded.category, object = excluded.object, status = excluded.status,
+                    path = excluded.path, sha256 = excluded.sha256, size = excluded.size,
+                    width = excluded.width, height = excluded.height,
+                    source = COALESCE(excluded.source, images.source), error = excluded.error,
+                    phash = excluded.phash, attempts = images.attempts + 1, updated_at = excluded.updated_at
+            ''', (url, category, obj, status, path, sha256, size, width, height, source, error,
+                  _to_sqlite(phash), time.time()))
+            if phash is not None and status == 'downloaded':
+                self._insert_bands(url, phash)
+            self._db.commit()
+
+    def _insert_bands(self, url, phash):
+        self._db.executemany('INSERT INTO phash_bands (band, value, url) VALUES (?, ?, ?)',
+                             [(band, value, url) for band, value in enumerate(phash_bands(phash))])
+
+    def set_phash(self, url, phash):
+        """Adds the perceptual hash of an already recorded image to the index."""
+        with self._lock:
+            self._db.execute('UPDATE images SET phash = ? WHERE url = ?', (_to_sqlite(phash), url))
+            self._db.execute('DELETE FROM phash_bands WHERE url = ?', (url,))
+            self._insert_bands(url, phash)
+            self._db.commit()
+
+    def mark_duplicate(self, url, original):
+        with self._lock:
+            self._db.execute("UPDATE images SET status = 'duplicate', error = ?, updated_at = ? WHERE url = ?",
+                             (f'duplicate of {original}', time.time(), url))
+            self._db.execute('DELETE FROM phash_bands WHERE url = ?', (url,))
+            self._db.commit()
+
+    def find_by_sha256(self, sha256, hashed_only=False):
+        """
+        Path of a downloaded image with exactly this content, if any.
+        hashed_only limits the search to images already in the phash index.
+        """
+        query = "SELECT path FROM images WHERE sha256 = ? AND status = 'downloaded'"
+        if hashed_only:
+            query += ' AND phash IS NOT NULL'
+        with self._lock:
+            row = self._db.execute(query + ' LIMIT 1', (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def find_similar(self, phash, max_distance):
+        """
+        Path of the indexed image whose perceptual hash is closest to
+        `phash`, if it is within `max_distance` bits (at most 7).
+        """
+        if not 0 <= max_distance < PHASH_BANDS:
+            raise ValueError(f"max_distance must be between 0 and {PHASH_BANDS - 1}")
+        where = ' OR '.join(['(b.band = ? AND b.value = ?)'] * PHASH_BANDS)
+        params = [x for band, value in enumerate(phash_bands(phash)) for x in (band, value)]
+        with self._lock:
+            rows = self._db.execute(f'''
+                SELECT DISTINCT i.path, i.phash FROM phash_bands b JOIN images i ON i.url = b.url
+                WHERE i.status = 'downloaded' AND ({where})''', params).fetchall()
+        best = None
+        for path, candidate in rows:
+            distance = (phash ^ _from_sqlite(candidate)).bit_count()
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, path)
+        return best[1] if best else None
+
+    def unhashed(self):
+        """(url, path, sha256) of downloaded images without a perceptual hash, oldest first."""
+        with self._lock:
+            return self._db.execute("SELECT url, path, sha256 FROM images WHERE status = 'downloaded' "
+                                    "AND phash IS NULL ORDER BY updated_at, rowid").fetchall()
+
+    def count(self, category, obj, status='downloaded'):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM images WHERE category = ? AND object = ? AND status = ?',
+                                    (category, obj, status)).fetchone()[0]
+
+    def summary(self):
+        """{(category, object): {status: count}} for every object in the manifest."""
+        with self._lock:
+            rows = self._db.execute('SELECT category, object, status, COUNT(*) FROM images '
+                                    'GROUP BY category, object, status').fetchall()
+        result = {}
+        for category, obj, status, n in rows:
+            result.setdefault((category, obj), {})[status] = n
+        return result
+
+    def import_directory(self, base_dir, objects):
+        """
+        Adds images already on disk (from runs before the manifest existed)
+        as downloaded. Their original URL is unknown, so the key is a
+        file:// URL of the relative path.
+        """
+        from PIL import Image
+
+        base_dir = Path(base_dir)
+        imported = 0
+        for category, names in objects.items():
+            for obj in names:
+                obj_dir = base_dir / category / obj.replace(" ", "_").replace("/", "_")
+                if not obj_dir.is_dir():
+                    continue
+                for file in sorted(f for f in obj_dir.iterdir() if f.is_file()):
+                    relative = file.relative_to(base_dir).as_posix()
+                    data = file.read_bytes()
+                    try:
+                        with Image.open(file) as image:
+                            width, height = image.size
+                    except Exception:
+                        width = height = None
+                    self.record(f'file://{relative}', category, obj, 'downloaded', source='existing', path=relative,
+                                sha256=hashlib.sha256(data).hexdigest(), size=len(data), width=width, height=height)
+                    imported += 1
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._db.close()
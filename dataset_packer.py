@@ -0,0 +1,260 @@
+"""
+Packs the image dataset into memory-mapped shards for training.
+
+The raw dataset is thousands of small JPEGs under dataset/<category>/<object>/,
+and a data loader over it spends most of its time opening files and decoding
+full-resolution images. The packer decodes every image once, in a process
+pool: it resizes the short side to 256 and center-crops to 256x256, the
+region ImageClassifier's Resize(256) + CenterCrop(224) reads from. The
+pixels go into fixed-size uint8 shards (shard-00000.npy, ...), with labels
+and source paths in index.json. ShardedImageDataset serves them straight
+from the memory map.
+
+    python dataset_packer.py pack dataset packed
+    python dataset_packer.py bench dataset packed --workers 4
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+IMAGE_SIZE = 256
+SHARD_SIZE = 1024  # images per shard, about 200MB at 256x256
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+# ImageNet statistics, as used by ImageClassifier.preprocess
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def list_images(dataset_dir):
+    """
+    (path, class index) for every image, and the class names. Classes are
+    the object directories ('<category>/<object>'), sorted.
+    """
+    dataset_dir = Path(dataset_dir)
+    classes = sorted(f'{category.name}/{obj.name}'
+                     for category in dataset_dir.iterdir() if category.is_dir() and not category.name.startswith('.')
+                     for obj in category.iterdir() if obj.is_dir())
+    samples = [(path, label)
+               for label, name in enumerate(classes)
+               for path in sorted((dataset_dir / name).iterdir())
+               if path.suffix.lower() in IMAGE_EXTENSIONS]
+    return samples, classes
+
+
+def load_resized(path, size=IMAGE_SIZE):
+    """
+    The image at `path` as a (size, size, 3) uint8 array: short side resized
+    to `size`, then center-cropped. None if the file can't be decoded.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            # Let the JPEG decoder downscale by a power of two while decoding
+            image.draft('RGB', (size, size))
+            image = image.convert('RGB')
+            width, height = image.size
+            scale = size / min(width, height)
+            width, height = max(size, int(width * scale)), max(size, int(height * scale))
+            image = image.resize((width, height), Image.BILINEAR)
+            left, top = int(round((width - size) / 2.0)), int(round((height - size) / 2.0))
+            return np.asarray(image.crop((left, top, left + size, top + size)), dtype=np.uint8)
+    except Exception:
+        return None
+
+
+def pack(dataset_dir, output_dir, shard_size=SHARD_SIZE, size=IMAGE_SIZE, workers=None):
+    """
+    Decodes every image in dataset_dir in a process pool and writes the
+    shards and index.json to output_dir. Returns the index.
+    """
+    samples, classes = list_images(dataset_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index = {'image_size': size, 'classes': classes, 'shards': []}
+    shard = None
+    packed = skipped = 0
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        images = pool.map(load_resized, [path for path, _ in samples], [size] * len(samples), chunksize=16)
+        for (path, label), pixels in zip(samples, images):
+            if pixels is None:
+                skipped += 1
+                continue
+            if shard is None or shard['count'] == shard_size:
+                remaining = len(samples) - packed - skipped
+                name = f"shard-{len(index['shards']):05d}.npy"
+                shard = {'file': name, 'count': 0, 'labels': [], 'paths': []}
+                array = np.lib.format.open_memmap(output_dir / name, mode='w+', dtype=np.uint8,
+                                                  shape=(min(shard_size, remaining), size, size, 3))
+                index['shards'].append(shard)
+            array[shard['count']] = pixels
+            shard['count'] += 1
+            shard['labels'].append(label)
+            shard['paths'].append(str(Path(path).relative_to(dataset_dir)))
+            packed += 1
+            if packed % 500 == 0:
+                print(f"  packed {packed}/{len(samples)} images")
+
+    if shard is not None and shard['count'] < len(array):
+        # The last shard was sized before its unreadable files were known
+        trimmed = np.array(array[:shard['count']])
+        del array
+        np.save(output_dir / shard['file'], trimmed)
+
+    # index.json is written last: shards without it are an unfinished pack
+    (output_dir / 'index.json').write_text(json.dumps(index))
+    print(f"✅ Packed {packed} images of {len(classes)} classes into {len(index['shards'])} shards"
+          + (f" ({skipped} unreadable files skipped)" if skipped else ""))
+    return index
+
+
+class ShardedImageDataset:
+    """
+    Map-style PyTorch dataset over packed shards (torch is only imported
+    when items are read, so packing needs just numpy and Pillow). Items are (image, label) with image
+    a (3, H, W) uint8 tensor that is a view into the memory-mapped shard;
+    nothing is decoded or copied until `transform` runs.
+
+    Shards are opened lazily, so each DataLoader worker maps its own.
+    """
+
+    def __init__(self, packed_dir, transform=None):
+        """
+        Args:
+            packed_dir (str | Path): Output directory of pack()
+            transform (callable): Applied to each uint8 image tensor, e.g. eval_transform()
+        """
+        self.packed_dir = Path(packed_dir)
+        index = json.loads((self.packed_dir / 'index.json').read_text())
+        self.classes = index['classes']
+        self.image_size = index['image_size']
+        self.transform = transform
+        self._files = [shard['file'] for shard in index['shards']]
+        self._offsets = np.cumsum([0] + [shard['count'] for shard in index['shards']])
+        self.targets = [label for shard in index['shards'] for label in shard['labels']]
+        self._shards = {}
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def _shard(self, n):
+        if n not in self._shards:
+            # Copy-on-write mapping: writable for torch.from_numpy without reading the file into memory
+            self._shards[n] = np.load(self.packed_dir / self._files[n], mmap_mode='c')
+        return self._shards[n]
+
+    def __getitem__(self, i):
+        import torch
+
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        n = int(np.searchsorted(self._offsets, i, side='right')) - 1
+        image = torch.from_numpy(self._shard(n)[i - self._offsets[n]]).permute(2, 0, 1)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[i]
+
+
+class RawImageDataset:
+    """
+    The unpacked tree as the packer sees it, loaded like torchvision's
+    ImageFolder (PIL, converted to RGB, then `transform`), for comparison.
+    ImageFolder itself takes the top-level directories as classes and fails
+    on the search cache directory, which holds no images.
+    """
+
+    def __init__(self, dataset_dir, transform=None):
+        self.samples, self.classes = list_images(dataset_dir)
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, i):
+        from PIL import Image
+
+        path, label = self.samples[i]
+        with Image.open(path) as image:
+            image = image.convert('RGB')
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, label
+
+
+def eval_transform(crop=224):
+    """The rest of ImageClassifier's preprocessing, for uint8 tensors from the shards."""
+    import torch
+    from torchvision import transforms
+
+    return transforms.Compose([
+        transforms.CenterCrop(crop),
+        transforms.ConvertImageDtype(torch.float32),
+        transforms.Normalize(mean=MEAN, std=STD),
+    ])
+
+
+def benchmark(dataset, batch_size, workers, max_batches=None):
+    """Images per second for one pass of a DataLoader over `dataset`."""
+    from torch.utils.data import DataLoader
+
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=workers,
+                        persistent_workers=False)
+    images = 0
+    start = time.perf_counter()
+    for n, (batch, _) in enumerate(loader):
+        images += len(batch)
+        if max_batches and n + 1 >= max_batches:
+            break
+    return images / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the image dataset into memory-mapped shards")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = commands.add_parser('pack', help="Decode, resize and write the shards")
+    pack_parser.add_argument('dataset_dir', nargs='?', default='dataset')
+    pack_parser.add_argument('output_dir', nargs='?', default='packed')
+    pack_parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help="Images per shard")
+    pack_parser.add_argument('--size', type=int, default=IMAGE_SIZE, help="Side of the stored square images")
+    pack_parser.add_argument('--workers', type=int, default=None, help="Decode processes (default: all CPUs)")
+
+    bench_parser = commands.add_parser('bench', help="Compare loading speed with the raw JPEG tree")
+    bench_parser.add_argument('dataset_dir', nargs='?', default='dataset')
+    bench_parser.add_argument('output_dir', nargs='?', default='packed')
+    bench_parser.add_argument('--batch-size', type=int, default=64)
+    bench_parser.add_argument('--workers', type=int, default=4, help="DataLoader workers")
+    bench_parser.add_argument('--max-batches', type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == 'pack':
+        start = time.perf_counter()
+        pack(args.dataset_dir, args.output_dir, args.shard_size, args.size, args.workers)
+        print(f"⏱️  {time.perf_counter() - start:.1f}s")
+        return
+
+    from torchvision import transforms
+
+    raw = RawImageDataset(args.dataset_dir, transform=transforms.Compose([
+        transforms.Resize(256),
+        transforms.CenterCrop(224),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=MEAN, std=STD),
+    ]))
+    packed = ShardedImageDataset(args.output_dir, transform=eval_transform())
+    print(f"📊 {len(raw)} raw images, {len(packed)} packed; batch {args.batch_size}, {args.workers} workers")
+    raw_rate = benchmark(raw, args.batch_size, args.workers, args.max_batches)
+    print(f"  Raw JPEGs:                {raw_rate:8.1f} images/s")
+    packed_rate = benchmark(packed, args.batch_size, args.workers, args.max_batches)
+    print(f"  ShardedImageDataset:      {packed_rate:8.1f} images/s  ({packed_rate / raw_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Checks that downloaded files really are usable images.
+
+Cheap checks run while the response streams in, so bad downloads are
+abandoned early: the magic bytes of the first chunk must be an image
+format, once the header has arrived its dimensions must meet the
+minimum resolution, and the body may not grow past MAX_IMAGE_BYTES (the
+Content-Length header can be missing or wrong). The full decode, which is CPU bound, runs afterwards in
+a process pool (verify_image).
+"""
+import json
+import threading
+import time
+
+from dataset_dedupe import dhash
+
+# Leading bytes of each format the training loader accepts.
+MAGIC_BYTES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+]
+
+# Bytes fed to the header parser before giving up on finding the dimensions
+# (JPEG headers can carry large EXIF blocks before the frame header).
+MAX_HEADER_BYTES = 512 * 1024
+
+# Largest download kept.
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+
+class InvalidImage(Exception):
+    """The download is not an image the dataset can use."""
+
+
+def sniff_format(head):
+    """Image format named by the first bytes of a file, or None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for magic, name in MAGIC_BYTES:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class StreamValidator:
+    """
+    Fed the response chunk by chunk; raises InvalidImage as soon as the
+    data can't be an image of at least min_side pixels on its shorter side,
+    or is longer than max_bytes.
+    """
+
+    def __init__(self, min_side=128, max_bytes=MAX_IMAGE_BYTES):
+        from PIL import ImageFile
+
+        self.min_side = min_side
+        self.max_bytes = max_bytes
+        self.format = None
+        self.size = None
+        self.received = 0
+        self._head = b''
+        self._parser = ImageFile.Parser()
+        self._fed = 0
+
+    def feed(self, chunk):
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise InvalidImage(f"larger than {self.max_bytes // (1024 * 1024)}MB")
+        if self.format is None:
+            self._head += chunk
+            if len(self._head) < 12:
+                return
+            self.format = sniff_format(self._head)
+            if self.format is None:
+                raise InvalidImage(f"not an image (starts with {self._head[:12]!r})")
+            chunk, self._head = self._head, b''
+        if self.size is None:
+            self._read_header(chunk)
+
+    def _read_header(self, chunk):
+        try:
+            self._parser.feed(chunk)
+        except Exception as e:
+            raise InvalidImage(f"unreadable {self.format} header: {e}")
+        self._fed += len(chunk)
+        if self._parser.image is not None:
+            self.size = self._parser.image.size
+            self._parser = None  # Stop decoding; the pool does the full check
+            if min(self.size) < self.min_side:
+                raise InvalidImage(f"{self.size[0]}x{self.size[1]} is below {self.min_side}px")
+        elif self._fed > MAX_HEADER_BYTES:
+            raise InvalidImage(f"no {self.format} header in the first {MAX_HEADER_BYTES // 1024}KB")
+
+    def finish(self):
+        """Called after the last chunk; rejects files that ended before their header."""
+        if self.format is None:
+            raise InvalidImage("not an image (too short)")
+        if self.size is None:
+            raise InvalidImage(f"truncated {self.format} header")
+
+
+def verify_image(path):
+    """
+    Fully decodes the image at `path` (truncated or corrupt data raises).
+    Meant for a process pool.
+
+    Returns:
+        (width, height, dhash)
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.load()
+            return image.width, image.height, dhash(image)
+    except Exception as e:
+        raise InvalidImage(f"decode failed: {e}") from None
+
+
+class RejectLog:
+    """Appends one JSON line per rejected URL, with the reason, for review."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, url, category, obj, reason):
+        line = json.dumps({'url': url, 'category': category, 'object': obj, 'reason': reason,
+                           'time': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
@@ -1,25 +1,50 @@
 import os
-import requests
 import time
-from urllib.parse import urlparse, urljoin, quote
+from urllib.parse import urlparse, quote
 import hashlib
 from pathlib import Path
 import json
 import re 
 from bs4 import BeautifulSoup
 import random
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+from dataset_downloader import DownloadEngine, HostRateLimiter
+from dataset_dedupe import Deduper
+from dataset_manifest import DatasetManifest
+from dataset_validation import MAX_IMAGE_BYTES, InvalidImage, RejectLog, StreamValidator, verify_image
 
 class ImageDatasetCreator:
-    def __init__(self, base_dir="dataset"):
+    def __init__(self, base_dir="dataset", workers=16, per_host_rate=1.0, max_per_host=2, search_cache_days=30,
+                 min_side=128):
         """
         Initialize the dataset creator
         
         Args:
             base_dir (str): Base directory to store the dataset
+            workers (int): Concurrent downloads
+            per_host_rate (float): Requests per second allowed to any one host
+            max_per_host (int): Simultaneous connections to any one host
+            search_cache_days (float): How long search results are reused from disk
+            min_side (int): Smallest accepted width/height in pixels; smaller images are rejected
         """
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(exist_ok=True)
         
+        # Politeness is enforced per host by the limiter, so downloads from
+        # different hosts run in parallel instead of sleeping between them.
+        self.limiter = HostRateLimiter(rate=per_host_rate, burst=2, max_per_host=max_per_host)
+        self.engine = DownloadEngine(workers=workers, limiter=self.limiter, headers=self.get_random_headers)
+        
+        # Search engines get a stricter limit: one request every 2 seconds each.
+        self.search_limiter = HostRateLimiter(rate=0.5, burst=1, max_per_host=1)
+        self.search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='search')
+        self.search_cache_dir = self.base_dir / '.search_cache'
+        self.search_cache_days = search_cache_days
+        
         # User agents to rotate for avoiding blocks
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -36,6 +61,24 @@ class ImageDatasetCreator:
             "personal": ["shoes", "toothbrush", "towel", "comb", "pencil pen"],
             "learning_educational": ["television", "key", "clock", "notebook", "radio"]
         }
+        
+        # Every URL tried and its outcome; lets re-runs resume without
+        # re-globbing directories or retrying known-bad URLs.
+        self.manifest = DatasetManifest(self.base_dir / 'manifest.sqlite3')
+        if self.manifest.created:
+            imported = self.manifest.import_directory(self.base_dir, self.objects)
+            if imported:
+                print(f"Added {imported} existing images to the dataset manifest")
+        
+        # Content and perceptual hashes catch the same picture from other
+        # mirrors or at other sizes, across the whole dataset.
+        self.deduper = Deduper(self.manifest)
+        
+        # Downloads are checked as they stream in and fully decoded in worker
+        # processes (spawned, since the download threads are already running).
+        self.min_side = min_side
+        self.verify_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        self.reject_log = RejectLog(self.base_dir / 'rejects.jsonl')
     
     def get_random_headers(self):
         """Get random headers to avoid blocking"""
@@ -49,6 +92,11 @@ class ImageDatasetCreator:
             'Upgrade-Insecure-Requests': '1',
         }
     
+    def _search_get(self, url, **kwargs):
+        """GET for the search sources: pooled session, rate limited per search engine."""
+        with self.search_limiter.slot(url):
+            return self.engine.session().get(url, **kwargs)
+    
     def search_duckduckgo_images(self, query, max_images=100):
         """
         Search for images using DuckDuckGo (no API key needed)
@@ -69,7 +117,7 @@ class ImageDatasetCreator:
             headers = self.get_random_headers()
             
             # First, get the search page
-            response = requests.get(search_url, headers=headers, timeout=10)
+            response = self._search_get(search_url, headers=headers, timeout=10)
             response.raise_for_status()
             
             # DuckDuckGo loads images via JavaScript, so we need to make a request to their API
@@ -94,7 +142,7 @@ class ImageDatasetCreator:
                 'p': '1'
             }
             
-            api_response = requests.get(api_url, headers=headers, params=params, timeout=10)
+            api_response = self._search_get(api_url, headers=headers, params=params, timeout=10)
             api_response.raise_for_status()
             
             data = api_response.json()
@@ -130,7 +178,7 @@ class ImageDatasetCreator:
             
             headers = self.get_random_headers()
             
-            response = requests.get(search_url, headers=headers, timeout=10)
+            response = self._search_get(search_url, headers=headers, timeout=10)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -177,7 +225,7 @@ class ImageDatasetCreator:
             search_url = f"https://unsplash.com/s/photos/{quote(query)}"
             headers = self.get_random_headers()
             
-            response = requests.get(search_url, headers=headers, timeout=10)
+            response = self._search_get(search_url, headers=headers, timeout=10)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -211,31 +259,79 @@ class ImageDatasetCreator:
         Returns:
             list: List of image URLs
         """
-        all_urls = []
-        
-        # Try DuckDuckGo first (most reliable)
-        print(f"Searching DuckDuckGo for: {query}")
-        ddg_urls = self.search_duckduckgo_images(query, count // 2)
-        all_urls.extend(ddg_urls)
-        
-        time.sleep(2)  # Be respectful
-        
-        # Try Unsplash for high-quality images
-        print(f"Searching Unsplash for: {query}")
-        unsplash_urls = self.search_unsplash_images(query, count // 3)
-        all_urls.extend(unsplash_urls)
+        return [url for url, source in iter(self.search_images_stream(query, count).get, None)]
+    
+    def search_images_stream(self, query, count=50):
+        """
+        Start searching all sources for `query` in the background
         
-        time.sleep(2)
+        Args:
+            query (str): Search query
+            count (int): Number of image URLs wanted
+            
+        Returns:
+            queue.Queue: Receives unique (url, source) pairs as each source
+            answers, then None once every search has finished
+        """
+        urls = queue.Queue()
+        threading.Thread(target=self._run_searches, args=(query, count, urls), daemon=True).start()
+        return urls
+    
+    def _run_searches(self, query, count, urls):
+        seen = set()
         
-        # If we don't have enough, try Google Images as fallback
-        if len(all_urls) < count:
-            print(f"Searching Google Images for: {query}")
-            google_urls = self.search_google_images_fallback(query, count - len(all_urls))
-            all_urls.extend(google_urls)
+        def emit(found, source):
+            for url in found:
+                if url not in seen and len(seen) < count:
+                    seen.add(url)
+                    urls.put((url, source))
         
-        # Remove duplicates and return
-        unique_urls = list(set(all_urls))
-        return unique_urls[:count]
+        try:
+            # DuckDuckGo and Unsplash are searched at the same time, each under
+            # its own rate limit; whichever answers first feeds the downloads.
+            searches = {
+                self.search_pool.submit(self._cached_search, 'DuckDuckGo', self.search_duckduckgo_images, query, count // 2): 'DuckDuckGo',
+                self.search_pool.submit(self._cached_search, 'Unsplash', self.search_unsplash_images, query, count // 3): 'Unsplash',
+            }
+            for future in as_completed(searches):
+                emit(future.result(), searches[future])
+            
+            # If we don't have enough, try Google Images as fallback
+            if len(seen) < count:
+                emit(self._cached_search('Google Images', self.search_google_images_fallback, query, count - len(seen)), 'Google Images')
+        except Exception as e:
+            print(f"Error searching for {query}: {e}")
+        finally:
+            urls.put(None)
+    
+    def _cached_search(self, source, search, query, max_images):
+        """
+        Run search(query, max_images), reusing results saved on disk for the
+        same source and query. Empty results (usually errors) aren't saved.
+        """
+        key = hashlib.md5(query.encode()).hexdigest()
+        path = self.search_cache_dir / f"{source.lower().replace(' ', '_')}_{key}.json"
+        try:
+            cached = json.loads(path.read_text())
+            fresh = time.time() - cached['fetched_at'] < self.search_cache_days * 86400
+            # A source that returned fewer than asked for has no more to give.
+            enough = cached['max_images'] >= max_images or len(cached['urls']) < cached['max_images']
+            if fresh and enough and cached['query'] == query:
+                print(f"Using cached {source} results for: {query}")
+                return cached['urls'][:max_images]
+        except (OSError, ValueError, KeyError):
+            pass
+        
+        print(f"Searching {source} for: {query}")
+        urls = search(query, max_images)
+        if urls:
+            self.search_cache_dir.mkdir(exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps({
+                'source': source, 'query': query, 'max_images': max_images, 'urls': urls, 'fetched_at': time.time(),
+            }))
+            os.replace(tmp_path, path)
+        return urls
     
     def download_image(self, url, filepath):
         """
@@ -249,41 +345,77 @@ class ImageDatasetCreator:
             bool: True if successful, False otherwise
         """
         try:
-            headers = self.get_random_headers()
-            
-            response = requests.get(url, headers=headers, timeout=15, stream=True)
-            response.raise_for_status()
-            
-            # Check if it's actually an image
-            content_type = response.headers.get('content-type', '')
-            if not any(img_type in content_type.lower() for img_type in ['image', 'jpeg', 'png', 'gif', 'webp']):
-                return False
-            
-            # Check file size (skip if too small or too large)
-            content_length = response.headers.get('content-length')
-            if content_length:
-                size = int(content_length)
-                if size < 1024 or size > 10 * 1024 * 1024:  # 1KB to 10MB
-                    return False
-            
-            # Write image data
+            return self.engine.fetch(url, lambda response: self._save_image(response, filepath),
+                                     self._verify_saved)['status'] == 'downloaded'
+        except Exception as e:
+            print(f"Error downloading {url}: {str(e)[:100]}...")
+            if filepath.exists():
+                filepath.unlink()  # Clean up partial download
+            return False
+    
+    def _save_image(self, response, filepath):
+        """
+        Checks a streamed response and writes it to filepath. The full
+        decode is left to _verify_saved, which runs after the connection
+        is handed back.
+        
+        Returns:
+            dict: 'status' ('downloaded' or 'rejected') plus the manifest
+            fields for the saved file, or 'error' for a rejection
+        """
+        # Check if it's actually an image
+        content_type = response.headers.get('content-type', '')
+        if not any(img_type in content_type.lower() for img_type in ['image', 'jpeg', 'png', 'gif', 'webp']):
+            return {'status': 'rejected', 'error': f'content type {content_type or "missing"}'}
+        
+        # Check file size (skip if too small or too large)
+        content_length = response.headers.get('content-length')
+        if content_length:
+            size = int(content_length)
+            if size < 1024 or size > MAX_IMAGE_BYTES:  # 1KB to 10MB
+                return {'status': 'rejected', 'error': f'content length {size}'}
+        
+        # Write image data, hashing it on the way. The validator stops the
+        # transfer as soon as the bytes aren't an image or it's too small.
+        digest = hashlib.sha256()
+        validator = StreamValidator(self.min_side)
+        try:
             with open(filepath, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
+                    validator.feed(chunk)
+                    digest.update(chunk)
                     f.write(chunk)
+            validator.finish()
             
             # Verify file was created and has content
-            if filepath.exists() and filepath.stat().st_size > 1024:  # At least 1KB
-                return True
-            else:
-                if filepath.exists():
-                    filepath.unlink()  # Remove empty file
-                return False
-                
-        except Exception as e:
-            print(f"Error downloading {url}: {str(e)[:100]}...")
+            if filepath.stat().st_size <= 1024:  # At least 1KB
+                raise InvalidImage('smaller than 1KB')
+        except InvalidImage as e:
             if filepath.exists():
-                filepath.unlink()  # Clean up partial download
-            return False
+                filepath.unlink()
+            return {'status': 'rejected', 'error': str(e)[:200]}
+        return {'status': 'downloaded', 'path': filepath.relative_to(self.base_dir).as_posix(),
+                'sha256': digest.hexdigest(), 'size': filepath.stat().st_size}
+    
+    def _verify_saved(self, result):
+        """Fully decodes a file _save_image wrote, which catches truncated and corrupt files."""
+        if result['status'] != 'downloaded':
+            return result
+        filepath = self.base_dir / result['path']
+        try:
+            width, height, phash = self.verify_pool.submit(verify_image, filepath).result()
+        except InvalidImage as e:
+            if filepath.exists():
+                filepath.unlink()
+            return {'status': 'rejected', 'error': str(e)[:200]}
+        return {**result, 'width': width, 'height': height, 'phash': phash}
+    
+    def _failure_status(self, error):
+        """'rejected' for errors retrying won't fix (404, 403, ...), else 'failed'."""
+        response = getattr(error, 'response', None)
+        if response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
+            return 'rejected'
+        return 'failed'
     
     def get_file_extension(self, url):
         """
@@ -352,7 +484,7 @@ class ImageDatasetCreator:
             obj_dir.mkdir(exist_ok=True)
             
             # Check how many images we already have
-            existing_images = len(list(obj_dir.glob("*")))
+            existing_images = self.manifest.count(category, obj)
             if existing_images >= images_per_object:
                 print(f"Already have {existing_images} images for {obj}, skipping...")
                 continue
@@ -360,41 +492,80 @@ class ImageDatasetCreator:
             needed = images_per_object - existing_images
             print(f"Need {needed} more images (have {existing_images})")
             
-            # Search for images
-            image_urls = self.search_images(obj, count=needed * 3)  # Get extra in case some fail
-            
-            if not image_urls:
-                print(f"No images found for {obj}")
-                continue
+            # Search for images; downloads start as soon as the first source answers
+            image_urls = self.search_images_stream(obj, count=needed * 3)  # Get extra in case some fail
             
-            # Download images
+            # Download images concurrently, keeping only as many in flight as
+            # are still needed so we don't fetch far more than requested.
             downloaded = 0
             failed = 0
-            
-            for j, url in enumerate(image_urls):
-                if downloaded >= needed:
-                    break
+            duplicates = 0
+            found = 0
+            pending = {}
+            search_done = False
+            
+            while True:
+                while not search_done and len(pending) < min(self.engine.workers, needed - downloaded):
+                    try:
+                        # Only block for the search when there's nothing else to wait on.
+                        url = image_urls.get(block=not pending)
+                    except queue.Empty:
+                        break
+                    if url is None:
+                        search_done = True
+                        break
+                    url, source = url
+                    found += 1
+                    
+                    # Skip URLs already downloaded, known to be bad, or failing repeatedly
+                    if self.manifest.should_skip(url):
+                        continue
+                    
+                    filepath = self.create_unique_filename(obj_clean, url, obj_dir)
+                    pending[self.engine.submit(url, lambda response, path=filepath: self._save_image(response, path),
+                                               self._verify_saved)] = (url, source, filepath)
                 
-                filepath = self.create_unique_filename(obj_clean, url, obj_dir)
-                
-                # Skip if file already exists
-                if filepath.exists():
+                if not pending:
+                    if search_done or downloaded >= needed:
+                        break
                     continue
                 
-                print(f"  Downloading {j+1}/{len(image_urls)}: {url[:60]}...")
-                
-                if self.download_image(url, filepath):
-                    downloaded += 1
-                    if downloaded % 5 == 0:
-                        print(f"  ✓ Downloaded {downloaded}/{needed} images")
-                else:
-                    failed += 1
-                
-                # Be respectful with requests
-                time.sleep(random.uniform(1, 3))
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, source, filepath = pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        result = future.result()
+                    else:
+                        print(f"  Error downloading {url[:60]}: {str(error)[:100]}")
+                        result = {'status': self._failure_status(error), 'error': str(error)[:200]}
+                    if result['status'] == 'downloaded':
+                        original = self.deduper.find_duplicate(result['sha256'], result['phash'])
+                        if original is not None:
+                            result = {'status': 'duplicate', 'sha256': result['sha256'],
+                                      'phash': result['phash'], 'error': f'duplicate of {original}'}
+                    self.manifest.record(url, category, obj, source=source, **result)
+                    if result['status'] == 'rejected':
+                        self.reject_log.write(url, category, obj, result['error'])
+                    
+                    if result['status'] == 'downloaded':
+                        downloaded += 1
+                        if downloaded % 5 == 0:
+                            print(f"  ✓ Downloaded {downloaded}/{needed} images")
+                    else:
+                        if filepath.exists():
+                            filepath.unlink()  # Clean up partial download or duplicate
+                        if result['status'] == 'duplicate':
+                            duplicates += 1
+                        else:
+                            failed += 1
+            
+            if not found:
+                print(f"No images found for {obj}")
+                continue
             
             total_images = existing_images + downloaded
-            print(f"\n✓ Completed {obj}: {total_images} total images ({downloaded} new, {failed} failed)")
+            print(f"\n✓ Completed {obj}: {total_images} total images ({downloaded} new, {duplicates} duplicates, {failed} failed)")
     
     def create_dataset(self, images_per_object=50):
         """
@@ -412,6 +583,12 @@ class ImageDatasetCreator:
         
         start_time = time.time()
         
+        # Index images from before perceptual hashing so new downloads are
+        # checked against them too; only unhashed images are processed.
+        indexed, removed = self.deduper.backfill(self.base_dir)
+        if indexed or removed:
+            print(f"Indexed {indexed} existing images, removed {len(removed)} duplicates")
+        
         for category, objects in self.objects.items():
             try:
                 self.download_category_images(category, objects, images_per_object)
@@ -421,10 +598,6 @@ class ImageDatasetCreator:
             except Exception as e:
                 print(f"\n❌ Error processing category {category}: {e}")
                 continue
-            
-            # Longer pause between categories
-            print(f"\nPausing before next category...")
-            time.sleep(5)
         
         end_time = time.time()
         print(f"\n{'='*60}")
@@ -433,6 +606,13 @@ class ImageDatasetCreator:
         # Print summary
         self.print_dataset_summary()
     
+    def close(self):
+        """Waits for running searches and downloads and closes the pooled connections."""
+        self.search_pool.shutdown(wait=True)
+        self.engine.close()
+        self.verify_pool.shutdown(wait=True)
+        self.manifest.close()
+    
     def print_dataset_summary(self):
         """Print a summary of the created dataset"""
         print(f"\n{'='*60}")
@@ -440,25 +620,23 @@ class ImageDatasetCreator:
         print("="*60)
         
         total_images = 0
+        counts = self.manifest.summary()
         
         for category, objects in self.objects.items():
-            category_dir = self.base_dir / category
-            if not category_dir.exists():
+            if not any((category, obj) in counts for obj in objects):
                 continue
             
             print(f"\n📁 {category.upper().replace('_', ' ')}:")
             category_total = 0
             
             for obj in objects:
-                obj_clean = obj.replace(" ", "_").replace("/", "_")
-                obj_dir = category_dir / obj_clean
-                
-                if obj_dir.exists():
-                    count = len([f for f in obj_dir.glob("*") if f.is_file()])
-                    print(f"  • {obj}: {count} images")
-                    category_total += count
-                else:
-                    print(f"  • {obj}: 0 images")
+                statuses = counts.get((category, obj), {})
+                count = statuses.get('downloaded', 0)
+                skipped = statuses.get('rejected', 0) + statuses.get('failed', 0)
+                dupes = statuses.get('duplicate', 0)
+                notes = ([f"{skipped} URLs rejected or failed"] if skipped else []) + ([f"{dupes} duplicates"] if dupes else [])
+                print(f"  • {obj}: {count} images" + (f" ({', '.join(notes)})" if notes else ""))
+                category_total += count
             
             print(f"  Subtotal: {category_total} images")
             total_images += category_total
@@ -497,7 +675,10 @@ def main():
     
     # Create dataset
     creator = ImageDatasetCreator()
-    creator.create_dataset(images_per_object)
+    try:
+        creator.create_dataset(images_per_object)
+    finally:
+        creator.close()
     
     print("\n✅ Dataset creation finished!")
     print("📚 You can now use this dataset to train your vision model.")
@@ -0,0 +1,166 @@
+"""
+Local stand-in for image hosts, for testing the downloader offline.
+
+Serves generated JPEGs at /img/<n>.jpg and records when each request
+arrived, per Host header. Several servers on different ports stand in for
+several hosts, so per-host rate limits can be checked:
+
+    python local_image_server.py --images 300 --hosts 3 --rate 5
+
+starts the servers, downloads every image through DownloadEngine and prints
+throughput and the highest request rate each host saw.
+"""
+import argparse
+import io
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from dataset_downloader import DownloadEngine, HostRateLimiter
+
+
+class StandInStats:
+    """Arrival times and peak concurrency per host."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arrivals = defaultdict(list)
+        self.active = defaultdict(int)
+        self.peak_active = defaultdict(int)
+
+    def started(self, host):
+        with self.lock:
+            self.arrivals[host].append(time.monotonic())
+            self.active[host] += 1
+            self.peak_active[host] = max(self.peak_active[host], self.active[host])
+
+    def finished(self, host):
+        with self.lock:
+            self.active[host] -= 1
+
+    def peak_rate(self, host, window=1.0):
+        """Most requests `host` received within any `window` seconds."""
+        times = sorted(self.arrivals[host])
+        best = start = 0
+        for end, t in enumerate(times):
+            while t - times[start] >= window:
+                start += 1
+            best = max(best, end - start + 1)
+        return best / window
+
+
+def make_jpeg(seed, size=(320, 240)):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def make_handler(stats, latency=0.0, error_rate=0.0):
+    images = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+
+        def do_GET(self):
+            host = self.headers.get('Host', '')
+            stats.started(host)
+            try:
+                if latency:
+                    time.sleep(latency)
+                if error_rate and random.random() < error_rate:
+                    self._send(503, b'busy', 'text/plain', {'Retry-After': '0'})
+                elif self.path.startswith('/img/'):
+                    n = int(self.path.split('/')[-1].split('.')[0])
+                    if n not in images:
+                        images[n] = make_jpeg(n)
+                    self._send(200, images[n], 'image/jpeg')
+                else:
+                    self._send(404, b'not found', 'text/plain')
+            finally:
+                stats.finished(host)
+
+        def _send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients drop the connection when they abort a download early.
+        pass
+
+
+def serve(port=0, latency=0.0, error_rate=0.0, stats=None):
+    """Starts a stand-in host on a background thread. Returns (server, stats)."""
+    stats = stats or StandInStats()
+    server = StandInServer(('127.0.0.1', port), make_handler(stats, latency, error_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the concurrent downloader against a local stand-in host")
+    parser.add_argument('--images', type=int, default=300)
+    parser.add_argument('--hosts', type=int, default=3, help="Stand-in hosts to spread images over")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=5.0, help="Requests per second allowed per host")
+    parser.add_argument('--max-per-host', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help="Server delay per request, seconds")
+    parser.add_argument('--error-rate', type=float, default=0.05, help="Fraction of requests answered 503")
+    args = parser.parse_args()
+
+    stats = StandInStats()
+    servers = [serve(latency=args.latency, error_rate=args.error_rate, stats=stats)[0] for _ in range(max(1, args.hosts))]
+    hosts = [f'127.0.0.1:{server.server_address[1]}' for server in servers]
+    urls = [f'http://{hosts[n % len(hosts)]}/img/{n}.jpg' for n in range(args.images)]
+
+    out_dir = Path(tempfile.mkdtemp(prefix='stand-in-'))
+    limiter = HostRateLimiter(rate=args.rate, burst=1, max_per_host=args.max_per_host)
+    engine = DownloadEngine(workers=args.workers, limiter=limiter, backoff=0.1)
+
+    def save(n):
+        def handle(response):
+            (out_dir / f'{n}.jpg').write_bytes(response.content)
+            return True
+        return handle
+
+    start = time.monotonic()
+    futures = [engine.submit(url, save(n)) for n, url in enumerate(urls)]
+    failed = sum(1 for future in futures if future.exception() is not None)
+    elapsed = time.monotonic() - start
+    engine.close()
+    for server in servers:
+        server.shutdown()
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    print(f"Downloaded {len(urls) - failed}/{len(urls)} images in {elapsed:.1f}s "
+          f"({(len(urls) - failed) / elapsed:.1f} images/s, {args.workers} workers)")
+    print(f"{'host':<22}{'requests':>10}{'peak req/s':>12}{'limit':>8}{'peak conns':>12}")
+    for host in hosts:
+        print(f"{host:<22}{len(stats.arrivals[host]):>10}{stats.peak_rate(host):>12.1f}"
+              f"{args.rate:>8.1f}{stats.peak_active[host]:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,276 @@
-# convert_model.py
+# model_optimizer.py
+"""
+Exports a trained classifier checkpoint in every deployable format and
+reports how the variants compare on this machine.
+
+The architecture (MobileNetV3 large or small) and number of classes are
+read from the state dict, so the export always matches the weights. One
+run writes:
+
+    model.pt             TorchScript (traced)
+    model.ptl            TorchScript optimized for the mobile lite interpreter
+    model_quantized.pt   TorchScript with dynamically quantized (int8) Linear layers
+    model.onnx           ONNX (needs `pip install onnx`; checked if onnxruntime is installed)
+    report.md            size, CPU latency and output parity of each variant vs the original
+
+    python model_optimizer.py --checkpoint cbsee_backend/models/mobile_model.pth --output-dir exported
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
 import torch
 import torch.nn as nn
 from torchvision import models
-import argparse
-import os
 
-def convert_model_to_lite(checkpoint_path, num_classes, save_name):
+# Width of the first classifier layer's input identifies the MobileNetV3 variant.
+ARCHITECTURES = {
+    960: 'mobilenet_v3_large',
+    576: 'mobilenet_v3_small',
+}
+
+# Largest logit difference accepted for float32 variants.
+FLOAT_TOLERANCE = 1e-3
+
+
+def detect_architecture(state_dict):
+    """Returns (architecture name, number of classes) for a MobileNetV3 state dict."""
+    try:
+        in_features = state_dict['classifier.0.weight'].shape[1]
+        num_classes = state_dict['classifier.3.weight'].shape[0]
+    except KeyError:
+        raise ValueError("Not a MobileNetV3 classifier state dict (no classifier.0/classifier.3 weights)")
+    if in_features not in ARCHITECTURES:
+        raise ValueError(f"Unknown MobileNetV3 variant: classifier input width {in_features}")
+    return ARCHITECTURES[in_features], num_classes
+
+
+def load_model(checkpoint_path, num_classes=None):
+    """Rebuilds the model the checkpoint was trained as and loads its weights."""
+    state_dict = torch.load(checkpoint_path, map_location=torch.device('cpu'), weights_only=True)
+    architecture, detected_classes = detect_architecture(state_dict)
+    if num_classes is not None and num_classes != detected_classes:
+        raise ValueError(f"Checkpoint has {detected_classes} classes, not {num_classes}")
+    print(f"🧠 Detected {architecture} with {detected_classes} classes")
+
+    model = getattr(models, architecture)(weights=None)
+    model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, detected_classes)
+    model.load_state_dict(state_dict)
+    model.eval()
+    return model, architecture, detected_classes
+
+
+def example_inputs(images_dir=None, count=16, seed=0):
     """
-    Loads a model state_dict, and converts it to a TorchScript Lite model.
+    A batch for parity checks: real images through ImageClassifier's
+    preprocessing if `images_dir` is given, otherwise seeded random inputs.
     """
-    # --- 1. Load Model Architecture ---
-    print("🧠 Loading pre-trained MobileNetV3 model structure...")
-    # We must recreate the same model structure as during training
-    model = models.mobilenet_v3_small(pretrained=False) # Not pre-trained, we'll load our own weights
-
-    # Get the number of input features for the classifier
-    num_ftrs = model.classifier[-1].in_features
-
-    # Replace the final layer to match the number of classes in our trained model
-    model.classifier[-1] = nn.Linear(num_ftrs, num_classes)
-    print(f"✅ Model structure created for {num_classes} classes.")
-
-    # --- 2. Load Trained Weights ---
-    print(f"💾 Loading trained weights from '{checkpoint_path}'...")
-    # Load the state dictionary
-    state_dict = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-    model.load_state_dict(state_dict)
-    print("✅ Weights loaded successfully.")
+    if images_dir:
+        from PIL import Image
+        from torchvision import transforms
 
-    # --- 3. Convert to TorchScript ---
-    print("🔧 Converting model to TorchScript...")
-    # Set the model to evaluation mode. This is crucial for consistent results.
-    model.eval()
+        preprocess = transforms.Compose([
+            transforms.Resize(256),
+            transforms.CenterCrop(224),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ])
+        paths = sorted(p for p in Path(images_dir).rglob('*')
+                       if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp', '.bmp'))[:count]
+        if paths:
+            return torch.stack([preprocess(Image.open(p).convert('RGB')) for p in paths])
+        print(f"⚠️  No images found in {images_dir}, using random inputs")
+    generator = torch.Generator().manual_seed(seed)
+    return torch.randn(count, 3, 224, 224, generator=generator)
 
-    # Create a dummy input tensor with the correct shape (batch_size, channels, height, width)
-    # This is what the model expects from our Flutter app later.
-    example_input = torch.rand(1, 3, 224, 224)
 
-    # Trace the model. This records the operations executed on the dummy input.
-    traced_script_module = torch.jit.trace(model, example_input)
-    print("✅ Model traced.")
+def export_variants(model, output_dir):
+    """
+    Writes every variant. Returns {name: (path, runnable or None, note)};
+    a variant whose export failed has no path and the error as its note.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    example = torch.rand(1, 3, 224, 224)
+    variants = {}
 
-    # --- 4. Optimize and Save for Mobile (Lite Interpreter) ---
-    print("⚡ Optimizing for mobile and saving as .ptl file...")
-    from torch.utils.mobile_optimizer import optimize_for_mobile
-    optimized_traced_module = optimize_for_mobile(traced_script_module)
+    def export(name, filename, step):
+        path = output_dir / filename
+        try:
+            run, note = step(path)
+        except Exception as e:
+            print(f"⚠️  {name} export failed: {str(e).splitlines()[0]}")
+            variants[name] = (None, None, f"export failed: {str(e).splitlines()[0][:120]}")
+        else:
+            variants[name] = (path, run, note)
 
-    # Save the optimized model
-    optimized_traced_module._save_for_lite_interpreter(save_name)
-    print(f"🎉 Success! Model saved to '{save_name}'")
+    print("🔧 Tracing TorchScript...")
+    traced = torch.jit.trace(model, example)
 
+    def torchscript(path):
+        traced.save(str(path))
+        return torch.jit.load(str(path)), ''
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="Convert PyTorch model to TorchScript Lite format.")
+    def lite(path):
+        from torch.jit.mobile import _load_for_lite_interpreter
+        from torch.utils.mobile_optimizer import optimize_for_mobile
+
+        try:
+            module, note = optimize_for_mobile(traced), ''
+        except RuntimeError as e:
+            # optimize_for_mobile needs a torch build with XNNPACK
+            print(f"⚠️  Mobile optimization unavailable, saving the lite build unoptimized: {str(e).splitlines()[0][:120]}")
+            module, note = traced, 'not mobile-optimized (torch built without XNNPACK)'
+        module._save_for_lite_interpreter(str(path))
+        return _load_for_lite_interpreter(str(path)), note
+
+    def quantized(path):
+        # Dynamic quantization covers Linear layers only; the convolutions stay float32.
+        module = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        torch.jit.trace(module, example).save(str(path))
+        return torch.jit.load(str(path)), 'int8 Linear layers, float32 convolutions'
+
+    def onnx(path):
+        # The TorchScript-based exporter needs only the onnx package, not onnxscript.
+        torch.onnx.export(model, (example,), str(path), dynamo=False, input_names=['input'],
+                          output_names=['logits'], dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}})
+        run = _onnx_runner(path)
+        return run, '' if run else 'not run (onnxruntime not installed)'
+
+    export('torchscript', 'model.pt', torchscript)
+    print("⚡ Saving for the mobile lite interpreter...")
+    export('lite', 'model.ptl', lite)
+    print("🗜️  Quantizing Linear layers (dynamic int8)...")
+    export('quantized', 'model_quantized.pt', quantized)
+    print("📦 Exporting ONNX...")
+    export('onnx', 'model.onnx', onnx)
+    return variants
+
+
+def _onnx_runner(path):
+    """Callable running the ONNX model with onnxruntime, or None if it isn't installed."""
+    try:
+        import onnxruntime
+    except ImportError:
+        return None
+    session = onnxruntime.InferenceSession(str(path), providers=['CPUExecutionProvider'])
+    return lambda batch: torch.from_numpy(session.run(None, {'input': batch.numpy()})[0])
+
+
+def measure_latency(run, runs=30, warmup=5):
+    """Median and p90 milliseconds of one batch-of-1 inference."""
+    example = torch.rand(1, 3, 224, 224)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            run(example)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.9) - 1]
+
+
+def check_parity(run, reference, inputs):
+    """Largest logit difference and top-1 agreement against the original model's outputs."""
+    with torch.no_grad():
+        outputs = torch.cat([run(inputs[i:i + 1]) for i in range(len(inputs))])
+    return ((outputs - reference).abs().max().item(),
+            (outputs.argmax(1) == reference.argmax(1)).float().mean().item())
+
+
+def build_report(checkpoint_path, model, variants, inputs, min_agreement):
+    """Benchmarks the original and each variant; returns a list of row dicts."""
+    with torch.no_grad():
+        reference = model(inputs)
+    rows = [{'variant': 'eager (checkpoint)', 'file': Path(checkpoint_path).name,
+             'size_mb': os.path.getsize(checkpoint_path) / 1e6, 'latency': measure_latency(model),
+             'max_diff': 0.0, 'agreement': 1.0, 'ok': True, 'note': ''}]
+    for name, (path, run, note) in variants.items():
+        row = {'variant': name, 'file': path.name if path else None,
+               'size_mb': os.path.getsize(path) / 1e6 if path else None,
+               'latency': None, 'max_diff': None, 'agreement': None, 'ok': None, 'note': note}
+        if run is not None:
+            row['latency'] = measure_latency(run)
+            row['max_diff'], row['agreement'] = check_parity(run, reference, inputs)
+            if name == 'quantized':
+                row['ok'] = row['agreement'] >= min_agreement
+            else:
+                row['ok'] = row['max_diff'] <= FLOAT_TOLERANCE
+        rows.append(row)
+    return rows
+
+
+def format_report(rows, architecture, num_classes, inputs, min_agreement):
+    baseline = rows[0]['latency'][0]
+    lines = [
+        f"# Export report: {architecture}, {num_classes} classes",
+        "",
+        f"CPU: {torch.get_num_threads()} threads, torch {torch.__version__}. Latency is batch 1, "
+        f"224x224. Parity is over {len(inputs)} inputs: float32 variants must stay within "
+        f"{FLOAT_TOLERANCE:g} of the original logits, quantized must agree on top-1 for "
+        f"at least {min_agreement:.0%}.",
+        "",
+        "| variant | file | size (MB) | p50 ms | p90 ms | speedup | max logit diff | top-1 agreement | parity | notes |",
+        "|---|---|---:|---:|---:|---:|---:|---:|---|---|",
+    ]
+    for row in rows:
+        size = "n/a" if row['size_mb'] is None else f"{row['size_mb']:.2f}"
+        if row['latency'] is None:
+            timing = "| n/a | n/a | n/a "
+        else:
+            p50, p90 = row['latency']
+            timing = f"| {p50:.1f} | {p90:.1f} | {baseline / p50:.2f}x "
+        parity = ("| n/a | n/a | not checked " if row['ok'] is None else
+                  f"| {row['max_diff']:.2e} | {row['agreement']:.1%} | {'✅' if row['ok'] else '❌'} ")
+        lines.append(f"| {row['variant']} | {row['file'] or '-'} | {size} " + timing + parity + f"| {row['note']} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a trained classifier to TorchScript, lite, quantized and ONNX formats.")
     parser.add_argument("--checkpoint", type=str, required=True,
                         help="Path to the trained model .pth state_dict file.")
-    parser.add_argument("--num-classes", type=int, required=True,
-                        help="Number of output classes for your model.")
-    parser.add_argument("--output-name", type=str, default="mobile_image_classifier.ptl",
-                        help="Name for the output .ptl file.")
-
+    parser.add_argument("--num-classes", type=int, default=None,
+                        help="Expected number of classes (checked against the checkpoint).")
+    parser.add_argument("--output-dir", type=str, default="exported",
+                        help="Directory for the exported models and report.md.")
+    parser.add_argument("--images", type=str, default=None,
+                        help="Folder of sample images for the parity check (default: random inputs).")
+    parser.add_argument("--samples", type=int, default=16,
+                        help="Number of inputs for the parity check.")
+    parser.add_argument("--min-agreement", type=float, default=0.95,
+                        help="Top-1 agreement the quantized model must reach.")
     args = parser.parse_args()
 
     if not os.path.exists(args.checkpoint):
         print(f"❌ Error: Checkpoint file not found at '{args.checkpoint}'")
-    else:
-        convert_model_to_lite(args.checkpoint, args.num_classes, args.output_name)
\ No newline at end of file
+        raise SystemExit(1)
+
+    try:
+        model, architecture, num_classes = load_model(args.checkpoint, args.num_classes)
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        raise SystemExit(1)
+    output_dir = Path(args.output_dir)
+    variants = export_variants(model, output_dir)
+
+    print("⏱️  Benchmarking and checking parity...")
+    inputs = example_inputs(args.images, args.samples)
+    rows = build_report(args.checkpoint, model, variants, inputs, args.min_agreement)
+    report = format_report(rows, architecture, num_classes, inputs, args.min_agreement)
+    (output_dir / 'report.md').write_text(report)
+    (output_dir / 'report.json').write_text(json.dumps(
+        {'architecture': architecture, 'num_classes': num_classes, 'variants': rows}, indent=2))
+    print("\n" + report)
+    print(f"🎉 Exports and report written to '{output_dir}'")
+
+    if any(row['ok'] is False for row in rows):
+        print("❌ Some variants failed the parity check")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""
+Offline tests for the dataset pipeline; the downloader runs against
+local_image_server stand-in hosts. Run from the repository root:
+
+    python -m unittest discover tests
+"""
+import contextlib
+import io
+import random
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from dataset_dedupe import Deduper, dhash, dhash_file
+from dataset_downloader import DownloadEngine, HostRateLimiter, TokenBucket
+from dataset_manifest import DatasetManifest, phash_bands
+from dataset_packer import RawImageDataset, ShardedImageDataset, eval_transform, pack
+from dataset_validation import InvalidImage, StreamValidator, verify_image
+from local_image_server import make_jpeg, serve
+
+
+def picture(seed, size=(320, 240)):
+    """A PIL image with enough structure for distinct dHashes (random rectangles)."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + rng.randrange(40, 160), y + rng.randrange(40, 120)),
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def jpeg_bytes(image, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', **options)
+    return buffer.getvalue()
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_rate_after_the_burst(self):
+        bucket = TokenBucket(rate=20, burst=2)
+        start = time.monotonic()
+        for _ in range(12):
+            bucket.acquire()
+        # Two tokens at once, then one every 50ms.
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+
+    def test_pause_holds_back_the_next_token(self):
+        bucket = TokenBucket(rate=100, burst=1)
+        bucket.pause(0.2)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+
+class StandInHostMixin:
+    def serve(self, **kwargs):
+        """Starts a local_image_server stand-in host for this test. Returns ('127.0.0.1:port', stats)."""
+        server, stats = serve(**kwargs)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'127.0.0.1:{server.server_address[1]}', stats
+
+
+class DownloadEngineTests(StandInHostMixin, unittest.TestCase):
+    def test_connections_per_host_are_capped(self):
+        host, stats = self.serve(latency=0.1)
+        engine = DownloadEngine(workers=8, limiter=HostRateLimiter(rate=1000, burst=8, max_per_host=2))
+        try:
+            futures = [engine.submit(f'http://{host}/img/{n}.jpg', lambda response: len(response.content))
+                       for n in range(8)]
+            self.assertTrue(all(future.result() > 0 for future in futures))
+        finally:
+            engine.close()
+        self.assertEqual(len(stats.arrivals[host]), 8)
+        self.assertEqual(stats.peak_active[host], 2)
+
+    def test_host_slot_is_released_before_finish(self):
+        host, _ = self.serve()
+        limiter = HostRateLimiter(rate=1000, burst=4, max_per_host=1)
+        engine = DownloadEngine(workers=2, limiter=limiter)
+        connections = limiter._host(host)[1]
+        slot_free = []
+
+        def finish(size):
+            # Stands in for the CPU-bound decode.
+            slot_free.append(connections.acquire(blocking=False))
+            if slot_free[-1]:
+                connections.release()
+            return size
+
+        try:
+            self.assertGreater(engine.fetch(f'http://{host}/img/1.jpg', lambda response: len(response.content),
+                                            finish), 0)
+        finally:
+            engine.close()
+        self.assertEqual(slot_free, [True])
+
+
+class ManifestTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'manifest.sqlite3'
+
+    def open(self):
+        manifest = DatasetManifest(self.path, max_attempts=2)
+        self.addCleanup(manifest.close)
+        return manifest
+
+    def test_resume_skips_finished_urls(self):
+        manifest = self.open()
+        self.assertTrue(manifest.created)
+        manifest.record('http://a/1.jpg', 'kitchen', 'cup', 'downloaded', path='kitchen/cup/1.jpg', sha256='ab')
+        manifest.record('http://a/2.jpg', 'kitchen', 'cup', 'rejected', error='content type text/html')
+        manifest.record('http://a/3.jpg', 'kitchen', 'cup', 'failed', error='timeout')
+        manifest.close()
+
+        resumed = self.open()
+        self.assertFalse(resumed.created)
+        self.assertTrue(resumed.should_skip('http://a/1.jpg'))
+        self.assertTrue(resumed.should_skip('http://a/2.jpg'))
+        # One transient failure is retried, a second one is final.
+        self.assertFalse(resumed.should_skip('http://a/3.jpg'))
+        resumed.record('http://a/3.jpg', 'kitchen', 'cup', 'failed', error='timeout')
+        self.assertTrue(resumed.should_skip('http://a/3.jpg'))
+        self.assertFalse(resumed.should_skip('http://a/4.jpg'))
+        self.assertEqual(resumed.count('kitchen', 'cup'), 1)
+        self.assertEqual(resumed.summary(), {('kitchen', 'cup'): {'downloaded': 1, 'rejected': 1, 'failed': 1}})
+
+    def test_existing_files_are_imported_as_downloaded(self):
+        obj_dir = self.path.parent / 'kitchen' / 'cup_mug'
+        obj_dir.mkdir(parents=True)
+        (obj_dir / 'cup_1.jpg').write_bytes(make_jpeg(1))
+        manifest = self.open()
+        self.assertEqual(manifest.import_directory(self.path.parent, {'kitchen': ['cup mug']}), 1)
+        self.assertTrue(manifest.should_skip('file://kitchen/cup_mug/cup_1.jpg'))
+        self.assertEqual(manifest.count('kitchen', 'cup mug'), 1)
+
+
+class DedupeTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.base_dir = Path(directory.name)
+        self.manifest = DatasetManifest(self.base_dir / 'manifest.sqlite3')
+        self.addCleanup(self.manifest.close)
+
+    def save(self, name, data):
+        (self.base_dir / name).write_bytes(data)
+        return name
+
+    def test_resized_copy_is_found_through_the_band_index(self):
+        original = picture(1)
+        phash = dhash(original.copy())
+        copy = dhash(original.resize((160, 120)))
+        self.assertLessEqual((phash ^ copy).bit_count(), 6)
+        self.manifest.record('http://a/1.jpg', 'kitchen', 'cup', 'downloaded', path='1.jpg', sha256='a', phash=phash)
+        deduper = Deduper(self.manifest)
+        self.assertEqual(deduper.find_duplicate('b', copy), '1.jpg')
+        self.assertIsNone(deduper.find_duplicate('c', dhash(picture(2))))
+        self.assertEqual(deduper.find_duplicate('a'), '1.jpg')
+
+    def test_only_hashes_within_max_distance_match(self):
+        phash = 0xF0F0_F0F0_F0F0_F0F0  # top bit set: stored as a negative SQLite integer
+        self.manifest.record('http://a/1.jpg', 'kitchen', 'cup', 'downloaded', path='1.jpg', phash=phash)
+        # 8 bits off, one per band: no band agrees and the distance is too large.
+        spread = phash ^ sum(1 << (8 * band) for band in range(8))
+        self.assertTrue(all(a != b for a, b in zip(phash_bands(phash), phash_bands(spread))))
+        self.assertIsNone(self.manifest.find_similar(spread, 7))
+        # 7 bits off in one band: the other bands still agree.
+        near = phash ^ 0x7F
+        self.assertEqual(self.manifest.find_similar(near, 7), '1.jpg')
+        self.assertIsNone(self.manifest.find_similar(near, 6))
+
+    def test_backfill_keeps_the_older_copy(self):
+        original = picture(3)
+        files = [self.save('old.jpg', jpeg_bytes(original, quality=90)),
+                 self.save('other.jpg', jpeg_bytes(picture(4), quality=90)),
+                 self.save('new.jpg', jpeg_bytes(original.resize((240, 180)), quality=60))]
+        for n, name in enumerate(files):
+            self.manifest.record(f'http://a/{name}', 'kitchen', 'cup', 'downloaded', path=name, sha256=str(n))
+        indexed, duplicates = Deduper(self.manifest).backfill(self.base_dir, workers=1)
+        self.assertEqual((indexed, duplicates), (2, [('new.jpg', 'old.jpg')]))
+        self.assertFalse((self.base_dir / 'new.jpg').exists())
+        self.assertEqual(self.manifest.summary()[('kitchen', 'cup')], {'downloaded': 2, 'duplicate': 1})
+        self.assertEqual(self.manifest.unhashed(), [])
+        self.assertIsNotNone(dhash_file(self.base_dir / 'old.jpg'))
+
+
+class StreamValidatorTests(unittest.TestCase):
+    def feed(self, data, chunk_size=4096, **options):
+        validator = StreamValidator(**options)
+        for start in range(0, len(data), chunk_size):
+            validator.feed(data[start:start + chunk_size])
+        validator.finish()
+        return validator
+
+    def test_image_passes_in_small_chunks(self):
+        validator = self.feed(jpeg_bytes(picture(1)), chunk_size=7)
+        self.assertEqual((validator.format, validator.size), ('jpeg', (320, 240)))
+
+    def test_bad_magic_bytes_are_rejected_on_the_first_chunk(self):
+        validator = StreamValidator()
+        with self.assertRaisesRegex(InvalidImage, 'not an image'):
+            validator.feed(b'<!DOCTYPE html><html>')
+        with self.assertRaisesRegex(InvalidImage, 'too short'):
+            self.feed(b'\xff\xd8')
+
+    def test_small_images_are_rejected(self):
+        with self.assertRaisesRegex(InvalidImage, 'below 128px'):
+            self.feed(jpeg_bytes(picture(1, size=(200, 100))))
+
+    def test_oversized_body_is_rejected_without_reading_it_all(self):
+        data = jpeg_bytes(picture(1), quality=95)
+        validator = StreamValidator(max_bytes=len(data) - 1)
+        with self.assertRaisesRegex(InvalidImage, 'larger than'):
+            for start in range(0, len(data), 1024):
+                validator.feed(data[start:start + 1024])
+        self.assertLess(validator.received, len(data) + 1024)
+
+    def test_header_must_arrive_early(self):
+        data = jpeg_bytes(picture(1), comment=b'x' * 4000)
+        with mock.patch('dataset_validation.MAX_HEADER_BYTES', 1024), \
+                self.assertRaisesRegex(InvalidImage, 'no jpeg header'):
+            self.feed(data, chunk_size=512)
+
+    def test_truncated_file_fails_the_full_decode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'cut.jpg'
+            data = jpeg_bytes(picture(1))
+            path.write_bytes(data[:len(data) // 2])
+            self.feed(path.read_bytes())  # The header is intact
+            with self.assertRaisesRegex(InvalidImage, 'decode failed'):
+                verify_image(path)
+            path.write_bytes(data)
+            self.assertEqual(verify_image(path)[:2], (320, 240))
+
+
+class CreatorDownloadTests(StandInHostMixin, unittest.TestCase):
+    def test_download_is_streamed_checked_and_decoded(self):
+        from image_dataset_creator import ImageDatasetCreator
+
+        host, _ = self.serve()
+        with tempfile.TemporaryDirectory() as directory:
+            creator = ImageDatasetCreator(directory, workers=2, per_host_rate=1000)
+            try:
+                path = Path(directory) / 'cup.jpg'
+                self.assertTrue(creator.download_image(f'http://{host}/img/1.jpg', path))
+                self.assertEqual(verify_image(path)[:2], (320, 240))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertFalse(creator.download_image(f'http://{host}/missing', Path(directory) / 'x.jpg'))
+            finally:
+                creator.close()
+
+
+class PackerTests(unittest.TestCase):
+    def setUp(self):
+        from PIL import Image
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dataset = Path(directory.name) / 'dataset'
+        self.packed = Path(directory.name) / 'packed'
+        # 3 + 4 images, each one flat grey level, and one unreadable file per object.
+        self.levels = {}
+        for obj, count in (('kitchen/cup', 3), ('personal/comb', 4)):
+            (self.dataset / obj).mkdir(parents=True)
+            for n in range(count):
+                level = 20 * len(self.levels) + 10
+                Image.new('RGB', (48, 40), (level,) * 3).save(self.dataset / obj / f'{n}.png')
+                self.levels[f'{obj}/{n}.png'] = level
+            (self.dataset / obj / 'broken.jpg').write_bytes(b'not an image')
+        (self.dataset / '.search_cache').mkdir()
+        (self.dataset / 'search_cache').mkdir()
+        (self.dataset / 'search_cache' / 'query.json').write_text('{}')
+
+    def test_last_shard_is_trimmed_and_indexing_crosses_shards(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            index = pack(self.dataset, self.packed, shard_size=3, size=32, workers=1)
+        self.assertEqual(index['classes'], ['kitchen/cup', 'personal/comb'])
+        self.assertEqual([shard['count'] for shard in index['shards']], [3, 3, 1])
+        self.assertEqual([np.load(self.packed / shard['file']).shape[0] for shard in index['shards']], [3, 3, 1])
+
+        dataset = ShardedImageDataset(self.packed)
+        self.assertEqual(len(dataset), 7)
+        paths = [path for shard in index['shards'] for path in shard['paths']]
+        for i in (0, 2, 3, 5, 6):
+            image, label = dataset[i]
+            self.assertEqual(tuple(image.shape), (3, 32, 32))
+            self.assertEqual(int(image[0, 16, 16]), self.levels[paths[i]])
+            self.assertEqual(label, 0 if paths[i].startswith('kitchen') else 1)
+        with self.assertRaises(IndexError):
+            dataset[7]
+        self.assertEqual(tuple(ShardedImageDataset(self.packed, eval_transform(crop=24))[6][0].shape), (3, 24, 24))
+
+    def test_raw_dataset_sees_the_same_classes(self):
+        raw = RawImageDataset(self.dataset)
+        self.assertEqual(raw.classes, ['kitchen/cup', 'personal/comb'])
+        # Unreadable files are listed; the packer is what drops them.
+        self.assertEqual(len(raw), 9)
+        image, label = raw[6]
+        self.assertEqual((image.size, label), ((48, 40), 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
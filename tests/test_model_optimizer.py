@@ -0,0 +1,48 @@
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torchvision import models
+
+from model_optimizer import detect_architecture, load_model
+
+
+def state_dict(architecture, num_classes):
+    model = getattr(models, architecture)(weights=None)
+    model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+    return model.state_dict()
+
+
+class DetectArchitectureTests(unittest.TestCase):
+    def test_both_widths(self):
+        self.assertEqual(detect_architecture(state_dict('mobilenet_v3_small', 20)), ('mobilenet_v3_small', 20))
+        self.assertEqual(detect_architecture(state_dict('mobilenet_v3_large', 7)), ('mobilenet_v3_large', 7))
+
+    def test_bad_state_dicts(self):
+        with self.assertRaisesRegex(ValueError, 'Not a MobileNetV3'):
+            detect_architecture(models.resnet18(weights=None).state_dict())
+        weights = state_dict('mobilenet_v3_small', 20)
+        weights['classifier.0.weight'] = torch.zeros(1024, 512)
+        with self.assertRaisesRegex(ValueError, 'input width 512'):
+            detect_architecture(weights)
+
+    def test_checkpoint_is_rebuilt_as_trained(self):
+        weights = state_dict('mobilenet_v3_small', 5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'model.pth'
+            torch.save(weights, path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                model, architecture, num_classes = load_model(path)
+                with self.assertRaisesRegex(ValueError, 'has 5 classes, not 20'):
+                    load_model(path, num_classes=20)
+        self.assertEqual((architecture, num_classes), ('mobilenet_v3_small', 5))
+        self.assertFalse(model.training)
+        self.assertTrue(torch.equal(model.state_dict()['classifier.3.weight'], weights['classifier.3.weight']))
+
+
+if __name__ == '__main__':
+    unittest.main()